@@ -3,6 +3,14 @@ configfile: "annotation.json"
 identified_ids = config["excel_file_no_ext"].split()
 inputs = []
 
+# the exported tables get the original headers of the hashed proteome (export_tables/annotate -s and -r)
+header_files = {}
+header_options = ""
+if config["export_tables"]["original_headers"]:
+    header_files = {"header_tsv": "{sample}/proteome/metaproteome.hashed.tsv",
+                    "header_index": "{sample}/proteome/metaproteome.hashed.tsv.idx"}
+    header_options = "-s %s -r %s" % (header_files["header_tsv"], header_files["header_index"])
+
 include:
     "rules/subset_sequences.smk"
 inputs.append("checkpoints/subset_sequences.done")
@@ -20,6 +28,10 @@ if config["functions"]["run_functions_uniprot"]:
     include:
         "rules/functions_uniprot.smk"
     inputs.append("checkpoints/functions_uniprot.done")
+if config["export_tables"]["combined"]:
+    include:
+        "rules/export_tables.smk"
+    inputs.append("checkpoints/export_tables.done")
 
 rule ALL:
     input:
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+
+"""
+Measure the throughput of the COG join of functions_cog.
+
+Synthetic COG tables and a synthetic diamond table (protein groups as qseqid, gi subject IDs) are written into a
+temporary directory. `parse_functions_cog.join_tables` is timed against the former implementation, which split the
+functional classes with a list comprehension over `df.values.tolist()`, and both results are compared.
+
+Usage: helper_scripts/benchmark_cog_join.py [-n rows] [-c cogs] [-g gi_numbers] [--skip_reference]
+"""
+
+import argparse
+import numpy as np
+import os
+import pandas as pd
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mptk import parse_functions_cog  # noqa: E402
+
+FUNCTIONAL_CLASSES = "JAKLBDYVTMNZWUOXCGEFHIPQRS"
+
+
+def write_test_data(tmp_dir, rows, cogs, gi_numbers, seed=1):
+    """
+    Write synthetic COG tables and a diamond table.
+
+    Parameters
+    ----------
+      tmp_dir: output directory
+      rows: number of diamond hits
+      cogs: number of COGs
+      gi_numbers: number of distinct gi numbers (subject IDs)
+      seed: seed of the random generator (default: 1)
+
+    Returns
+    -------
+      diamond_df: the diamond data frame (qseqid and sseqid)
+      cog_table: path of the COG csv table
+      cog_names: path of the COG names table
+
+    """
+    rng = np.random.default_rng(seed)
+
+    cog_ids = np.array(["COG%04d" % i for i in range(cogs)])
+    # about a quarter of the COGs have more than one functional class
+    n_letters = rng.choice([1, 1, 1, 2, 3], size=cogs)
+    # sorted letters, so that no class reads as a missing value (like "NA") in the reference
+    classes = ["".join(sorted(rng.choice(list(FUNCTIONAL_CLASSES), size=n, replace=False))) for n in n_letters]
+    cog_names = os.path.join(tmp_dir, "cognames.tab")
+    pd.DataFrame({"COG_id": cog_ids, "functional_class": classes, "COG_annotation": "annotation"}).to_csv(
+        cog_names, sep="\t", header=False, index=False)
+
+    gi = np.arange(100000, 100000 + gi_numbers)
+    cog_table = os.path.join(tmp_dir, "cog.csv")
+    pd.DataFrame({"domain_id": gi, "genome_name": "genome", "protein_id": gi, "protein_length": 300,
+                  "domain_start": 1, "domain_end": 300, "COG_id": cog_ids[rng.integers(0, cogs, size=gi_numbers)],
+                  "membership_class": 0}).to_csv(cog_table, header=False, index=False)
+
+    hits = rng.integers(0, gi_numbers, size=rows)
+    sseqids = np.array(["gi|%d|ref|WP_%09d.1|" % (g, g) for g in gi])[hits]
+    diamond_df = pd.DataFrame({"qseqid": np.sort(rng.integers(1, max(rows // 20, 2), size=rows)).astype(np.float32),
+                               "sseqid": pd.Categorical(sseqids)})
+
+    return diamond_df, cog_table, cog_names
+
+
+def join_tables_reference(df, cog_table, cog_names):
+    """
+    The former implementation of `parse_functions_cog.join_tables`.
+    """
+    column_names_cog_table = ["domain_id", "genome_name", "protein_id", "protein_length", "domain_start", "domain_end",
+                              "COG_id", "membership_class"]
+    cog_table_df = pd.read_csv(cog_table, sep=",", header=None, names=column_names_cog_table, index_col=False)
+    cog_table_df = cog_table_df[["domain_id", "COG_id"]]
+
+    column_names_cog_names = ["COG_id", "functional_class", "COG_annotation"]
+    cog_names_df = pd.read_csv(cog_names, sep="\t", header=None, names=column_names_cog_names, comment="#",
+                               encoding="latin1")
+    cog_names_df = cog_names_df[["COG_id", "functional_class"]]
+
+    df.sseqid = df.sseqid.str.extract(r"^gi\|(.+)\|ref\|", expand=True)
+    df.sseqid = df.sseqid.astype(np.int64)
+    df = df[["qseqid", "sseqid"]]
+    df = df.merge(cog_table_df, how="left", left_on="sseqid", right_on="domain_id").drop(columns="domain_id")
+    df = df.merge(cog_names_df, how="left", on="COG_id")
+
+    df = pd.DataFrame([(*x[0:-1], y) for x in df.values.tolist() for y in list(x[-1])], columns=df.columns)
+
+    return df
+
+
+def time_join(join_function, diamond_df, cog_table, cog_names):
+    start = time.perf_counter()
+    df = join_function(diamond_df.copy(), cog_table=cog_table, cog_names=cog_names)
+    return df, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="measure the throughput of the COG join of functions_cog")
+    parser.add_argument("-n", "--rows", action="store", dest="rows", type=int, default=2000000,
+                        help="number of diamond hits (default: 2000000)")
+    parser.add_argument("-c", "--cogs", action="store", dest="cogs", type=int, default=5000,
+                        help="number of COGs (default: 5000)")
+    parser.add_argument("-g", "--gi_numbers", action="store", dest="gi_numbers", type=int, default=500000,
+                        help="number of distinct subject IDs (default: 500000)")
+    parser.add_argument("--skip_reference", action="store_true", dest="skip_reference", default=False,
+                        help="do not run the former implementation")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        diamond_df, cog_table, cog_names = write_test_data(tmp_dir, rows=args.rows, cogs=args.cogs,
+                                                           gi_numbers=args.gi_numbers)
+        df, elapsed = time_join(parse_functions_cog.join_tables, diamond_df, cog_table, cog_names)
+        print("%-12s %8.2f s %12.0f rows/s (%d output rows)" % ("vectorized", elapsed, args.rows / elapsed, len(df)))
+
+        if not args.skip_reference:
+            df_reference, elapsed = time_join(join_tables_reference, diamond_df, cog_table, cog_names)
+            print("%-12s %8.2f s %12.0f rows/s (%d output rows)" % ("reference", elapsed, args.rows / elapsed,
+                                                                   len(df_reference)))
+            equal = df.astype(str).reset_index(drop=True).equals(df_reference.astype(str))
+            print("results are %s" % ("identical" if equal else "DIFFERENT"))
+            sys.exit(0 if equal else 1)
+
+
+if __name__ == "__main__":
+    main()
+
+# mPies (metaProteomics in environmental sciences) creates annotated databases for metaproteomics analysis.
+# Copyright 2018 Johannes Werner (Leibniz-Institute for Baltic Sea Research)
+# Copyright 2018 Augustin Geron (University of Mons, University of Stirling)
+# Copyright 2018 Sabine Matallana Surget (University of Stirling)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+"""
+Measure the startup time of each main.py subcommand.
+
+For every subcommand, the modules imported in its branch of main.py are collected and imported in a fresh interpreter
+(together with main.py itself). The best wall-clock time of several runs is reported. With `--max_seconds`, the script
+exits with status 1 if a subcommand starts slower than the limit, so it can be used to catch import regressions.
+
+Usage: helper_scripts/benchmark_startup.py [-r repeats] [-m max_seconds] [subcommand ...]
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_subcommand_imports(main_file):
+    """
+    Collect the mptk modules that each subcommand imports in main.py.
+
+    Parameters
+    ----------
+      main_file: path of main.py
+
+    Returns
+    -------
+      subcommand_imports: dict with subcommands as keys and lists of module names as values
+
+    """
+    with open(main_file) as main_file_open:
+        source = main_file_open.read()
+
+    subcommand_imports = {}
+    for mode, modules in re.findall(r'^\s+(?:el)?if args\.mode == "(\w+)":\n\s+from mptk import ([\w, ]+)$', source,
+                                    flags=re.MULTILINE):
+        subcommand_imports[mode] = [module.strip() for module in modules.split(",")]
+
+    return subcommand_imports
+
+
+def time_imports(modules, repeats):
+    """
+    Import main.py and the modules in a fresh interpreter and return the best wall-clock time.
+
+    Parameters
+    ----------
+      modules: list of mptk module names
+      repeats: number of runs
+
+    Returns
+    -------
+      the best time in seconds (None if the import failed)
+
+    """
+    code = "import main\n" + "".join("import mptk.%s\n" % module for module in modules)
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-c", code], cwd=REPO_DIR, stdout=subprocess.DEVNULL,
+                                stderr=subprocess.PIPE)
+        elapsed = time.perf_counter() - start
+        if result.returncode != 0:
+            sys.stderr.write(result.stderr.decode("utf-8", "replace").strip().splitlines()[-1] + "\n")
+            return None
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="measure the startup time of each main.py subcommand")
+    parser.add_argument("subcommands", nargs="*", help="subcommands to measure (default: all)")
+    parser.add_argument("-r", "--repeats", action="store", dest="repeats", type=int, default=5,
+                        help="number of runs per subcommand (default: 5)")
+    parser.add_argument("-m", "--max_seconds", action="store", dest="max_seconds", type=float, default=None,
+                        help="fail if a subcommand starts slower than this")
+    args = parser.parse_args()
+
+    subcommand_imports = get_subcommand_imports(os.path.join(REPO_DIR, "main.py"))
+    subcommands = args.subcommands or sorted(subcommand_imports)
+
+    baseline = time_imports([], args.repeats)
+    print("%-25s %8.3f s" % ("(main.py only)", baseline))
+
+    failed = False
+    for subcommand in subcommands:
+        elapsed = time_imports(subcommand_imports[subcommand], args.repeats)
+        if elapsed is None:
+            print("%-25s   failed" % subcommand)
+            failed = True
+            continue
+        slow = args.max_seconds is not None and elapsed > args.max_seconds
+        failed = failed or slow
+        print("%-25s %8.3f s%s" % (subcommand, elapsed, "  (slower than %.3f s)" % args.max_seconds if slow else ""))
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
+
+# mPies (metaProteomics in environmental sciences) creates annotated databases for metaproteomics analysis.
+# Copyright 2018 Johannes Werner (Leibniz-Institute for Baltic Sea Research)
+# Copyright 2018 Augustin Geron (University of Mons, University of Stirling)
+# Copyright 2018 Sabine Matallana Surget (University of Stirling)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
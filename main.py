@@ -7,8 +7,11 @@ import logging
 import logging.config
 import os
 import sys
-from mptk import general_functions, hash_headers, parse_singlem, use_amplicon, use_functional_subset, \
-  subset_sequences, parse_taxonomy, parse_functions_cog, parse_functions_uniprot
+
+from mptk.hash_types import HASH_TYPES
+
+# the mptk modules are imported in the branch of each subcommand, so that a subcommand only loads what it uses (e.g.
+# pandas or the NCBI taxonomy database); helper_scripts/benchmark_startup.py measures the startup time per subcommand
 
 
 def configure_logger(name, log_file, level="DEBUG"):
@@ -72,27 +75,75 @@ def main():
     subparsers = parser.add_subparsers(dest="mode",help="select the run mode")
     subparser_prepareuniprot = subparsers.add_parser("prepare_uniprot_files",
                                                      help="build a accession-GO-table based on UniProt dat file")
+    subparser_preparecog = subparsers.add_parser("prepare_cog_files",
+                                                 help="build a binary index of the COG tables for functions_cog")
+    subparser_preparego = subparsers.add_parser("prepare_go_files",
+                                                help="build the GO ancestor closure for functions_uniprot")
+    subparser_prepareacc2taxid = subparsers.add_parser("prepare_acc2taxid",
+                                                       help="build a sorted accession2taxid index for taxonomy_lca")
     # subparser_singlem = subparsers.add_parser("parse_singlem", help="build genus list from singlem OTU table")
     subparser_amplicon = subparsers.add_parser("amplicon",
                                                help="use genus list (amplicons) or singlem (metagenome reads)")
     subparser_functionsubset = subparsers.add_parser("function_subset",
                                                      help="use gene, protein and taxonomy name subset")
+    subparser_proteome_cache = subparsers.add_parser("proteome_cache",
+                                                     help="show, prune or clear the proteome cache of amplicon")
     subparser_hashing = subparsers.add_parser("hashing", help="hash fasta headers")
+    subparser_postprocessing = subparsers.add_parser("postprocessing",
+                                                     help="combine proteomes, remove short sequences and duplicates "
+                                                          "and hash fasta headers in one pass")
     subparser_subset_sequences = subparsers.add_parser("subset_sequences",
                                                        help="subsets sequences (only keeps identified proteins)")
+    subparser_subset_sequences_batch = subparsers.add_parser("subset_sequences_batch",
+                                                             help="subsets sequences for several ProteinPilot results "
+                                                                  "in one pass")
     subparser_protein_groups = subparsers.add_parser("protein_groups", help="use protein groups")
     subparser_taxonomy = subparsers.add_parser("taxonomy", help="parse taxonomy results")
+    subparser_taxonomy_lca = subparsers.add_parser("taxonomy_lca",
+                                                   help="assign the taxonomy by the lowest common ancestor of the "
+                                                        "diamond hits (instead of blast2lca and taxonomy)")
     subparser_functions_cog = subparsers.add_parser("functions_cog", help="parse diamond results against COG database")
     subparser_functions_uniprot = subparsers.add_parser("functions_uniprot",
                                                         help="parse diamond results against Uniprot database")
     subparser_export_tables = subparsers.add_parser("export_tables", help="export annotated tables")
+    subparser_annotate = subparsers.add_parser("annotate",
+                                               help="map protein groups, annotate them and export the table in one go")
+    subparser_lookup_headers = subparsers.add_parser("lookup_headers",
+                                                     help="add original headers to a table with hashed headers")
 
     subparser_prepareuniprot.add_argument("-u", "--uniprot_file", action="store", dest="uniprot_file", default=None,
                                           required=True, help="zipped uniprot dat file")
     subparser_prepareuniprot.add_argument("-t", "--uniprot_table", action="store", dest="uniprot_table", default=None,
-                                          required=True, help="uniprot output table (accession - GO annotation)")
+                                          required=False, help="uniprot output table (accession - GO annotation)")
     subparser_prepareuniprot.add_argument("-g", "--go_annotation", action="store_true", dest="go_annotation",
                                           default=False, help="uniprot output table (with protein names)")
+    subparser_prepareuniprot.add_argument("-o", "--go_table", action="store", dest="go_table", default=None,
+                                          required=False, help="uniprot output table with GO annotations")
+    subparser_prepareuniprot.add_argument("-p", "--protein_name_table", action="store", dest="protein_name_table",
+                                          default=None, required=False, help="uniprot output table with protein names")
+    subparser_prepareuniprot.add_argument("-n", "--threads", action="store", dest="threads", type=int, default=1,
+                                          required=False, help="number of parser processes (default: 1)")
+    subparser_prepareuniprot.add_argument("-s", "--store", action="store_true", dest="store", default=False,
+                                          help="write sorted block-compressed stores instead of gzipped tables")
+
+    subparser_preparecog.add_argument("-t", "--cog_table", action="store", dest="cog_table", required=True,
+                                      help="COG csv table")
+    subparser_preparecog.add_argument("-n", "--cog_names", action="store", dest="cog_names", required=True,
+                                      help="COG names table")
+    subparser_preparecog.add_argument("-f", "--cog_functions", action="store", dest="cog_functions", required=True,
+                                      help="COG functions table")
+    subparser_preparecog.add_argument("-i", "--cog_index", action="store", dest="cog_index", required=True,
+                                      help="output COG index")
+
+    subparser_preparego.add_argument("-o", "--obo_file", action="store", dest="obo_file", required=True,
+                                     help="GO ontology file (e.g. go-basic.obo)")
+    subparser_preparego.add_argument("-c", "--go_closure", action="store", dest="go_closure", required=True,
+                                     help="output GO closure")
+
+    subparser_prepareacc2taxid.add_argument("-a", "--acc2taxid", action="store", dest="acc2taxid", required=True,
+                                            help="accession2taxid table (e.g. prot.accession2taxid.gz)")
+    subparser_prepareacc2taxid.add_argument("-i", "--acc2taxid_index", action="store", dest="acc2taxid_index",
+                                            required=True, help="output accession2taxid index")
 
     # subparser_singlem.add_argument("-n", "--names_dmp", action="store", dest="names_dmp", default=None,required=False,
     #                                help="location of names.dmp")
@@ -115,6 +166,33 @@ def main():
                                     help="use unreviewed TrEMBL hits (default) or only reviewed SwissProt")
     subparser_amplicon.add_argument("-t", "--taxonomy", action="store_true", dest="taxonomy", required=False,
                                     help="add taxonomic lineage to fasta header")
+    subparser_amplicon.add_argument("-d", "--cache_dir", action="store", dest="cache_dir", required=False,
+                                    default=None, help="cache the proteome of each taxon in this directory and only "
+                                                       "download missing taxa")
+    subparser_amplicon.add_argument("-e", "--release", action="store", dest="release", required=False, default=None,
+                                    help="UniProt release of the cache entries (default: ask the UniProt service)")
+    subparser_amplicon.add_argument("-l", "--cache_limit", action="store", dest="cache_limit", type=float,
+                                    required=False, default=None,
+                                    help="maximum size of the cache in MiB (least recently used taxa are removed)")
+    subparser_amplicon.add_argument("-x", "--nodes_dmp", action="store", dest="nodes_dmp", default=None,
+                                    required=False, help="location of nodes.dmp (resolve the lineages with nodes.dmp "
+                                                         "instead of NCBITaxa)")
+    subparser_amplicon.add_argument("-u", "--url", action="store", dest="url", required=False, default=None,
+                                    help="URL of the UniProt service (default: legacy.uniprot.org)")
+    subparser_amplicon.add_argument("-c", "--connections", action="store", dest="connections", type=int, required=False,
+                                    default=4, help="maximum number of concurrent downloads (default: 4)")
+    subparser_amplicon.add_argument("-s", "--shard_size", action="store", dest="shard_size", type=int, required=False,
+                                    default=50, help="maximum number of taxa per download (default: 50)")
+
+    subparser_proteome_cache.add_argument("-d", "--cache_dir", action="store", dest="cache_dir", required=True,
+                                          help="proteome cache directory")
+    subparser_proteome_cache.add_argument("-a", "--action", choices=["show", "prune", "clear"], dest="action",
+                                          default="show", help="show the cache (default), remove the least recently "
+                                                               "used taxa or all taxa")
+    subparser_proteome_cache.add_argument("-l", "--cache_limit", action="store", dest="cache_limit", type=float,
+                                          required=False, default=None, help="maximum size of the cache in MiB (prune)")
+    subparser_proteome_cache.add_argument("-e", "--release", action="store", dest="release", required=False,
+                                          default=None, help="remove the taxa of other UniProt releases (prune)")
 
     subparser_functionsubset.add_argument("-t", "--toml_file", action="store", dest="toml_file", required=True,
                                           help="toml file with taxonomy, gene and protein names")
@@ -122,6 +200,14 @@ def main():
                                           help="use unreviewed TrEMBL hits (default) or only reviewed SwissProt")
     subparser_functionsubset.add_argument("-p", "--proteome_file", action="store", dest="proteome_file", required=True,
                                     help="proteome file")
+    subparser_functionsubset.add_argument("-u", "--url", action="store", dest="url", required=False, default=None,
+                                          help="URL of the UniProt service (default: legacy.uniprot.org)")
+    subparser_functionsubset.add_argument("-c", "--connections", action="store", dest="connections", type=int,
+                                          required=False, default=4,
+                                          help="maximum number of concurrent downloads (default: 4)")
+    subparser_functionsubset.add_argument("-s", "--shard_size", action="store", dest="shard_size", type=int,
+                                          required=False, default=50,
+                                          help="maximum number of taxa per download (default: 50)")
 
     subparser_hashing.add_argument("-p", "--proteome_file", action="store", dest="proteome_file", required=True,
                                    help="proteome input file")
@@ -129,8 +215,41 @@ def main():
                                    help="proteome output file with hashed headers")
     subparser_hashing.add_argument("-t", "--tsv_file", action="store", dest="tsv_file", required=True,
                                    help="proteome output file with hashed headers")
-    subparser_hashing.add_argument("-x", "--hash_type", choices=["md5", "sha1"], dest="hash_type", default="md5",
-                                   help="hash algorithm to use")
+    subparser_hashing.add_argument("-x", "--hash_type", choices=HASH_TYPES, dest="hash_type",
+                                   default="md5", help="hash algorithm to use")
+    subparser_hashing.add_argument("-m", "--hash_mode", choices=["chained", "independent"], dest="hash_mode",
+                                   default="chained", help="chained digests (default) or an independent digest per "
+                                                           "header (can be computed in parallel)")
+    subparser_hashing.add_argument("-b", "--digest_size", action="store", dest="digest_size", type=int,
+                                   required=False, default=None, help="digest size in bytes (blake2b and blake2s)")
+    subparser_hashing.add_argument("-n", "--threads", action="store", dest="threads", type=int, required=False,
+                                   default=1, help="number of processes for independent hashing (default: 1)")
+    subparser_hashing.add_argument("-i", "--index_file", action="store", dest="index_file", required=False,
+                                   default=None, help="byte-offset index of the proteome output file")
+    subparser_hashing.add_argument("-r", "--header_index", action="store", dest="header_index", required=False,
+                                   default=None, help="index of the tsv file (hashed header to original header)")
+
+    subparser_postprocessing.add_argument("-p", "--proteome_files", action="store", dest="proteome_files", nargs="+",
+                                          required=True, help="proteome input files")
+    subparser_postprocessing.add_argument("-l", "--min_length", action="store", dest="min_length", type=int,
+                                          required=False, default=30, help="minimum sequence length (default: 30)")
+    subparser_postprocessing.add_argument("-s", "--hashed_proteome_file", action="store", dest="hashed_file",
+                                          required=True, help="proteome output file with hashed headers")
+    subparser_postprocessing.add_argument("-t", "--tsv_file", action="store", dest="tsv_file", required=True,
+                                          help="tsv file with hashed and original headers")
+    subparser_postprocessing.add_argument("-x", "--hash_type", choices=HASH_TYPES, dest="hash_type",
+                                          default="md5", help="hash algorithm to use")
+    subparser_postprocessing.add_argument("-m", "--hash_mode", choices=["chained", "independent"], dest="hash_mode",
+                                          default="chained", help="chained digests (default) or an independent digest "
+                                                                  "per header")
+    subparser_postprocessing.add_argument("-b", "--digest_size", action="store", dest="digest_size", type=int,
+                                          required=False, default=None,
+                                          help="digest size in bytes (blake2b and blake2s)")
+    subparser_postprocessing.add_argument("-i", "--index_file", action="store", dest="index_file", required=False,
+                                          default=None, help="byte-offset index of the proteome output file")
+    subparser_postprocessing.add_argument("-r", "--header_index", action="store", dest="header_index",
+                                          required=False, default=None,
+                                          help="index of the tsv file (hashed header to original header)")
 
     subparser_subset_sequences.add_argument("-e", "--excel_file", action="store", dest="excel_file", required=True,
                                             help="ProteinPilot results file")
@@ -138,6 +257,19 @@ def main():
                                             required=True, help="metaproteomics database file from part I")
     subparser_subset_sequences.add_argument("-s", "--database_subset", action="store", dest="database_subset",
                                             required=True, help="subsetted metaproteomics database")
+    subparser_subset_sequences.add_argument("-i", "--index_file", action="store", dest="index_file", required=False,
+                                            default=None, help="byte-offset index of the metaproteomics database")
+
+    subparser_subset_sequences_batch.add_argument("-e", "--excel_files", action="store", dest="excel_files",
+                                                  nargs="+", required=True, help="ProteinPilot results files")
+    subparser_subset_sequences_batch.add_argument("-d", "--database_file", action="store", dest="database_file",
+                                                  required=True, help="metaproteomics database file from part I")
+    subparser_subset_sequences_batch.add_argument("-s", "--database_subsets", action="store", dest="database_subsets",
+                                                  nargs="+", required=True,
+                                                  help="subsetted metaproteomics databases (same order as excel files)")
+    subparser_subset_sequences_batch.add_argument("-i", "--index_file", action="store", dest="index_file",
+                                                  required=False, default=None,
+                                                  help="byte-offset index of the metaproteomics database")
 
     subparser_protein_groups.add_argument("-d", "--diamond_file", action="store", dest="diamond_file", required=True,
                                           help="diamond output file")
@@ -151,33 +283,117 @@ def main():
                                    help="megan results file")
     subparser_taxonomy.add_argument("-t", "--output_table", action="store", dest="taxonomy_table", required=True,
                                    help="output table with parsed taxonomy")
+    subparser_taxonomy.add_argument("-c", "--score_cutoff", action="store", dest="score_cutoff", type=float,
+                                   required=False, default=0,
+                                   help="minimum score (percentage of the hits) to report a taxonomic rank "
+                                        "(default: 0)")
+
+    subparser_taxonomy_lca.add_argument("-d", "--diamond_file", action="store", dest="diamond_file", required=True,
+                                        help="diamond results file with protein groups")
+    subparser_taxonomy_lca.add_argument("-a", "--acc2taxid", action="store", dest="acc2taxid", required=True,
+                                        help="accession2taxid table (e.g. prot.accession2taxid.gz) or index "
+                                             "(prepare_acc2taxid)")
+    subparser_taxonomy_lca.add_argument("-t", "--output_table", action="store", dest="taxonomy_table", required=True,
+                                        help="output table with parsed taxonomy")
+    subparser_taxonomy_lca.add_argument("-m", "--names_dmp", action="store", dest="names_dmp", default=None,
+                                        required=False, help="location of names.dmp")
+    subparser_taxonomy_lca.add_argument("-x", "--nodes_dmp", action="store", dest="nodes_dmp", default=None,
+                                        required=False, help="location of nodes.dmp")
+    subparser_taxonomy_lca.add_argument("-p", "--top_percent", action="store", dest="top_percent", type=float,
+                                        default=10.0, required=False,
+                                        help="keep the hits within this percentage of the best bitscore (default: 10)")
+    subparser_taxonomy_lca.add_argument("-n", "--threads", action="store", dest="threads", type=int, default=1,
+                                        required=False, help="number of processes (default: 1)")
 
     subparser_functions_cog.add_argument("-d", "--diamond_file", action="store", dest="diamond_file", required=True,
                                          help="diamond results file")
-    subparser_functions_cog.add_argument("-t", "--cog_table", action="store", dest="cog_table", required=True,
+    subparser_functions_cog.add_argument("-t", "--cog_table", action="store", dest="cog_table", required=False,
                                          help="COG csv table")
-    subparser_functions_cog.add_argument("-n", "--cog_names", action="store", dest="cog_names", required=True,
+    subparser_functions_cog.add_argument("-n", "--cog_names", action="store", dest="cog_names", required=False,
                                          help="COG names table")
-    subparser_functions_cog.add_argument("-f", "--cog_functions", action="store", dest="cog_functions", required=True,
+    subparser_functions_cog.add_argument("-f", "--cog_functions", action="store", dest="cog_functions", required=False,
                                          help="COG functions table")
+    subparser_functions_cog.add_argument("-i", "--cog_index", action="store", dest="cog_index", required=False,
+                                         default=None, help="COG index (prepare_cog_files), replaces -t, -n and -f")
     subparser_functions_cog.add_argument("-e", "--export_table", action="store", dest="export_table", required=True,
                                          help="path for output table")
 
     subparser_functions_uniprot.add_argument("-d", "--diamond_file", action="store", dest="diamond_file",
                                              required=True, help="diamond results file")
     subparser_functions_uniprot.add_argument("-t", "--uniprot_table", action="store", dest="uniprot_table",
-                                             required=True, help="compressed UniProt table")
+                                             required=True, help="compressed UniProt table or UniProt store")
     subparser_functions_uniprot.add_argument("-e", "--export_table", action="store", dest="export_table",
                                              required=True, help="path for output table")
     subparser_functions_uniprot.add_argument("-g", "--go_annotation", action="store_true", dest="go_annotation",
                                              default=False, help="uniprot output table (with protein names)")
+    subparser_functions_uniprot.add_argument("-c", "--go_closure", action="store", dest="go_closure", required=False,
+                                             default=None, help="GO closure (prepare_go_files), rolls the GO terms "
+                                                                "up to all ancestors, -m or -p (requires -g)")
+    subparser_functions_uniprot.add_argument("-m", "--go_slim", action="store", dest="go_slim", required=False,
+                                             default=None, help="GO slim (obo file or list of GO IDs)")
+    subparser_functions_uniprot.add_argument("-p", "--go_depth", action="store", dest="go_depth", type=int,
+                                             required=False, default=None, help="depth of the rolled up GO terms")
 
     subparser_export_tables.add_argument("-e", "--excel_file", action="store", dest="excel_file", required=True,
                                           help="ProteinPilot results file")
     subparser_export_tables.add_argument("-t", "--annotated_table", action="store", dest="annotated_table",
-                                          required=True, help="annotated results table")
+                                          required=True, nargs="+",
+                                          help="annotated results table(s), several tables are joined into one table")
+    subparser_export_tables.add_argument("-l", "--labels", action="store", dest="labels", required=False,
+                                          default=None, nargs="+",
+                                          help="prefixes for the annotation columns of each annotated table")
     subparser_export_tables.add_argument("-o", "--output_table", action="store", dest="output_table", required=True,
                                           help="file of exported table")
+    subparser_export_tables.add_argument("-s", "--header_tsv", action="store", dest="header_tsv", required=False,
+                                          default=None, help="tsv file with hashed and original headers")
+    subparser_export_tables.add_argument("-r", "--header_index", action="store", dest="header_index", required=False,
+                                          default=None, help="index of the tsv file with hashed and original headers")
+
+    subparser_annotate.add_argument("-d", "--diamond_file", action="store", dest="diamond_file", required=True,
+                                    help="diamond results file (with protein IDs)")
+    subparser_annotate.add_argument("-e", "--excel_file", action="store", dest="excel_file", required=True,
+                                    help="ProteinPilot results file")
+    subparser_annotate.add_argument("-o", "--output_table", action="store", dest="output_table", required=True,
+                                    help="file of exported table")
+    subparser_annotate.add_argument("-b", "--database", action="store", dest="database", required=True,
+                                    choices=["cog", "uniprot"], help="database the diamond file was created with")
+    subparser_annotate.add_argument("-t", "--cog_table", action="store", dest="cog_table", required=False,
+                                    help="COG table (cog)")
+    subparser_annotate.add_argument("-n", "--cog_names", action="store", dest="cog_names", required=False,
+                                    help="COG names (cog)")
+    subparser_annotate.add_argument("-f", "--cog_functions", action="store", dest="cog_functions", required=False,
+                                    help="COG functions (cog)")
+    subparser_annotate.add_argument("-i", "--cog_index", action="store", dest="cog_index", required=False,
+                                    default=None, help="COG index, replaces -t, -n and -f (cog)")
+    subparser_annotate.add_argument("-u", "--uniprot_table", action="store", dest="uniprot_table", required=False,
+                                    help="compressed UniProt table or UniProt store (uniprot)")
+    subparser_annotate.add_argument("-g", "--go_annotation", action="store_true", dest="go_annotation",
+                                    default=False, help="use GO annotations instead of protein names (uniprot)")
+    subparser_annotate.add_argument("-c", "--go_closure", action="store", dest="go_closure", required=False,
+                                    default=None, help="GO closure to roll the GO terms up (uniprot, requires -g)")
+    subparser_annotate.add_argument("-m", "--go_slim", action="store", dest="go_slim", required=False,
+                                    default=None, help="GO slim of the rolled up GO terms (uniprot)")
+    subparser_annotate.add_argument("-p", "--go_depth", action="store", dest="go_depth", type=int, required=False,
+                                    default=None, help="depth of the rolled up GO terms (uniprot)")
+    subparser_annotate.add_argument("-a", "--annotated_table", action="store", dest="annotated_table",
+                                    required=False, default=None, help="also write the annotated table")
+    subparser_annotate.add_argument("-x", "--debug_dir", action="store", dest="debug_dir", required=False,
+                                    default=None, help="directory for the intermediate tables")
+    subparser_annotate.add_argument("-s", "--header_tsv", action="store", dest="header_tsv", required=False,
+                                    default=None, help="tsv file with hashed and original headers")
+    subparser_annotate.add_argument("-r", "--header_index", action="store", dest="header_index", required=False,
+                                    default=None, help="index of the tsv file with hashed and original headers")
+
+    subparser_lookup_headers.add_argument("-i", "--input_table", action="store", dest="input_table", required=True,
+                                          help="tab-separated table with hashed headers")
+    subparser_lookup_headers.add_argument("-c", "--column", action="store", dest="column", required=False,
+                                          default="Accession", help="column with hashed headers (default: Accession)")
+    subparser_lookup_headers.add_argument("-s", "--header_tsv", action="store", dest="header_tsv", required=True,
+                                          help="tsv file with hashed and original headers")
+    subparser_lookup_headers.add_argument("-r", "--header_index", action="store", dest="header_index", required=True,
+                                          help="index of the tsv file with hashed and original headers")
+    subparser_lookup_headers.add_argument("-o", "--output_table", action="store", dest="output_table", required=True,
+                                          help="output table with original headers")
 
     args = parser.parse_args()
 
@@ -205,11 +421,38 @@ def main():
     logger.info("(metaproteomics toolkit) started")
 
     if args.mode == "prepare_uniprot_files":
+        from mptk import general_functions, uniprot_dat
         logger.info("parsing UniProt file")
-        general_functions.parse_uniprot_file(uniprot_file=args.uniprot_file, uniprot_table=args.uniprot_table,
-                                             go_annotation=args.go_annotation)
+        if args.go_table or args.protein_name_table or args.threads > 1 or args.store:
+            go_table = args.go_table or (args.uniprot_table if args.go_annotation else None)
+            protein_name_table = args.protein_name_table or (None if args.go_annotation else args.uniprot_table)
+            uniprot_dat.parse_uniprot_file_parallel(uniprot_file=args.uniprot_file, go_table=go_table,
+                                                    protein_name_table=protein_name_table, threads=args.threads,
+                                                    store=args.store)
+        elif args.uniprot_table:
+            general_functions.parse_uniprot_file(uniprot_file=args.uniprot_file, uniprot_table=args.uniprot_table,
+                                                 go_annotation=args.go_annotation)
+        else:
+            raise ValueError("no output table given (use -t, -o or -p)")
+
+    elif args.mode == "prepare_cog_files":
+        from mptk import parse_functions_cog
+        logger.info("building COG index")
+        parse_functions_cog.build_cog_index(cog_table=args.cog_table, cog_names=args.cog_names,
+                                            cog_functions=args.cog_functions, cog_index=args.cog_index)
+
+    elif args.mode == "prepare_go_files":
+        from mptk import go_ontology
+        logger.info("building GO closure")
+        go_ontology.build_go_closure(obo_file=args.obo_file, go_closure=args.go_closure)
+
+    elif args.mode == "prepare_acc2taxid":
+        from mptk import general_functions
+        logger.info("building accession2taxid index")
+        general_functions.build_acc2taxid_index(acc2taxid_file=args.acc2taxid, acc2taxid_index=args.acc2taxid_index)
 
     # elif args.mode == "parse_singlem":
+    #     from mptk import general_functions, parse_singlem
     #     logger.info("parsing OTU table")
     #     abspath_names_dmp = general_functions.get_names_dmp(names_dmp=args.names_dmp)
     #     tax_dict = general_functions.create_tax_dict(abspath_names_dmp=abspath_names_dmp)
@@ -220,57 +463,187 @@ def main():
     #                                    taxon_file=args.taxon_file)
 
     elif args.mode == "amplicon":
+        from mptk import general_functions, use_amplicon
         logger.info("started amplicon analysis")
         abspath_names_dmp = general_functions.get_names_dmp(names_dmp=args.names_dmp)
         tax_dict = general_functions.create_tax_dict(abspath_names_dmp=abspath_names_dmp)
+        taxonomy = None
+        if args.taxonomy and args.nodes_dmp:
+            from mptk import ncbi_taxonomy
+            abspath_nodes_dmp = general_functions.get_nodes_dmp(nodes_dmp=args.nodes_dmp)
+            taxonomy = ncbi_taxonomy.load_taxonomy(abspath_nodes_dmp=abspath_nodes_dmp)
         taxids = use_amplicon.get_taxid(input_file=args.genus_list)
         use_amplicon.get_protein_sequences(tax_list=taxids, output_file=args.proteome_file, ncbi_tax_dict=tax_dict,
-                                           reviewed=args.reviewed, add_taxonomy=args.taxonomy)
+                                           reviewed=args.reviewed, add_taxonomy=args.taxonomy, url=args.url,
+                                           connections=args.connections, shard_size=args.shard_size,
+                                           taxonomy=taxonomy, cache_dir=args.cache_dir, release=args.release,
+                                           max_cache_size=None if args.cache_limit is None
+                                           else int(args.cache_limit * 1048576))
+
+    elif args.mode == "proteome_cache":
+        from mptk import proteome_cache
+        if args.action == "prune":
+            if args.cache_limit is None and args.release is None:
+                parser.error("proteome_cache -a prune requires -l/--cache_limit or -e/--release")
+            proteome_cache.prune_cache(cache_dir=args.cache_dir, release=args.release,
+                                       max_size=None if args.cache_limit is None else int(args.cache_limit * 1048576))
+        elif args.action == "clear":
+            logger.info("clearing proteome cache")
+            proteome_cache.clear_cache(cache_dir=args.cache_dir)
+        proteome_cache.show_cache(cache_dir=args.cache_dir)
 
     elif args.mode == "function_subset":
+        from mptk import use_amplicon, use_functional_subset
         logger.info("creating functional subsets")
-        query_command = use_functional_subset.search_lists_to_query_url(args.toml_file)
-        use_amplicon.get_protein_sequences(tax_list=False, query=query_command, output_file=args.proteome_file, reviewed=args.reviewed, add_taxonomy=args.taxonomy)
+        queries = use_functional_subset.search_lists_to_queries(args.toml_file, shard_size=args.shard_size)
+        use_amplicon.get_protein_sequences(tax_list=None, query=queries, output_file=args.proteome_file,
+                                           ncbi_tax_dict=None, reviewed=args.reviewed, add_taxonomy=False,
+                                           url=args.url, connections=args.connections)
 
     elif args.mode == "hashing":
+        from mptk import hash_headers, index_files
         logger.info("hashing protein headers")
-        hash_headers.write_hashed_protein_header_fasta_file(input_file=args.proteome_file, output_file=args.hashed_file,
-                                                            tsv_file=args.tsv_file, hash_type=args.hash_type)
+        if args.hash_mode == "independent":
+            hash_headers.write_hashed_protein_header_fasta_file_parallel(input_file=args.proteome_file,
+                                                                         output_file=args.hashed_file,
+                                                                         tsv_file=args.tsv_file,
+                                                                         hash_type=args.hash_type,
+                                                                         digest_size=args.digest_size,
+                                                                         threads=args.threads)
+        else:
+            hash_headers.write_hashed_protein_header_fasta_file(input_file=args.proteome_file,
+                                                                output_file=args.hashed_file, tsv_file=args.tsv_file,
+                                                                hash_type=args.hash_type, digest_size=args.digest_size)
+        if args.index_file:
+            logger.info("indexing hashed proteome")
+            index_files.write_fasta_index(fasta_file=args.hashed_file, index_file=args.index_file)
+        if args.header_index:
+            logger.info("indexing hashed headers")
+            hash_headers.write_header_index(tsv_file=args.tsv_file, index_file=args.header_index)
+
+    elif args.mode == "postprocessing":
+        from mptk import hash_headers, index_files, postprocess_proteome
+        logger.info("postprocessing proteomes")
+        postprocess_proteome.postprocess_proteomes(input_files=args.proteome_files, output_file=args.hashed_file,
+                                                   tsv_file=args.tsv_file, hash_type=args.hash_type,
+                                                   min_length=args.min_length, hash_mode=args.hash_mode,
+                                                   digest_size=args.digest_size)
+        if args.index_file:
+            logger.info("indexing hashed proteome")
+            index_files.write_fasta_index(fasta_file=args.hashed_file, index_file=args.index_file)
+        if args.header_index:
+            logger.info("indexing hashed headers")
+            hash_headers.write_header_index(tsv_file=args.tsv_file, index_file=args.header_index)
 
     elif args.mode == "subset_sequences":
+        from mptk import subset_sequences
         logger.info("subsetting sequences")
         df = subset_sequences.parse_proteinpilot_file(excel_file=args.excel_file)
-        subset_sequences.subset_sequence_file(df=df, sequence_file=args.database_file,
-                                                              sequence_file_subset=args.database_subset)
+        if args.index_file:
+            subset_sequences.subset_sequence_file_indexed(df=df, sequence_file=args.database_file,
+                                                          index_file=args.index_file,
+                                                          sequence_file_subset=args.database_subset)
+        else:
+            subset_sequences.subset_sequence_file(df=df, sequence_file=args.database_file,
+                                                  sequence_file_subset=args.database_subset)
+
+    elif args.mode == "subset_sequences_batch":
+        from mptk import subset_sequences
+        logger.info("subsetting sequences for %d ProteinPilot files" % len(args.excel_files))
+        dfs = [subset_sequences.parse_proteinpilot_file(excel_file=excel_file) for excel_file in args.excel_files]
+        subset_sequences.subset_sequence_files(dfs=dfs, sequence_file=args.database_file,
+                                               sequence_file_subsets=args.database_subsets, index_file=args.index_file)
 
     elif args.mode == "protein_groups":
+        from mptk import general_functions
         logger.info("use protein groups")
         general_functions.map_protein_groups(diamond_file=args.diamond_file, excel_file=args.excel_file,
                                              diamond_file_protein_groups=args.diamond_protein_groups)
 
     elif args.mode == "taxonomy":
+        from mptk import parse_taxonomy
         logger.info("parsing megan taxonomy file")
-        parse_taxonomy.parse_table(input_file=args.megan_results, output_file=args.taxonomy_table)
+        parse_taxonomy.parse_table(input_file=args.megan_results, output_file=args.taxonomy_table,
+                                   score_cutoff=args.score_cutoff)
+
+    elif args.mode == "taxonomy_lca":
+        from mptk import taxonomy_lca
+        logger.info("assigning taxonomy by lowest common ancestor")
+        taxonomy_lca.assign_taxonomy(diamond_file=args.diamond_file, acc2taxid_file=args.acc2taxid,
+                                     output_table=args.taxonomy_table, names_dmp=args.names_dmp,
+                                     nodes_dmp=args.nodes_dmp, top_percent=args.top_percent, threads=args.threads)
 
     elif args.mode == "functions_cog":
+        from mptk import general_functions, parse_functions_cog
+        if not args.cog_index and not (args.cog_table and args.cog_names and args.cog_functions):
+            parser.error("functions_cog requires -i or -t, -n and -f")
         logger.info("running COG analysis")
-        cog_df = general_functions.parse_diamond_output(diamond_file=args.diamond_file)
-        cog_df_merged = parse_functions_cog.join_tables(df=cog_df, cog_table=args.cog_table, cog_names=args.cog_names)
-        cog_df_grouped = parse_functions_cog.group_table(df=cog_df_merged, cog_functions=args.cog_functions)
+        # the qseqid column holds the protein group numbers written by map_protein_groups
+        cog_df = general_functions.parse_diamond_output(diamond_file=args.diamond_file, columns=["qseqid", "sseqid"],
+                                                        dtypes={"qseqid": "float32"})
+        cog_df_merged = parse_functions_cog.join_tables(df=cog_df, cog_table=args.cog_table, cog_names=args.cog_names,
+                                                        cog_index=args.cog_index)
+        cog_df_grouped = parse_functions_cog.group_table(df=cog_df_merged, cog_functions=args.cog_functions,
+                                                         cog_index=args.cog_index, cog_table=args.cog_table)
         parse_functions_cog.export_table(df=cog_df_grouped, output_file=args.export_table)
 
     elif args.mode == "functions_uniprot":
+        from mptk import general_functions, parse_functions_uniprot
+        if (args.go_slim or args.go_depth is not None) and not args.go_closure:
+            parser.error("functions_uniprot -m and -p require -c")
+        if args.go_closure and not args.go_annotation:
+            parser.error("functions_uniprot -c requires -g")
+        if args.go_slim and args.go_depth is not None:
+            parser.error("functions_uniprot -m and -p cannot be used together")
         logger.info("running Uniprot analysis")
-        uniprot_df = general_functions.parse_diamond_output(diamond_file=args.diamond_file)
+        # the qseqid column holds the protein group numbers written by map_protein_groups
+        uniprot_df = general_functions.parse_diamond_output(diamond_file=args.diamond_file,
+                                                            columns=["qseqid", "sseqid"], dtypes={"qseqid": "float32"})
         uniprot_df_merged = parse_functions_uniprot.join_tables(uniprot_df, uniprot_table=args.uniprot_table,
-                                                                go_annotation=args.go_annotation)
-        uniprot_df_grouped = parse_functions_uniprot.group_table(uniprot_df_merged)
+                                                                go_annotation=args.go_annotation,
+                                                                go_closure=args.go_closure, go_slim=args.go_slim,
+                                                                go_depth=args.go_depth)
+        uniprot_df_grouped = parse_functions_uniprot.group_table(uniprot_df_merged, go_annotation=args.go_annotation)
         parse_functions_uniprot.export_table(df=uniprot_df_grouped, output_file=args.export_table)
 
+    elif args.mode == "annotate":
+        from mptk import annotate
+        if args.database == "cog" and not args.cog_index and not (args.cog_table and args.cog_names and
+                                                                   args.cog_functions):
+            parser.error("annotate -b cog requires -i or -t, -n and -f")
+        if args.database == "uniprot" and not args.uniprot_table:
+            parser.error("annotate -b uniprot requires -u")
+        if (args.go_slim or args.go_depth is not None) and not args.go_closure:
+            parser.error("annotate -m and -p require -c")
+        if args.go_closure and not args.go_annotation:
+            parser.error("annotate -c requires -g")
+        if args.go_slim and args.go_depth is not None:
+            parser.error("annotate -m and -p cannot be used together")
+        if args.header_index and not args.header_tsv:
+            parser.error("annotate -r requires -s")
+        annotate.annotate(diamond_file=args.diamond_file, excel_file=args.excel_file, output_table=args.output_table,
+                          database=args.database, cog_table=args.cog_table, cog_names=args.cog_names,
+                          cog_functions=args.cog_functions, cog_index=args.cog_index,
+                          uniprot_table=args.uniprot_table,
+                          go_annotation=args.go_annotation, go_closure=args.go_closure, go_slim=args.go_slim,
+                          go_depth=args.go_depth, annotated_table=args.annotated_table,
+                          debug_dir=args.debug_dir, header_tsv=args.header_tsv, header_index=args.header_index)
+
     elif args.mode == "export_tables":
+        from mptk import general_functions
+        if args.header_index and not args.header_tsv:
+            parser.error("export_tables -r requires -s")
         logger.info("exporting tables")
-        general_functions.export_result_tables(excel_file=args.excel_file, annotated_table=args.annotated_table,
-                                               output_table=args.output_table)
+        general_functions.export_combined_tables(excel_file=args.excel_file, annotated_tables=args.annotated_table,
+                                                 output_table=args.output_table, labels=args.labels,
+                                                 header_tsv=args.header_tsv, header_index=args.header_index)
+
+    elif args.mode == "lookup_headers":
+        from mptk import hash_headers
+        logger.info("looking up original headers")
+        hash_headers.write_table_with_original_headers(input_table=args.input_table, column=args.column,
+                                                       tsv_file=args.header_tsv, index_file=args.header_index,
+                                                       output_table=args.output_table)
 
     logger.info("Done and finished!")
 
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+"""
+Annotate the protein groups of one identified ID in one process.
+
+This module chains the steps of the functional annotation (`protein_groups`, `functions_cog` or `functions_uniprot`,
+and `export_tables`) on in-memory data frames, instead of writing each intermediate table to a tsv file that the next
+main.py process parses again.
+"""
+
+import logging
+import os
+from mptk import general_functions
+
+logger = logging.getLogger("mptk.annotate")
+
+DATABASES = ["cog", "uniprot"]
+
+
+def dump_table(df, debug_dir, file_name, header=True):
+    """
+    Write an intermediate data frame into the debug directory.
+
+    Parameters
+    ----------
+      df: the data frame
+      debug_dir: the debug directory (None to skip the dump)
+      file_name: name of the file in the debug directory
+      header: write the column names (default: True)
+
+    Returns
+    -------
+      None
+
+    """
+    if debug_dir:
+        os.makedirs(debug_dir, exist_ok=True)
+        df.to_csv(os.path.join(debug_dir, file_name), sep="\t", encoding="utf-8", index=False, header=header)
+
+    return None
+
+
+def annotate(diamond_file, excel_file, output_table, database, cog_table=None, cog_names=None, cog_functions=None,
+             cog_index=None, uniprot_table=None, go_annotation=False, go_closure=None, go_slim=None, go_depth=None,
+             annotated_table=None, debug_dir=None, header_tsv=None, header_index=None):
+    """
+    Annotate the protein groups with COG or UniProt and export the result table.
+
+    The function does the same as the subcommands protein_groups, functions_cog/functions_uniprot and export_tables
+    run one after the other.
+
+    Parameters
+    ----------
+      diamond_file: diamond output file of the identified protein sequences
+      excel_file: the ProteinPilot result excel file
+      output_table: file of exported table
+      database: cog or uniprot
+      cog_table: the COG csv table (database cog)
+      cog_names: the COG names table (database cog)
+      cog_functions: the COG functions table (database cog)
+      cog_index: the COG index, replaces the COG tables (database cog, default: None)
+      uniprot_table: the compressed UniProt table or UniProt store (database uniprot)
+      go_annotation: use GO annotations instead of protein names (database uniprot, default: False)
+      go_closure: the GO closure to roll the GO terms up (database uniprot, default: None)
+      go_slim: GO slim of the rolled up GO terms (database uniprot, default: None)
+      go_depth: depth of the rolled up GO terms (database uniprot, default: None)
+      annotated_table: also write the annotated table (like functions_cog/functions_uniprot, default: None)
+      debug_dir: directory for the intermediate tables (default: None, not written)
+      header_tsv: tsv file with hashed and original headers (default: None)
+      header_index: index of the header tsv file, if set the original headers are added (default: None)
+
+    Returns
+    -------
+      None
+
+    """
+    if database not in DATABASES:
+        raise ValueError("unknown database %s (choose from %s)" % (database, ", ".join(DATABASES)))
+
+    excel_df = general_functions.read_proteinpilot_file(excel_file)
+
+    logger.info("mapping protein groups ...")
+    diamond_df = general_functions.read_diamond_table(diamond_file=diamond_file,
+                                                      columns=["qseqid", "sseqid", "bitscore"])
+    diamond_df = general_functions.assign_protein_groups(diamond_df=diamond_df, excel_df=excel_df)
+    dump_table(diamond_df, debug_dir, "protein_groups.tsv", header=False)
+    diamond_df = diamond_df.drop("bitscore", axis=1)
+
+    if database == "cog":
+        from mptk import parse_functions_cog
+        logger.info("running COG analysis")
+        df_merged = parse_functions_cog.join_tables(df=diamond_df, cog_table=cog_table, cog_names=cog_names,
+                                                    cog_index=cog_index)
+        dump_table(df_merged, debug_dir, "joined_table.tsv")
+        df_grouped = parse_functions_cog.group_table(df=df_merged, cog_functions=cog_functions, cog_index=cog_index,
+                                                     cog_table=cog_table)
+    else:
+        from mptk import parse_functions_uniprot
+        logger.info("running Uniprot analysis")
+        df_merged = parse_functions_uniprot.join_tables(diamond_df, uniprot_table=uniprot_table,
+                                                        go_annotation=go_annotation, go_closure=go_closure,
+                                                        go_slim=go_slim, go_depth=go_depth)
+        dump_table(df_merged, debug_dir, "joined_table.tsv")
+        df_grouped = parse_functions_uniprot.group_table(df_merged, go_annotation=go_annotation)
+    dump_table(df_grouped, debug_dir, "parsed_table.tsv")
+    if annotated_table:
+        df_grouped.to_csv(annotated_table, sep="\t", encoding="utf-8", index=False)
+
+    logger.info("exporting tables")
+    merged_df = general_functions.combine_annotations(excel_df=excel_df, annotated_dfs=[df_grouped],
+                                                      header_tsv=header_tsv, header_index=header_index)
+    merged_df.to_csv(output_table, sep="\t", encoding="utf-8", index=False, header=True)
+
+    return None
+
+
+# mPies (metaProteomics in environmental sciences) creates annotated databases for metaproteomics analysis.
+# Copyright 2018 Johannes Werner (Leibniz-Institute for Baltic Sea Research)
+# Copyright 2018 Augustin Geron (University of Mons, University of Stirling)
+# Copyright 2018 Sabine Matallana Surget (University of Stirling)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -8,17 +8,40 @@ the NCBI taxonomy.
 """
 
 import gzip
+import hashlib
+import json
 import logging
+import numpy as np
 import os
-import pandas as pd
 import re
+import struct
 import tarfile
 import urllib.parse
 import urllib.request
-from ete3 import NCBITaxa
+from mptk import hash_headers
 
 logger = logging.getLogger("pies.general_functions")
-NCBI = NCBITaxa()
+_NCBI = None
+
+
+def get_ncbi():
+    """
+    Return the NCBITaxa object.
+
+    The object (and the NCBI taxonomy database) is only created on first use, so that subcommands without taxonomy
+    lookups do not load (or download) the database.
+
+    Returns
+    -------
+      the NCBITaxa object
+
+    """
+    global _NCBI
+    if _NCBI is None:
+        from ete3 import NCBITaxa
+        _NCBI = NCBITaxa()
+
+    return _NCBI
 
 
 def get_desired_ranks(taxid):
@@ -40,8 +63,8 @@ def get_desired_ranks(taxid):
     if taxid == -1:
         return {"superkingdom": -1, "phylum": -1, "class": -1, "order": -1, "family": -1,
                 "genus": -1}
-    lineage = NCBI.get_lineage(taxid)
-    lineage2ranks = NCBI.get_rank(lineage)
+    lineage = get_ncbi().get_lineage(taxid)
+    lineage2ranks = get_ncbi().get_rank(lineage)
     ranks2lineage = dict((rank, taxid) for (taxid, rank) in lineage2ranks.items())
     for taxrank in ["superkingdom", "phylum", "class", "order", "family", "genus"]:
         if taxrank not in ranks2lineage:
@@ -50,51 +73,286 @@ def get_desired_ranks(taxid):
     return ranks2lineage
 
 
-def get_names_dmp(names_dmp=None):
+def get_taxdump_file(file_name, dmp_file=None):
     """
-    Download names.dmp.
+    Download a file of the NCBI taxonomy dump (e.g. names.dmp or nodes.dmp).
 
-    The function downloades the names.dmp file if not already existing or if the file size is zero.
+    The function downloades taxdump.tar.gz and extracts the file if not already existing or if the file size is zero.
 
     Parameter
     ---------
-      names_dmp: location of names.dmp (default: None)
+      file_name: name of the file in taxdump.tar.gz
+      dmp_file: location of the file (default: None)
 
     Returns
     -------
-      absolute path of file names.dmp
+      absolute path of the file
 
     """
-    if names_dmp is not None:
-        if os.stat(names_dmp).st_size == 0:
-            os.remove(names_dmp)
+    if dmp_file is not None:
+        if os.stat(dmp_file).st_size == 0:
+            os.remove(dmp_file)
         else:
-            return os.path.abspath(names_dmp)
+            return os.path.abspath(dmp_file)
     else:
-        names_dmp = "names.dmp"
-        if os.path.isfile("names.dmp"):
-            if os.stat(names_dmp).st_size != 0:
-                return os.path.abspath(names_dmp)
+        dmp_file = file_name
+        if os.path.isfile(file_name):
+            if os.stat(dmp_file).st_size != 0:
+                return os.path.abspath(dmp_file)
 
             else:
-                os.remove(names_dmp)
+                os.remove(dmp_file)
 
     logger.info("Downloading taxdump.tar.gz ...")
     urllib.request.urlretrieve("ftp://ftp.ncbi.nlm.nih.gov/pub/taxonomy/taxdump.tar.gz",
                                filename="taxdump.tar.gz")
     tar = tarfile.open("taxdump.tar.gz")
-    tar.extract("names.dmp")
+    tar.extract(file_name)
     tar.close()
     os.remove("taxdump.tar.gz")
 
-    return os.path.abspath("names.dmp")
+    return os.path.abspath(file_name)
 
 
-def create_tax_dict(abspath_names_dmp):
+def get_names_dmp(names_dmp=None):
+    """
+    Download names.dmp.
+
+    The function downloades the names.dmp file if not already existing or if the file size is zero.
+
+    Parameter
+    ---------
+      names_dmp: location of names.dmp (default: None)
+
+    Returns
+    -------
+      absolute path of file names.dmp
+
+    """
+    return get_taxdump_file(file_name="names.dmp", dmp_file=names_dmp)
+
+
+def get_nodes_dmp(nodes_dmp=None):
+    """
+    Download nodes.dmp.
+
+    The function downloades the nodes.dmp file if not already existing or if the file size is zero.
+
+    Parameter
+    ---------
+      nodes_dmp: location of nodes.dmp (default: None)
+
+    Returns
+    -------
+      absolute path of file nodes.dmp
+
+    """
+    return get_taxdump_file(file_name="nodes.dmp", dmp_file=nodes_dmp)
+
+
+ARRAY_CACHE_MAGIC = b"MPTKARR1"
+ARRAY_CACHE_ALIGNMENT = 64
+
+
+def write_array_cache(cache_file, source_file, arrays):
+    """
+    Write numpy arrays derived from a source file into a cache file.
+
+    The cache file stores the size and modification time of the source file together with the arrays, so that
+    `read_array_cache` can detect outdated caches. The arrays are stored uncompressed and aligned, so they can be
+    loaded as memory maps. The file is written under a temporary name and renamed afterwards, so concurrent jobs never
+    read a partially written cache.
+
+    Parameters
+    ----------
+      cache_file: path of the cache file
+      source_file: the file the arrays were derived from
+      arrays: dict with names as keys and numpy arrays as values
+
+    Returns
+    -------
+      None
+
+    """
+    source_stat = os.stat(source_file)
+    header = {"source_file": os.path.abspath(source_file), "source_size": source_stat.st_size,
+              "source_mtime_ns": source_stat.st_mtime_ns, "arrays": {}}
+    offset = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        header["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += -(-array.nbytes // ARRAY_CACHE_ALIGNMENT) * ARRAY_CACHE_ALIGNMENT
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_start = -(-(len(ARRAY_CACHE_MAGIC) + 8 + len(header_bytes)) // ARRAY_CACHE_ALIGNMENT) * ARRAY_CACHE_ALIGNMENT
+
+    tmp_file = "%s.%d.tmp" % (cache_file, os.getpid())
+    with open(tmp_file, "wb") as tmp_file_open:
+        tmp_file_open.write(ARRAY_CACHE_MAGIC + struct.pack("<Q", data_start) + header_bytes)
+        for name, array in arrays.items():
+            tmp_file_open.seek(data_start + header["arrays"][name]["offset"])
+            tmp_file_open.write(np.ascontiguousarray(array).tobytes())
+        tmp_file_open.truncate(data_start + offset)
+    os.replace(tmp_file, cache_file)
+
+    return None
+
+
+def is_array_cache(cache_file):
+    """
+    Check if a file is a cache file written by `write_array_cache`.
+
+    Parameters
+    ----------
+      cache_file: path of the file
+
+    Returns
+    -------
+      True if the file starts with the magic bytes of a cache file
+
+    """
+    if not os.path.isfile(cache_file):
+        return False
+    with open(cache_file, "rb") as cache_file_open:
+        return cache_file_open.read(len(ARRAY_CACHE_MAGIC)) == ARRAY_CACHE_MAGIC
+
+
+def read_array_cache(cache_file, source_file=None):
+    """
+    Read numpy arrays from a cache file written by `write_array_cache`.
+
+    Parameters
+    ----------
+      cache_file: path of the cache file
+      source_file: the file the arrays were derived from (default: None, only warn if the file recorded in the cache
+                   has changed)
+
+    Returns
+    -------
+      arrays: dict with names as keys and read-only memory mapped numpy arrays as values (None if the cache file does
+              not exist or is outdated)
+
+    """
+    if not os.path.isfile(cache_file):
+        return None
+
+    with open(cache_file, "rb") as cache_file_open:
+        if cache_file_open.read(len(ARRAY_CACHE_MAGIC)) != ARRAY_CACHE_MAGIC:
+            return None
+        data_start = struct.unpack("<Q", cache_file_open.read(8))[0]
+        header_bytes = cache_file_open.read(data_start - len(ARRAY_CACHE_MAGIC) - 8).rstrip(b"\0")
+    header = json.loads(header_bytes.decode("utf-8"))
+
+    if source_file is None and os.path.isfile(header.get("source_file", "")):
+        # without a source file to check against, the recorded one is checked if it still exists
+        source_stat = os.stat(header["source_file"])
+        if (header["source_size"], header["source_mtime_ns"]) != (source_stat.st_size, source_stat.st_mtime_ns):
+            logger.warning("cache %s may be outdated, %s has changed", cache_file, header["source_file"])
+    elif source_file is not None:
+        source_stat = os.stat(source_file)
+        if (header["source_size"], header["source_mtime_ns"]) != (source_stat.st_size, source_stat.st_mtime_ns):
+            logger.info("cache %s is outdated", cache_file)
+            return None
+
+    arrays = {}
+    for name, array_header in header["arrays"].items():
+        dtype = np.dtype(array_header["dtype"])
+        shape = tuple(array_header["shape"])
+        if int(np.prod(shape)) == 0:
+            arrays[name] = np.empty(shape, dtype=dtype)
+        else:
+            arrays[name] = np.memmap(cache_file, dtype=dtype, mode="r", offset=data_start + array_header["offset"],
+                                     shape=shape)
+
+    return arrays
+
+
+class TaxNames(object):
+    """
+    Compact taxID to scientific name table.
+
+    The names are stored in one string heap (bytes) and the name of a taxID spans `heap[offsets[taxid]:offsets[taxid
+    + 1]]`. The table can be used like the dictionary created before (`tax_names[taxid]`, `tax_names.get(taxid)`,
+    `taxid in tax_names`, `tax_names.values()`), the taxID -1 (unclassified) maps onto -1.
+    """
+
+    def __init__(self, offsets, heap):
+        self.offsets = offsets
+        self.heap = heap
+
+    def __getitem__(self, taxid):
+        if taxid == -1:
+            return -1
+        taxid = int(taxid)
+        if taxid < 0 or taxid + 1 >= len(self.offsets):
+            raise KeyError(taxid)
+        start, end = int(self.offsets[taxid]), int(self.offsets[taxid + 1])
+        if start == end:
+            raise KeyError(taxid)
+
+        return bytes(self.heap[start:end]).decode("utf-8")
+
+    def __contains__(self, taxid):
+        return self.get(taxid) is not None
+
+    def __len__(self):
+        return int(np.count_nonzero(np.diff(self.offsets))) + 1
+
+    def get(self, taxid, default=None):
+        try:
+            return self[taxid]
+        except (KeyError, ValueError, TypeError):
+            return default
+
+    def values(self):
+        yield -1
+        heap = bytes(self.heap)
+        for start, end in zip(self.offsets[:-1].tolist(), self.offsets[1:].tolist()):
+            if start != end:
+                yield heap[start:end].decode("utf-8")
+
+
+def parse_names_dmp(abspath_names_dmp):
+    """
+    Parse the scientific names from names.dmp.
+
+    The lines are parsed as bytes and only the lines of scientific names are split.
+
+    Parameter
+    ---------
+      abspath_names_dmp: absolute path of of names.dmp
+
+    Returns
+    -------
+      offsets: numpy array with the start of the name of each taxID in the heap (length: largest taxID + 2)
+      heap: numpy array (uint8) with all names
+
+    """
+    names = {}
+    with open(abspath_names_dmp, "rb", buffering=1048576) as names_dmp_open:
+        for line in names_dmp_open:
+            if line.endswith(b"\t|\tscientific name\t|\n"):
+                taxid, name, _ = line.split(b"\t|\t", 2)
+                names[int(taxid)] = name
+
+    taxids = np.fromiter(names.keys(), dtype=np.int64, count=len(names))
+    order = np.argsort(taxids)
+    name_list = list(names.values())
+    lengths = np.zeros(int(taxids.max()) + 2 if len(taxids) else 1, dtype=np.uint64)
+    lengths[taxids + 1] = [len(name) for name in name_list]
+    offsets = np.cumsum(lengths, dtype=np.uint64)
+    heap = np.frombuffer(b"".join(name_list[i] for i in order.tolist()), dtype=np.uint8)
+
+    return offsets, heap
+
+
+def create_tax_dict(abspath_names_dmp, cache_file=None):
     """
     Create a taxonomy dictionary with taxID as keys and tax names as values.
 
-    The function uses names.dmp to create a tax dictionary to map taxIDs onto tax names.
+    The function uses names.dmp to create a tax dictionary to map taxIDs onto tax names. Only the scientific names are
+    kept in a compact `TaxNames` table (one string heap and an offset array indexed by taxID). The table is cached
+    next to names.dmp (or in `cache_file`), so later runs load it with mmap instead of parsing names.dmp again. The
+    cache is rebuilt when the size or modification time of names.dmp changes.
 
     Below, the first 10 lines of the current version of names.dmp are shown. The first column
     (`curr_line[0]`) represents the taxID, the second column (`curr_line[1]`) the name and the
@@ -118,22 +376,261 @@ def create_tax_dict(abspath_names_dmp):
     Parameter
     ---------
       abspath_names_dmp: absolute path of of names.dmp
+      cache_file: path of the cache file (default: None, names.dmp with suffix .mptk)
 
     Returns
     -------
-      ncbi_tax_dict: tax dictionary
+      ncbi_tax_dict: tax dictionary (TaxNames object)
 
     """
-    ncbi_tax_dict = {}
-    ncbi_tax_dict[-1] = -1
+    if cache_file is None:
+        cache_file = abspath_names_dmp + ".mptk"
+
+    cache = read_array_cache(cache_file=cache_file, source_file=abspath_names_dmp)
+    if cache is not None:
+        logger.info("loading tax dictionary from %s ...", cache_file)
+        return TaxNames(offsets=cache["offsets"], heap=cache["heap"])
+
     logger.info("creating tax dictionary ...")
-    with open(abspath_names_dmp) as names_dmp_open:
-        for line in names_dmp_open:
-            curr_line = re.split(r"\t*\|\t*", line.rstrip())
-            if curr_line[3] == "scientific name":
-                ncbi_tax_dict[int(curr_line[0])] = curr_line[1]
+    offsets, heap = parse_names_dmp(abspath_names_dmp=abspath_names_dmp)
+    try:
+        write_array_cache(cache_file=cache_file, source_file=abspath_names_dmp,
+                          arrays={"offsets": offsets, "heap": heap})
+    except OSError as e:
+        logger.warning("could not write cache %s: %s", cache_file, e)
+
+    return TaxNames(offsets=offsets, heap=heap)
+
+
+ACC2TAXID_MAGIC = b"MPTKA2T1"
+ACC2TAXID_HEADER = struct.Struct("<8sIIQQQ")
+
+
+def acc2taxid_dtype(key_width):
+    """
+    Return the record type of an accession2taxid index with keys of the given width.
+
+    Parameters
+    ----------
+      key_width: number of bytes reserved for each accession
+
+    Returns
+    -------
+      the numpy dtype of an index record
+
+    """
+    return np.dtype([("key", "S%d" % key_width), ("taxid", "<i4")])
+
+
+def merge_acc2taxid_runs(runs, output_file_open, key_width, page_size, block_size=1048576):
+    """
+    Merge sorted runs of accession2taxid records into the index file.
+
+    From each run, a block of records is read. All records up to the smallest last key of the blocks of unfinished
+    runs are sorted and written, the remaining records are kept for the next round.
+
+    Parameters
+    ----------
+      runs: list of sorted record arrays (memory maps)
+      output_file_open: the index file (opened for writing at the start of the records)
+      key_width: key width of the index
+      page_size: number of records per page of the sparse page index
+      block_size: number of records read from each run per round (default: 1048576)
+
+    Returns
+    -------
+      n_records: number of written records
+      page_keys: list with the first key of each page
+
+    """
+    dtype = acc2taxid_dtype(key_width)
+    positions = [0] * len(runs)
+    n_records = 0
+    page_keys = []
+    while any(position < len(run) for position, run in zip(positions, runs)):
+        blocks = [run[position:position + block_size].astype(dtype) for position, run in zip(positions, runs)]
+        open_blocks = [block for block, position, run in zip(blocks, positions, runs)
+                       if len(block) and position + len(block) < len(run)]
+        threshold = min(block["key"][-1] for block in open_blocks) if open_blocks else None
+
+        parts = []
+        for i, block in enumerate(blocks):
+            take = len(block) if threshold is None else int(np.searchsorted(block["key"], threshold, side="right"))
+            parts.append(block[:take])
+            positions[i] += take
+        records = np.concatenate(parts)
+        records = records[np.argsort(records["key"], kind="stable")]
+
+        first_page = -(-n_records // page_size)
+        page_starts = np.arange(first_page * page_size, n_records + len(records), page_size) - n_records
+        page_keys.extend(records["key"][page_starts].tolist())
+        records.tofile(output_file_open)
+        n_records += len(records)
+
+    return n_records, page_keys
+
+
+def build_acc2taxid_index(acc2taxid_file, acc2taxid_index, page_size=4096, chunksize=20000000):
+    """
+    Build a sorted accession2taxid index.
+
+    The accessions (without version) and taxIDs of the accession2taxid table (e.g. prot.accession2taxid.gz from
+    ftp://ftp.ncbi.nih.gov/pub/taxonomy/accession2taxid/) are written as fixed-width records sorted by accession,
+    followed by a sparse page index with the first accession of every `page_size` records. The table is sorted in runs
+    of `chunksize` rows in a temporary directory next to the index, which are merged afterwards.
+
+    Parameters
+    ----------
+      acc2taxid_file: the accession2taxid table (with the columns accession and taxid, optionally compressed)
+      acc2taxid_index: output index file
+      page_size: number of records per page (default: 4096)
+      chunksize: number of rows per sorted run (default: 20000000)
+
+    Returns
+    -------
+      None
+
+    """
+    import pandas as pd
+    import shutil
+    import tempfile
+
+    tmp_dir = tempfile.mkdtemp(prefix=".mptk_acc2taxid_", dir=os.path.dirname(os.path.abspath(acc2taxid_index)))
+    tmp_file = "%s.%d.tmp" % (acc2taxid_index, os.getpid())
+    try:
+        run_files = []
+        key_width = 1
+        chunks = pd.read_csv(acc2taxid_file, sep="\t", header=0, usecols=["accession", "taxid"],
+                             dtype={"accession": str, "taxid": np.int32}, chunksize=chunksize)
+        for chunk in chunks:
+            keys = chunk["accession"].to_numpy().astype("S")
+            records = np.empty(len(keys), dtype=acc2taxid_dtype(keys.dtype.itemsize))
+            records["key"] = keys
+            records["taxid"] = chunk["taxid"].to_numpy()
+            run_files.append(os.path.join(tmp_dir, "run%d.npy" % len(run_files)))
+            np.save(run_files[-1], records[np.argsort(records["key"], kind="stable")])
+            key_width = max(key_width, keys.dtype.itemsize)
+            logger.info("sorted run %d (%d accessions)", len(run_files), len(records))
+
+        runs = [np.load(run_file, mmap_mode="r") for run_file in run_files]
+        with open(tmp_file, "wb") as index_file_open:
+            index_file_open.write(ACC2TAXID_HEADER.pack(ACC2TAXID_MAGIC, 0, 0, 0, 0, 0))
+            n_records, page_keys = merge_acc2taxid_runs(runs, index_file_open, key_width=key_width,
+                                                        page_size=page_size)
+            index_offset = index_file_open.tell()
+            np.array(page_keys, dtype="S%d" % key_width).tofile(index_file_open)
+            index_file_open.seek(0)
+            index_file_open.write(ACC2TAXID_HEADER.pack(ACC2TAXID_MAGIC, key_width, page_size, n_records,
+                                                        len(page_keys), index_offset))
+        del runs
+        os.replace(tmp_file, acc2taxid_index)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+    logger.info("wrote %d accessions in %d pages to %s", n_records, len(page_keys), acc2taxid_index)
+
+    return None
+
+
+def is_acc2taxid_index(file_name):
+    """
+    Check if a file is an accession2taxid index.
+
+    Parameters
+    ----------
+      file_name: the file to check
+
+    Returns
+    -------
+      True if the file starts with the accession2taxid index magic bytes
+
+    """
+    with open(file_name, "rb") as file_open:
+        return file_open.read(len(ACC2TAXID_MAGIC)) == ACC2TAXID_MAGIC
+
+
+def read_acc2taxid_index(acc2taxid_index):
+    """
+    Open an accession2taxid index.
+
+    Parameters
+    ----------
+      acc2taxid_index: index file written by `build_acc2taxid_index`
+
+    Returns
+    -------
+      records: memory mapped array with the fields key and taxid
+      page_keys: array with the first key of each page
+      page_size: number of records per page
+
+    """
+    with open(acc2taxid_index, "rb") as index_file_open:
+        magic, key_width, page_size, n_records, n_pages, index_offset = ACC2TAXID_HEADER.unpack(
+            index_file_open.read(ACC2TAXID_HEADER.size))
+        if magic != ACC2TAXID_MAGIC:
+            raise ValueError("%s is not an accession2taxid index" % acc2taxid_index)
+        index_file_open.seek(index_offset)
+        page_keys = np.fromfile(index_file_open, dtype="S%d" % key_width, count=n_pages)
+    if n_records == 0:
+        return np.empty(0, dtype=acc2taxid_dtype(key_width)), page_keys, page_size
 
-    return ncbi_tax_dict
+    records = np.memmap(acc2taxid_index, dtype=acc2taxid_dtype(key_width), mode="r", offset=ACC2TAXID_HEADER.size,
+                        shape=(n_records,))
+
+    return records, page_keys, page_size
+
+
+def lookup_acc2taxid(acc2taxid_index, accessions):
+    """
+    Look up the taxIDs of a batch of accessions in an accession2taxid index.
+
+    The page of each accession is found in the sparse page index, then all accessions are searched at once by a
+    binary search within their pages, which only touches a few records of the memory mapped index per accession.
+    Version suffixes (e.g. ".1") are removed from the accessions.
+
+    Parameters
+    ----------
+      acc2taxid_index: index file written by `build_acc2taxid_index`
+      accessions: array of accessions (str)
+
+    Returns
+    -------
+      taxids: array (int32) with the taxID of each accession (-1 if not found)
+
+    """
+    records, page_keys, page_size = read_acc2taxid_index(acc2taxid_index)
+    key_width = page_keys.dtype.itemsize
+    taxids = np.full(len(accessions), -1, dtype=np.int32)
+    if not len(records) or not len(accessions):
+        return taxids
+
+    accessions = np.char.encode(np.asarray(accessions, dtype="U"), "utf-8")
+    head, separator, version = np.char.rpartition(accessions, b".").T
+    accessions = np.where((separator == b".") & np.char.isdigit(version), head, accessions)
+
+    # keys longer than the key width would be truncated
+    query = np.flatnonzero((np.char.str_len(accessions) <= key_width) & (np.char.str_len(accessions) > 0))
+    keys = accessions[query].astype("S%d" % key_width)
+    pages = np.maximum(np.searchsorted(page_keys, keys, side="right") - 1, 0)
+    low = pages.astype(np.int64) * page_size
+    high = np.minimum(low + page_size, len(records))
+    # leftmost position with a key >= the query key within the page
+    while True:
+        searching = low < high
+        if not searching.any():
+            break
+        searching = np.flatnonzero(searching)
+        middle = (low[searching] + high[searching]) // 2
+        smaller = records["key"][middle] < keys[searching]
+        low[searching[smaller]] = middle[smaller] + 1
+        high[searching[~smaller]] = middle[~smaller]
+
+    found = low < len(records)
+    found[found] = records["key"][low[found]] == keys[found]
+    taxids[query[found]] = records["taxid"][low[found]]
+
+    return taxids
 
 
 def parse_uniprot_file(uniprot_file, uniprot_table, go_annotation=False):
@@ -170,27 +667,222 @@ def parse_uniprot_file(uniprot_file, uniprot_table, go_annotation=False):
     return None
 
 
-def parse_diamond_output(diamond_file):
+DIAMOND_COLUMNS = ["qseqid", "sseqid", "pident", "length", "mismatch", "gapopen", "qstart", "qend", "sstart", "send",
+                   "evalue", "bitscore"]
+# e-values are kept as float64, as float32 would round values below 1e-38 to zero
+DIAMOND_DTYPES = {"qseqid": "category", "sseqid": "category", "pident": np.float32, "length": np.int32,
+                  "mismatch": np.int32, "gapopen": np.int32, "qstart": np.int32, "qend": np.int32, "sstart": np.int32,
+                  "send": np.int32, "evalue": np.float64, "bitscore": np.float32}
+
+
+def read_diamond_table(diamond_file, columns=None, dtypes=None, engine=None, chunksize=None):
+    """
+    Read a diamond output table (format 6 with the default columns) with compact column types.
+
+    Only the requested columns are parsed. IDs are read as categoricals and scores as 32 bit numbers (see
+    `DIAMOND_DTYPES`), which takes a fraction of the memory of the inferred object and 64 bit columns.
+
+    Parameters
+    ----------
+      diamond_file: diamond output file
+      columns: list of columns to read (default: None, all columns in `DIAMOND_COLUMNS`)
+      dtypes: dict with column types that replace the defaults of `DIAMOND_DTYPES` (default: None)
+      engine: parser engine of `pandas.read_csv`, e.g. pyarrow (default: None, the pandas default)
+      chunksize: number of rows per chunk (default: None, read the whole table)
+
+    Returns
+    -------
+      df: a pandas data frame of the diamond output (or an iterator of data frames if `chunksize` is set)
+
+    """
+    import pandas as pd
+
+    if engine == "pyarrow" and chunksize:
+        raise ValueError("the pyarrow engine cannot read diamond tables in chunks")
+
+    columns = columns or DIAMOND_COLUMNS
+    dtype = dict((column, DIAMOND_DTYPES[column]) for column in columns)
+    dtype.update(dtypes or {})
+
+    return pd.read_csv(diamond_file, sep="\t", header=None, names=DIAMOND_COLUMNS, usecols=columns, dtype=dtype,
+                       engine=engine, chunksize=chunksize)
+
+
+def parse_diamond_output(diamond_file, columns=None, dtypes=None):
     """
     Read the output table created by diamond and return a corresponding pandas data frame from it.
 
-    The function `parse_diamond_output` reads the diamond table and returns a pandas data frame.
+    The function `parse_diamond_output` reads the diamond table with `read_diamond_table` and returns a pandas data
+    frame.
 
     Parameters
     ----------
       diamond_file: diamond output file
+      columns: list of columns to read (default: None, all columns)
+      dtypes: dict with column types that replace the defaults of `DIAMOND_DTYPES` (default: None)
 
     Returns
     -------
       df: a pandas data frame of the diamond output
 
     """
-    column_names = ["qseqid", "sseqid", "pident", "length", "mismatch", "gapopen", "qstart", "qend", "sstart", "send", "evalue", "bitscore"]
-    df = pd.read_csv(diamond_file, sep="\t", header=None, names=column_names)
+    df = read_diamond_table(diamond_file=diamond_file, columns=columns, dtypes=dtypes)
+
+    return df
+
+
+PROTEINPILOT_COLUMNS = ["N", "Accession", "Peptides(95%)"]
+
+
+def get_file_sha1(file_name):
+    """
+    Calculate the SHA-1 digest of a file.
+
+    Parameters
+    ----------
+      file_name: the file
+
+    Returns
+    -------
+      the hexadecimal digest
+
+    """
+    h = hashlib.sha1()
+    with open(file_name, "rb") as file_open:
+        for block in iter(lambda: file_open.read(1048576), b""):
+            h.update(block)
+
+    return h.hexdigest()
+
+
+def convert_proteinpilot_file(excel_file):
+    """
+    Read the columns N, Accession, and Peptides(95%) of the first sheet of a ProteinPilot result Excel file.
+
+    The workbook is streamed in read-only mode and only the values of the three columns are kept. The accessions are
+    cut at the first "|".
+
+    Parameters
+    ----------
+      excel_file: the ProteinPilot result excel file
+
+    Returns
+    -------
+      df: a data frame with the columns N, Accession, and Peptides(95%)
+
+    """
+    import openpyxl
+    import pandas as pd
+
+    workbook = openpyxl.load_workbook(excel_file, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = list(next(rows, ()))
+        missing = [column for column in PROTEINPILOT_COLUMNS if column not in header]
+        if missing:
+            raise ValueError("columns %s not found in %s" % (", ".join(missing), excel_file))
+        positions = [header.index(column) for column in PROTEINPILOT_COLUMNS]
+        data = [[row[i] if i < len(row) else None for i in positions] for row in rows]
+    finally:
+        workbook.close()
+
+    # like pandas.read_excel, trailing empty rows are dropped
+    while data and all(value is None for value in data[-1]):
+        data.pop()
+
+    df = pd.DataFrame(data, columns=PROTEINPILOT_COLUMNS)
+    df["Accession"] = df["Accession"].str.split("|", expand=False).str[0]
+
+    return df
+
+
+def read_proteinpilot_file(excel_file, cache_dir=None):
+    """
+    Read the columns N, Accession, and Peptides(95%) of a ProteinPilot result Excel file through a cache.
+
+    The first call converts the workbook with `convert_proteinpilot_file` and writes the columns into a sidecar file
+    named after the SHA-1 digest of the workbook (Feather if pyarrow is installed, otherwise a pickle). Later calls on
+    the same workbook, e.g. by subset_sequences, protein_groups and export_tables, read the sidecar instead of parsing
+    the workbook again. A changed workbook gets a new sidecar.
+
+    Parameters
+    ----------
+      excel_file: the ProteinPilot result excel file
+      cache_dir: directory of the sidecar files (default: None, the directory of the excel file)
+
+    Returns
+    -------
+      df: a data frame with the columns N, Accession, and Peptides(95%)
+
+    """
+    import pandas as pd
+
+    try:
+        import pyarrow
+        suffix = "feather"
+    except ImportError:
+        suffix = "pkl"
+
+    if cache_dir is None:
+        cache_dir = os.path.dirname(os.path.abspath(excel_file))
+    cache_file = os.path.join(cache_dir, ".%s.%s.%s" % (os.path.basename(excel_file), get_file_sha1(excel_file),
+                                                         suffix))
+
+    if os.path.isfile(cache_file):
+        logger.info("reading cached ProteinPilot columns from %s ...", cache_file)
+        if suffix == "feather":
+            return pd.read_feather(cache_file)
+        return pd.read_pickle(cache_file)
+
+    logger.info("converting ProteinPilot file %s ...", excel_file)
+    df = convert_proteinpilot_file(excel_file)
+    tmp_file = "%s.%d.tmp" % (cache_file, os.getpid())
+    try:
+        if suffix == "feather":
+            df.to_feather(tmp_file)
+        else:
+            df.to_pickle(tmp_file, compression=None)
+        os.replace(tmp_file, cache_file)
+    except Exception as e:
+        # the cache is optional, e.g. pyarrow cannot write object columns with mixed types
+        logger.warning("could not write cache %s: %s", cache_file, e)
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        return df
+
+    remove_old_sidecars(excel_file=excel_file, cache_file=cache_file)
 
     return df
 
 
+def remove_old_sidecars(excel_file, cache_file):
+    """
+    Remove the sidecar files of older revisions of a ProteinPilot result file (see `read_proteinpilot_file`).
+
+    Parameters
+    ----------
+      excel_file: the ProteinPilot result excel file
+      cache_file: the sidecar file of the current revision (kept)
+
+    Returns
+    -------
+      None
+
+    """
+    cache_dir = os.path.dirname(cache_file)
+    sidecar_regex = re.compile(r"^\.%s\.[0-9a-f]{40}\.(feather|pkl)$" % re.escape(os.path.basename(excel_file)))
+    for file_name in os.listdir(cache_dir):
+        file_path = os.path.join(cache_dir, file_name)
+        if sidecar_regex.match(file_name) and file_path != cache_file:
+            try:
+                os.remove(file_path)
+                logger.info("removed outdated cache %s", file_path)
+            except OSError as e:
+                logger.warning("could not remove outdated cache %s: %s", file_path, e)
+
+    return None
+
+
 def map_protein_groups(diamond_file, excel_file, diamond_file_protein_groups):
     """
     Replaces protein ids with protein groups in diamond output file.
@@ -209,12 +901,31 @@ def map_protein_groups(diamond_file, excel_file, diamond_file_protein_groups):
       None
 
     """
-    column_names = ["qseqid", "sseqid", "pident", "length", "mismatch", "gapopen", "qstart", "qend", "sstart", "send", "evalue", "bitscore"]
-    diamond_df = pd.read_csv(diamond_file, sep="\t", header=None, names=column_names)
+    diamond_df = read_diamond_table(diamond_file=diamond_file)
+    diamond_df = assign_protein_groups(diamond_df=diamond_df, excel_df=read_proteinpilot_file(excel_file))
+
+    diamond_df.to_csv(diamond_file_protein_groups, sep="\t", encoding="utf-8", index=False, header=False)
+
+    return None
+
+
+def assign_protein_groups(diamond_df, excel_df):
+    """
+    Replaces protein ids with protein groups in a diamond data frame.
+
+    Parameters
+    ----------
+      diamond_df: data frame of the diamond output (at least qseqid and bitscore)
+      excel_df: data frame with the columns N and Accession of the ProteinPilot result excel file
+
+    Returns
+    -------
+      diamond_df: the diamond data frame with protein groups as qseqid, sorted by qseqid and bitscore
+
+    """
+    import pandas as pd
 
-    excel_df = pd.read_excel(excel_file)
     excel_df = excel_df[["N", "Accession"]]
-    excel_df["Accession"] = excel_df["Accession"].str.split("|", expand=False).str[0]
 
     diamond_df = pd.merge(left=diamond_df, right=excel_df.set_index("Accession"), how="left", left_on="qseqid",
                           right_index=True, sort=False)
@@ -222,45 +933,149 @@ def map_protein_groups(diamond_file, excel_file, diamond_file_protein_groups):
     diamond_df = diamond_df.drop("N", axis=1)
     diamond_df = diamond_df.sort_values(by=["qseqid", "bitscore"], ascending=[True, False])
 
-    diamond_df.to_csv(diamond_file_protein_groups, sep="\t", encoding="utf-8", index=False, header=False)
+    return diamond_df
 
-    return None
 
+def select_group_representatives(excel_df):
+    """
+    Select one protein per protein group.
+
+    The representative of a group is the first protein (in file order) with the most peptides (95%).
+
+    Parameters
+    ----------
+      excel_df: data frame with the columns N, Accession, and Peptides(95%)
+
+    Returns
+    -------
+      df: data frame with one row per protein group, sorted by N
 
-def export_result_tables(excel_file, annotated_table, output_table):
     """
-    The function `export_result_tables` merges the excel file with the annotations.
+    df = excel_df.sort_values(["N", "Peptides(95%)"], ascending=[True, False], kind="mergesort")
+    df = df.drop_duplicates(subset="N", keep="first").reset_index(drop=True)
 
-    The columns of interest from the Excel file are merged and exported with the annotations (including taxonomy
-    inferred from MEGAN/LCA and function based on COG or UniProt).
+    return df
+
+
+def reduce_annotated_table(df_annotated, label=None):
+    """
+    Reduce an annotated table to one row per protein group.
+
+    For each column, the first value (in file order) that is not empty is kept. With a label, the annotation columns
+    are prefixed with it.
+
+    Parameters
+    ----------
+      df_annotated: table containing protein group and annotation (taxonomy or function)
+      label: prefix of the annotation columns (default: None, no prefix)
+
+    Returns
+    -------
+      df: data frame with the annotations indexed by protein group
+
+    """
+    df = df_annotated.groupby("protein_group", sort=False).first()
+    if label:
+        df = df.add_prefix(label + "_")
+
+    return df
+
+
+def export_combined_tables(excel_file, annotated_tables, output_table, labels=None, header_tsv=None,
+                           header_index=None):
+    """
+    The function `export_combined_tables` merges the excel file with several annotated tables.
+
+    The excel file is read once and one representative protein per protein group is selected (see
+    `select_group_representatives`). The annotations of all tables (e.g. taxonomy, COG, and UniProt) are joined
+    column-wise onto the representatives and exported as one table.
 
     Parameters
     ----------
       excel_file: the ProteinPilot result excel file
-      annotated_table: table containing protein group and annotation (taxonomy or function)
+      annotated_tables: list of tables containing protein group and annotation (taxonomy or function)
       output_table: file of merged table
+      labels: list of prefixes for the annotation columns of each table (default: None, no prefixes)
+      header_tsv: tsv file with hashed and original headers (default: None)
+      header_index: index of the header tsv file, if set the original headers are added (default: None)
 
     Returns
     -------
       None
 
     """
-    excel_df = pd.read_excel(excel_file)
-    excel_df = excel_df[["N", "Accession", "Peptides(95%)"]]
-    excel_df["Accession"] = excel_df["Accession"].str.split("|", expand=False).str[0]
+    import pandas as pd
+
+    if labels and len(labels) != len(annotated_tables):
+        raise ValueError("%d labels given for %d annotated tables" % (len(labels), len(annotated_tables)))
+
+    annotated_dfs = [pd.read_csv(annotated_table, sep="\t") for annotated_table in annotated_tables]
+    merged_df = combine_annotations(excel_df=read_proteinpilot_file(excel_file), annotated_dfs=annotated_dfs,
+                                    labels=labels, header_tsv=header_tsv, header_index=header_index)
+
+    merged_df.to_csv(output_table, sep="\t", encoding="utf-8", index=False, header=True)
+
+    return None
+
+
+def combine_annotations(excel_df, annotated_dfs, labels=None, header_tsv=None, header_index=None):
+    """
+    Join the annotations of several annotated data frames onto the representatives of the protein groups.
 
-    df_annotated = pd.read_csv(annotated_table, sep="\t")
-    merged_df = pd.merge(left=excel_df, right=df_annotated.set_index("protein_group"), how="left", left_on="N",
-                         right_index=True, sort=False)
+    Parameters
+    ----------
+      excel_df: data frame with the columns N, Accession, and Peptides(95%) of the ProteinPilot result excel file
+      annotated_dfs: list of data frames containing protein group and annotation (taxonomy or function)
+      labels: list of prefixes for the annotation columns of each data frame (default: None, no prefixes)
+      header_tsv: tsv file with hashed and original headers (default: None)
+      header_index: index of the header tsv file, if set the original headers are added (default: None)
+
+    Returns
+    -------
+      merged_df: data frame with one row per protein group
 
-    # https://stackoverflow.com/a/15705958/5013084
-    idx = merged_df.groupby(["N"])["Peptides(95%)"].transform(max) == merged_df["Peptides(95%)"]
-    merged_df = merged_df[idx]
+    """
+    merged_df = select_group_representatives(excel_df)
 
+    if header_index:
+        merged_df = hash_headers.add_original_headers(df=merged_df, column="Accession", tsv_file=header_tsv,
+                                                      index_file=header_index)
     merged_df.drop("Accession", axis=1, inplace=True)
-    merged_df = merged_df.groupby("N").first().reset_index()
 
-    merged_df.to_csv(output_table, sep="\t", encoding="utf-8", index=False, header=True)
+    for i, annotated_df in enumerate(annotated_dfs):
+        label = labels[i] if labels else None
+        df_annotated = reduce_annotated_table(annotated_df, label=label)
+        duplicated = merged_df.columns.intersection(df_annotated.columns)
+        if len(duplicated):
+            raise ValueError("columns %s of annotated table %d are already in the table, use labels to prefix them"
+                             % (", ".join(duplicated), i + 1))
+        merged_df = merged_df.join(df_annotated, on="N")
+
+    return merged_df
+
+
+def export_result_tables(excel_file, annotated_table, output_table, header_tsv=None, header_index=None):
+    """
+    The function `export_result_tables` merges the excel file with the annotations.
+
+    The columns of interest from the Excel file are merged and exported with the annotations (including taxonomy
+    inferred from MEGAN/LCA and function based on COG or UniProt).
+
+    Parameters
+    ----------
+      excel_file: the ProteinPilot result excel file
+      annotated_table: table containing protein group and annotation (taxonomy or function)
+      output_table: file of merged table
+      header_tsv: tsv file with hashed and original headers (default: None)
+      header_index: index of the header tsv file, if set the original headers are added (default: None)
+
+    Returns
+    -------
+      None
+
+    """
+    export_combined_tables(excel_file=excel_file, annotated_tables=[annotated_table], output_table=output_table,
+                           header_tsv=header_tsv, header_index=header_index)
 
     return None
 
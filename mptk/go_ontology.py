@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+
+"""
+Roll GO annotations up the Gene Ontology.
+
+This module parses the GO ontology (OBO file) and precomputes the ancestor closure of each term (the term itself and
+all terms reachable over `is_a` and `part_of` relations) as CSR arrays. The closure is written with
+`general_functions.write_array_cache`, so it is loaded as memory maps, and is used to roll the GO terms of the UniProt
+table up to a GO slim or to a fixed depth of the ontology with vectorized lookups.
+"""
+
+import logging
+import numpy as np
+import pandas as pd
+import re
+from collections import deque
+from mptk import general_functions
+
+logger = logging.getLogger("mptk.go_ontology")
+
+GO_ID_WIDTH = 10
+NAMESPACES = {"biological_process": "P", "molecular_function": "F", "cellular_component": "C"}
+
+
+def parse_obo_file(obo_file):
+    """
+    Parse the terms of a GO ontology file.
+
+    Obsolete terms are skipped. Only the relations `is_a` and `part_of` are kept.
+
+    Parameters
+    ----------
+      obo_file: the GO ontology file (e.g. go-basic.obo from http://geneontology.org/docs/download-ontology/)
+
+    Returns
+    -------
+      terms: dict with GO IDs as keys and dicts with name, namespace, parents and alt_ids as values
+
+    """
+    terms = {}
+    term = None
+    with open(obo_file, "r", encoding="utf-8") as obo_file_open:
+        for line in obo_file_open:
+            line = line.strip()
+            if line.startswith("["):
+                if term and not term["obsolete"]:
+                    terms[term["id"]] = term
+                term = {"id": None, "name": "", "namespace": "", "parents": [], "alt_ids": [], "obsolete": False} \
+                    if line == "[Term]" else None
+            elif term is None or ": " not in line:
+                continue
+            else:
+                tag, value = line.split(": ", 1)
+                value = value.split(" ! ", 1)[0].strip()
+                if tag == "id":
+                    term["id"] = value
+                elif tag == "name":
+                    term["name"] = value
+                elif tag == "namespace":
+                    term["namespace"] = value
+                elif tag == "is_a":
+                    term["parents"].append(value.split()[0])
+                elif tag == "relationship" and value.startswith("part_of "):
+                    term["parents"].append(value.split()[1])
+                elif tag == "alt_id":
+                    term["alt_ids"].append(value)
+                elif tag == "is_obsolete" and value == "true":
+                    term["obsolete"] = True
+        if term and not term["obsolete"]:
+            terms[term["id"]] = term
+
+    return terms
+
+
+def build_go_closure(obo_file, go_closure):
+    """
+    Build the ancestor closure of the GO terms.
+
+    The closure contains the sorted GO IDs with their names, namespaces and depths (length of the shortest path to the
+    root of the namespace), the alternative GO IDs with their terms, and the ancestors of each term (including the term
+    itself) as CSR arrays (`ancestor_indptr`, `ancestor_indices`).
+
+    Parameters
+    ----------
+      obo_file: the GO ontology file
+      go_closure: output closure file
+
+    Returns
+    -------
+      None
+
+    """
+    terms = parse_obo_file(obo_file)
+    go_ids = sorted(terms)
+    position = {go_id: i for i, go_id in enumerate(go_ids)}
+    parents = [[position[parent] for parent in terms[go_id]["parents"] if parent in position] for go_id in go_ids]
+
+    # parents before children, so the ancestors of all parents are known when a term is visited
+    children = [[] for _ in go_ids]
+    n_parents = np.zeros(len(go_ids), dtype=np.int64)
+    for child, term_parents in enumerate(parents):
+        n_parents[child] = len(term_parents)
+        for parent in term_parents:
+            children[parent].append(child)
+    queue = deque(np.flatnonzero(n_parents == 0).tolist())
+    ancestors = [None] * len(go_ids)
+    depths = np.zeros(len(go_ids), dtype=np.int16)
+    visited = 0
+    while queue:
+        term = queue.popleft()
+        visited += 1
+        term_ancestors = {term}
+        for parent in parents[term]:
+            term_ancestors.update(ancestors[parent])
+        ancestors[term] = term_ancestors
+        if parents[term]:
+            depths[term] = min(depths[parent] for parent in parents[term]) + 1
+        for child in children[term]:
+            n_parents[child] -= 1
+            if n_parents[child] == 0:
+                queue.append(child)
+    if visited != len(go_ids):
+        raise ValueError("the ontology in %s contains cycles" % obo_file)
+
+    lengths = np.array([len(term_ancestors) for term_ancestors in ancestors], dtype=np.int64)
+    ancestor_indptr = np.zeros(len(go_ids) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=ancestor_indptr[1:])
+    ancestor_indices = np.fromiter((ancestor for term_ancestors in ancestors for ancestor in sorted(term_ancestors)),
+                                   dtype=np.int32, count=int(ancestor_indptr[-1]))
+
+    alt_ids = sorted((alt_id, position[go_id]) for go_id in go_ids for alt_id in terms[go_id]["alt_ids"])
+    namespace_letters = [NAMESPACES.get(terms[go_id]["namespace"], "") for go_id in go_ids]
+
+    arrays = {"term_ids": np.array(go_ids, dtype="S%d" % GO_ID_WIDTH),
+              "term_names": np.char.encode(np.array([terms[go_id]["name"] for go_id in go_ids], dtype="U"), "utf-8"),
+              "term_namespaces": np.array(namespace_letters, dtype="S1"),
+              "term_depths": depths,
+              "alt_ids": np.array([alt_id for alt_id, _ in alt_ids], dtype="S%d" % GO_ID_WIDTH),
+              "alt_terms": np.array([term for _, term in alt_ids], dtype=np.int32),
+              "ancestor_indptr": ancestor_indptr,
+              "ancestor_indices": ancestor_indices}
+    general_functions.write_array_cache(cache_file=go_closure, source_file=obo_file, arrays=arrays)
+    logger.info("wrote the closure of %d GO terms (%d ancestors) to %s", len(go_ids), len(ancestor_indices),
+                go_closure)
+
+    return None
+
+
+def load_go_closure(go_closure):
+    """
+    Load a GO closure written by `build_go_closure`.
+
+    Parameters
+    ----------
+      go_closure: the closure file
+
+    Returns
+    -------
+      dict with the arrays of the closure
+
+    """
+    arrays = general_functions.read_array_cache(cache_file=go_closure)
+    if arrays is None:
+        raise ValueError("%s is not a GO closure" % go_closure)
+
+    return arrays
+
+
+def get_term_indices(closure, go_ids):
+    """
+    Look up the term indices of GO IDs (primary or alternative IDs).
+
+    Parameters
+    ----------
+      closure: the arrays of the GO closure
+      go_ids: GO IDs (str)
+
+    Returns
+    -------
+      term indices (-1 for unknown GO IDs)
+
+    """
+    go_ids = np.asarray(go_ids, dtype="S%d" % GO_ID_WIDTH)
+    indices = np.full(len(go_ids), -1, dtype=np.int64)
+    for keys, values in [(closure["alt_ids"], closure["alt_terms"]), (closure["term_ids"], None)]:
+        if not len(keys):
+            continue
+        positions = np.minimum(np.searchsorted(keys, go_ids), len(keys) - 1)
+        found = keys[positions] == go_ids
+        indices[found] = positions[found] if values is None else values[positions[found]]
+
+    return indices
+
+
+def read_go_slim(go_slim, closure):
+    """
+    Read the GO IDs of a GO slim.
+
+    Parameters
+    ----------
+      go_slim: GO slim ontology file (e.g. goslim_generic.obo) or text file with GO IDs
+      closure: the arrays of the GO closure
+
+    Returns
+    -------
+      boolean array with the slim terms set
+
+    """
+    with open(go_slim, "r", encoding="utf-8") as go_slim_open:
+        content = go_slim_open.read()
+    if "[Term]" in content:
+        go_ids = re.findall(r"^id:\s*(GO:\d{7})", content, flags=re.MULTILINE)
+    else:
+        go_ids = re.findall(r"GO:\d{7}", content)
+
+    indices = get_term_indices(closure, go_ids)
+    if (indices < 0).any():
+        logger.warning("ignoring %d unknown GO IDs of the GO slim", int((indices < 0).sum()))
+    is_slim = np.zeros(len(closure["term_ids"]), dtype=bool)
+    is_slim[indices[indices >= 0]] = True
+
+    return is_slim
+
+
+def expand_csr(indptr, indices, rows):
+    """
+    Return the entries of the given rows of a CSR structure.
+
+    Parameters
+    ----------
+      indptr: row pointers
+      indices: entries
+      rows: row numbers
+
+    Returns
+    -------
+      owners: position in `rows` of each entry
+      values: the entries
+
+    """
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    owners = np.repeat(np.arange(len(rows)), lengths)
+    offsets = np.arange(len(owners)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+    return owners, indices[np.repeat(starts, lengths) + offsets]
+
+
+def roll_up_go_table(uniprot_table_df, go_closure, go_slim=None, go_depth=None):
+    """
+    Replace the GO terms of a UniProt GO table with their ancestors.
+
+    Each GO term is replaced by all of its ancestors in the GO slim (`go_slim`), by its ancestors at depth `go_depth`
+    (terms above that depth are kept), or by all of its ancestors. Every term of an accession is reported once, even if
+    several of its GO terms share an ancestor. Unknown and obsolete GO terms are dropped.
+
+    Parameters
+    ----------
+      uniprot_table_df: data frame with the columns uniprot_id, GO_id and GO_category
+      go_closure: the GO closure written by `build_go_closure`
+      go_slim: GO slim ontology file or text file with GO IDs (default: None)
+      go_depth: depth of the rolled up terms (default: None)
+
+    Returns
+    -------
+      data frame with the columns uniprot_id, GO_id and GO_category
+
+    """
+    if go_slim and go_depth is not None:
+        raise ValueError("a GO slim and a GO depth cannot be used together")
+
+    closure = load_go_closure(go_closure)
+    go_ids = pd.Categorical(uniprot_table_df["GO_id"])
+    terms = get_term_indices(closure, go_ids.categories.astype(str))
+    known = terms >= 0
+    if not known.all():
+        logger.warning("dropping %d unknown or obsolete GO terms", int((~known).sum()))
+
+    # the rolled up terms of each distinct GO term of the table
+    owners, ancestors = expand_csr(closure["ancestor_indptr"], closure["ancestor_indices"], terms[known])
+    if go_slim:
+        selected = read_go_slim(go_slim, closure)[ancestors]
+    elif go_depth is not None:
+        depths = closure["term_depths"]
+        own_terms = terms[known][owners]
+        selected = (depths[ancestors] == go_depth) | ((ancestors == own_terms) & (depths[own_terms] < go_depth))
+    else:
+        selected = np.ones(len(ancestors), dtype=bool)
+    category_terms = np.full(len(terms), -1, dtype=np.int64)
+    category_terms[known] = np.arange(int(known.sum()))
+    counts = np.bincount(owners[selected], minlength=int(known.sum()))
+    rollup_indptr = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=rollup_indptr[1:])
+
+    # one row per accession and rolled up term
+    codes = np.where(go_ids.codes >= 0, category_terms[np.maximum(go_ids.codes, 0)], -1) if len(terms) else \
+        np.full(len(go_ids), -1, dtype=np.int64)
+    rows = np.flatnonzero(codes >= 0)
+    row_owners, row_terms = expand_csr(rollup_indptr, ancestors[selected], codes[rows])
+    df_rolled = pd.DataFrame({"uniprot_id": uniprot_table_df["uniprot_id"].to_numpy()[rows[row_owners]],
+                              "term": row_terms}).drop_duplicates()
+
+    target_terms = np.unique(df_rolled["term"].to_numpy())
+    target_ids = np.char.decode(closure["term_ids"][target_terms], "utf-8").astype(object)
+    target_namespaces = np.char.decode(closure["term_namespaces"][target_terms], "utf-8")
+    target_categories = np.char.add(np.char.add(target_namespaces, ":"),
+                                    np.char.decode(closure["term_names"][target_terms], "utf-8")).astype(object)
+    positions = np.searchsorted(target_terms, df_rolled["term"].to_numpy())
+    df_rolled = pd.DataFrame({"uniprot_id": df_rolled["uniprot_id"].to_numpy(), "GO_id": target_ids[positions],
+                              "GO_category": target_categories[positions]})
+    logger.info("rolled %d GO annotations up to %d annotations", len(uniprot_table_df), len(df_rolled))
+
+    return df_rolled
+
+
+# mPies (metaProteomics in environmental sciences) creates annotated databases for metaproteomics analysis.
+# Copyright 2018 Johannes Werner (Leibniz-Institute for Baltic Sea Research)
+# Copyright 2018 Augustin Geron (University of Mons, University of Stirling)
+# Copyright 2018 Sabine Matallana Surget (University of Stirling)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -6,11 +6,38 @@ This module hashes the headers of the proteome file.
 
 import hashlib
 import logging
+import multiprocessing
+import numpy as np
+from functools import partial
+from mptk import index_files
+from mptk.hash_types import BLAKE2_HASH_TYPES
 
 logger = logging.getLogger("mptk.hashing")
 
 
-def write_hashed_protein_header_fasta_file(input_file, output_file, tsv_file, hash_type):
+def new_hash(hash_type, digest_size=None):
+    """
+    Create a new hash object.
+
+    Parameters
+    ----------
+      hash_type: hash algorithm to use
+      digest_size: size of the digest in bytes (only for blake2b and blake2s, default: None)
+
+    Returns
+    -------
+      the hash object
+
+    """
+    if digest_size is None:
+        return hashlib.new(hash_type)
+    if hash_type not in BLAKE2_HASH_TYPES:
+        raise ValueError("a digest size can only be set for %s" % " and ".join(BLAKE2_HASH_TYPES))
+
+    return hashlib.new(hash_type, digest_size=digest_size)
+
+
+def write_hashed_protein_header_fasta_file(input_file, output_file, tsv_file, hash_type, digest_size=None):
     """
     Hash headers of proteome file.
 
@@ -28,12 +55,13 @@ def write_hashed_protein_header_fasta_file(input_file, output_file, tsv_file, ha
       output_file: output proteome file with hashed headers
       tsv_file: output tsv file
       hash_type: hash algorithm to use
+      digest_size: size of the digest in bytes (only for blake2b and blake2s, default: None)
 
     Returns
     -------
       None
     """
-    h = hashlib.new(hash_type)
+    h = new_hash(hash_type, digest_size)
 
     with open(input_file) as input_file_open, open(output_file, "w") as output_file_open, open(tsv_file, "w") as tsv_file_open:
         for line in input_file_open:
@@ -49,6 +77,251 @@ def write_hashed_protein_header_fasta_file(input_file, output_file, tsv_file, ha
 
     return
 
+def iter_fasta_chunks(input_file, chunk_size):
+    """
+    Read a fasta file in chunks that end at record boundaries.
+
+    Parameters
+    ----------
+      input_file: input fasta file
+      chunk_size: number of bytes to read at once (a chunk can be larger if a record is larger)
+
+    Returns
+    -------
+      generator of chunks (bytes), each chunk holds complete records
+
+    """
+    rest = b""
+    with open(input_file, "rb") as input_file_open:
+        while True:
+            block = input_file_open.read(chunk_size)
+            if not block:
+                if rest:
+                    yield rest
+                return
+            block = rest + block
+            cut = block.rfind(b"\n>")
+            if cut == -1:
+                rest = block
+            else:
+                yield block[:cut + 1]
+                rest = block[cut + 1:]
+
+
+def hash_fasta_chunk(chunk, hash_type, digest_size=None):
+    """
+    Hash the headers of all records in a chunk.
+
+    Each header gets its own independent digest, so the chunks can be hashed in any order.
+
+    Parameters
+    ----------
+      chunk: fasta records (bytes)
+      hash_type: hash algorithm to use
+      digest_size: size of the digest in bytes (only for blake2b and blake2s, default: None)
+
+    Returns
+    -------
+      fasta_block: the records with hashed headers (bytes)
+      tsv_block: the tsv lines mapping hashed headers to original headers (bytes)
+      digests: the concatenated binary digests (bytes)
+
+    """
+    fasta_lines = []
+    tsv_lines = []
+    digests = []
+
+    for line in chunk.splitlines(keepends=True):
+        if line.startswith(b">"):
+            header_substring = line.rstrip()[1:]
+            h = new_hash(hash_type, digest_size)
+            h.update(header_substring)
+            digest = h.digest()
+            hashed_header = digest.hex().encode("ascii")
+            fasta_lines.append(b">" + hashed_header + b"\n")
+            tsv_lines.append(b'"' + hashed_header + b'"\t' + header_substring + b"\n")
+            digests.append(digest)
+        else:
+            fasta_lines.append(line)
+
+    return b"".join(fasta_lines), b"".join(tsv_lines), b"".join(digests)
+
+
+def write_hashed_protein_header_fasta_file_parallel(input_file, output_file, tsv_file, hash_type, digest_size=None,
+                                                    threads=1, chunk_size=16777216):
+    """
+    Hash headers of proteome file with independent digests in parallel.
+
+    In contrast to `write_hashed_protein_header_fasta_file`, every header is hashed on its own, so the hashed header
+    of a record does not depend on the preceding records and can be reproduced for a single header. The input file is
+    split at record boundaries into chunks that are hashed by a process pool. The fasta and tsv outputs are written
+    in large blocks in the original order. After hashing, the digests are checked for collisions (or duplicated
+    headers), which raise a ValueError since the hashed headers have to be unique.
+
+    Parameters
+    ----------
+      input_file: input proteome file
+      output_file: output proteome file with hashed headers
+      tsv_file: output tsv file
+      hash_type: hash algorithm to use
+      digest_size: size of the digest in bytes (only for blake2b and blake2s, default: None)
+      threads: number of worker processes (default: 1)
+      chunk_size: approximate number of bytes per chunk (default: 16 MiB)
+
+    Returns
+    -------
+      None
+    """
+    hash_chunk = partial(hash_fasta_chunk, hash_type=hash_type, digest_size=digest_size)
+    size = new_hash(hash_type, digest_size).digest_size
+    digests = []
+
+    pool = multiprocessing.Pool(threads) if threads > 1 else None
+    try:
+        chunks = iter_fasta_chunks(input_file=input_file, chunk_size=chunk_size)
+        hashed_chunks = pool.imap(hash_chunk, chunks) if pool else map(hash_chunk, chunks)
+        with open(output_file, "wb", buffering=chunk_size) as output_file_open, \
+                open(tsv_file, "wb", buffering=chunk_size) as tsv_file_open:
+            for fasta_block, tsv_block, digest_block in hashed_chunks:
+                output_file_open.write(fasta_block)
+                tsv_file_open.write(tsv_block)
+                digests.append(digest_block)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    digests = np.sort(np.frombuffer(b"".join(digests), dtype="S%d" % size))
+    duplicated = np.unique(digests[1:][digests[1:] == digests[:-1]])
+    logger.info("hashed %d headers", len(digests))
+    if len(duplicated):
+        msg = "%d hashed headers are not unique (duplicated headers or hash collisions): %s" % (
+            len(duplicated), ", ".join(digest.ljust(size, b"\0").hex() for digest in duplicated[:5].tolist()))
+        raise ValueError(msg)
+
+    return None
+
+
+def write_header_index(tsv_file, index_file):
+    """
+    Index the tsv file that maps hashed headers to original headers.
+
+    The index is sorted by hashed header and stores the byte offset and length of the original header in the tsv file,
+    so the tsv file itself is used as string heap. Original headers can then be looked up by binary search without
+    loading the tsv file.
+
+    Parameters
+    ----------
+      tsv_file: tsv file created by `write_hashed_protein_header_fasta_file`
+      index_file: output index file
+
+    Returns
+    -------
+      None
+
+    """
+    keys = []
+    offsets = []
+    lengths = []
+    offset = 0
+
+    logger.info("indexing %s ...", tsv_file)
+    with open(tsv_file, "rb") as tsv_file_open:
+        for line in tsv_file_open:
+            tab = line.find(b"\t")
+            if tab != -1:
+                keys.append(line[:tab].strip(b'"'))
+                offsets.append(offset + tab + 1)
+                lengths.append(len(line.rstrip(b"\r\n")) - tab - 1)
+            offset += len(line)
+
+    index_files.write_offset_index(keys=keys, offsets=offsets, lengths=lengths, index_file=index_file)
+
+    return None
+
+
+def lookup_original_headers(hashed_headers, tsv_file, index_file):
+    """
+    Look up the original headers of hashed headers.
+
+    Parameters
+    ----------
+      hashed_headers: iterable of hashed headers
+      tsv_file: tsv file created by `write_hashed_protein_header_fasta_file`
+      index_file: index of the tsv file created by `write_header_index`
+
+    Returns
+    -------
+      original_headers: dict with hashed headers as keys and original headers as values
+
+    """
+    index = index_files.read_offset_index(index_file)
+    keys = {str(hashed_header).encode("utf-8") for hashed_header in hashed_headers}
+    found, missing = index_files.lookup_offsets(index=index, keys=keys)
+    if missing:
+        logger.warning("%d hashed headers not found in %s", len(missing), index_file)
+
+    original_headers = {}
+    for key, header in index_files.iter_indexed_entries(found=found, input_file=tsv_file):
+        original_headers[key.decode("utf-8")] = header.decode("utf-8")
+
+    return original_headers
+
+
+def add_original_headers(df, column, tsv_file, index_file):
+    """
+    Add the original headers (and the taxonomic lineage if present) to a data frame.
+
+    Parameters
+    ----------
+      df: the data frame
+      column: the column of the data frame with hashed headers
+      tsv_file: tsv file created by `write_hashed_protein_header_fasta_file`
+      index_file: index of the tsv file created by `write_header_index`
+
+    Returns
+    -------
+      df: the data frame with the additional columns original_header and lineage (only if TAX= is in the headers)
+
+    """
+    hashed_headers = df[column].dropna().astype(str)
+    original_headers = lookup_original_headers(hashed_headers=hashed_headers.unique(), tsv_file=tsv_file,
+                                               index_file=index_file)
+    df = df.copy()
+    df["original_header"] = hashed_headers.map(original_headers)
+    lineage = df["original_header"].str.extract(r"TAX=(.*)$", expand=False)
+    if lineage.notna().any():
+        df["lineage"] = lineage
+
+    return df
+
+
+def write_table_with_original_headers(input_table, column, tsv_file, index_file, output_table):
+    """
+    Join a tab-separated table with the original headers.
+
+    Parameters
+    ----------
+      input_table: tab-separated table with a header line
+      column: the column of the table with hashed headers
+      tsv_file: tsv file created by `write_hashed_protein_header_fasta_file`
+      index_file: index of the tsv file created by `write_header_index`
+      output_table: the joined output table
+
+    Returns
+    -------
+      None
+
+    """
+    import pandas as pd
+
+    df = pd.read_csv(input_table, sep="\t")
+    df = add_original_headers(df=df, column=column, tsv_file=tsv_file, index_file=index_file)
+    df.to_csv(output_table, sep="\t", encoding="utf-8", index=False, header=True)
+
+    return None
+
+
 # mPies (metaProteomics in environmental sciences) creates annotated databases for metaproteomics analysis.
 # Copyright 2018 Johannes Werner (Leibniz-Institute for Baltic Sea Research)
 # Copyright 2018 Augustin Geron (University of Mons, University of Stirling)
@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+
+"""
+Hash algorithms for the fasta headers.
+
+The names are kept in this module without further imports, so main.py can offer them as choices without loading
+`hash_headers`.
+"""
+
+BLAKE2_HASH_TYPES = ["blake2b", "blake2s"]
+HASH_TYPES = ["md5", "sha1", "sha256"] + BLAKE2_HASH_TYPES
+
+
+# mPies (metaProteomics in environmental sciences) creates annotated databases for metaproteomics analysis.
+# Copyright 2018 Johannes Werner (Leibniz-Institute for Baltic Sea Research)
+# Copyright 2018 Augustin Geron (University of Mons, University of Stirling)
+# Copyright 2018 Sabine Matallana Surget (University of Stirling)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
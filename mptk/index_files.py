@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+
+"""
+Create and query sorted byte-offset indices.
+
+This module writes sidecar indices that map a key (e.g. the hashed protein ID) to the byte offset and length of the
+corresponding entry in another file, similar to a `.fai` file. The index is a sorted fixed-width binary table, so it
+can be searched through a memory map without loading it.
+"""
+
+import logging
+import mmap
+import numpy as np
+import struct
+
+logger = logging.getLogger("mptk.index_files")
+
+INDEX_MAGIC = b"MPTKIDX1"
+INDEX_HEADER = struct.Struct("<8sIQ12x")
+
+
+def index_dtype(key_width):
+    """
+    Return the record type of an index with keys of the given width.
+
+    Parameters
+    ----------
+      key_width: number of bytes reserved for each key
+
+    Returns
+    -------
+      the numpy dtype of an index record
+
+    """
+    return np.dtype([("key", "S%d" % key_width), ("offset", "<u8"), ("length", "<u8")])
+
+
+def write_offset_index(keys, offsets, lengths, index_file):
+    """
+    Write a sorted offset index.
+
+    The records are sorted by key and written after a small header with the key width and the number of records.
+
+    Parameters
+    ----------
+      keys: list of keys (bytes)
+      offsets: list of byte offsets of the entries
+      lengths: list of byte lengths of the entries
+      index_file: output index file
+
+    Returns
+    -------
+      None
+
+    """
+    key_width = max((len(key) for key in keys), default=1)
+    records = np.empty(len(keys), dtype=index_dtype(key_width))
+    records["key"] = keys
+    records["offset"] = offsets
+    records["length"] = lengths
+    records = records[np.argsort(records["key"], kind="stable")]
+
+    duplicated = records["key"][1:] == records["key"][:-1]
+    if duplicated.any():
+        logger.warning("%d duplicated keys in index %s", int(duplicated.sum()), index_file)
+
+    with open(index_file, "wb") as index_file_open:
+        index_file_open.write(INDEX_HEADER.pack(INDEX_MAGIC, key_width, len(records)))
+        records.tofile(index_file_open)
+
+    return None
+
+
+def read_offset_index(index_file):
+    """
+    Open an offset index as a memory map.
+
+    Parameters
+    ----------
+      index_file: index file written by `write_offset_index`
+
+    Returns
+    -------
+      index: memory mapped numpy array with the fields key, offset and length
+
+    """
+    with open(index_file, "rb") as index_file_open:
+        magic, key_width, count = INDEX_HEADER.unpack(index_file_open.read(INDEX_HEADER.size))
+    if magic != INDEX_MAGIC:
+        raise ValueError("%s is not an mptk index file" % index_file)
+    if count == 0:
+        return np.empty(0, dtype=index_dtype(key_width))
+
+    return np.memmap(index_file, dtype=index_dtype(key_width), mode="r", offset=INDEX_HEADER.size, shape=(count,))
+
+
+def is_offset_index(file_name):
+    """
+    Check if a file is an offset index.
+
+    Parameters
+    ----------
+      file_name: the file to check
+
+    Returns
+    -------
+      True if the file starts with the index magic bytes
+
+    """
+    with open(file_name, "rb") as file_open:
+        return file_open.read(len(INDEX_MAGIC)) == INDEX_MAGIC
+
+
+def lookup_offsets(index, keys):
+    """
+    Look up a batch of keys by binary search.
+
+    Parameters
+    ----------
+      index: index returned by `read_offset_index`
+      keys: iterable of keys (bytes)
+
+    Returns
+    -------
+      found: the found index records (sorted by key)
+      missing: set of keys that are not in the index
+
+    """
+    key_width = index.dtype["key"].itemsize
+    keys = set(keys)
+    # longer keys would be truncated by the fixed-width key type
+    missing = {key for key in keys if len(key) > key_width or not key}
+    query = np.array(sorted(keys - missing), dtype="S%d" % key_width)
+
+    positions = np.searchsorted(index["key"], query)
+    in_range = positions < len(index)
+    hit = np.zeros(len(query), dtype=bool)
+    hit[in_range] = index["key"][positions[in_range]] == query[in_range]
+
+    missing.update(query[~hit].tolist())
+    found = np.asarray(index[positions[hit]])
+
+    return found, missing
+
+
+def write_fasta_index(fasta_file, index_file):
+    """
+    Index a fasta file.
+
+    The function maps the ID of each record (the first word of the header) to the byte offset and the byte length of
+    the complete record (header and sequence lines).
+
+    Parameters
+    ----------
+      fasta_file: the fasta file to index
+      index_file: output index file
+
+    Returns
+    -------
+      None
+
+    """
+    keys = []
+    offsets = []
+    offset = 0
+
+    logger.info("indexing %s ...", fasta_file)
+    with open(fasta_file, "rb") as fasta_file_open:
+        for line in fasta_file_open:
+            if line.startswith(b">"):
+                header_fields = line[1:].split(maxsplit=1)
+                keys.append(header_fields[0] if header_fields else b"")
+                offsets.append(offset)
+            offset += len(line)
+
+    offsets.append(offset)
+    lengths = np.diff(np.array(offsets, dtype=np.uint64))
+    write_offset_index(keys=keys, offsets=offsets[:-1], lengths=lengths, index_file=index_file)
+
+    return None
+
+
+def iter_indexed_entries(found, input_file):
+    """
+    Read the indexed entries from the input file.
+
+    The entries are read in file order through a memory map, so only the pages of the requested entries are read.
+
+    Parameters
+    ----------
+      found: index records returned by `lookup_offsets`
+      input_file: the indexed file
+
+    Returns
+    -------
+      generator of tuples with key and entry (bytes)
+
+    """
+    if len(found) == 0:
+        return
+
+    found = np.sort(found, order="offset")
+    with open(input_file, "rb") as input_file_open, \
+            mmap.mmap(input_file_open.fileno(), 0, access=mmap.ACCESS_READ) as input_map:
+        for key, offset, length in zip(found["key"].tolist(), found["offset"].tolist(), found["length"].tolist()):
+            yield key, input_map[offset:offset + length]
+
+
+def copy_indexed_entries(found, input_file, output_file):
+    """
+    Copy the indexed entries from the input file into the output file.
+
+    Parameters
+    ----------
+      found: index records returned by `lookup_offsets`
+      input_file: the indexed file
+      output_file: an opened binary output file
+
+    Returns
+    -------
+      None
+
+    """
+    for _, entry in iter_indexed_entries(found=found, input_file=input_file):
+        output_file.write(entry)
+
+    return None
+
+
+# mPies (metaProteomics in environmental sciences) creates annotated databases for metaproteomics analysis.
+# Copyright 2018 Johannes Werner (Leibniz-Institute for Baltic Sea Research)
+# Copyright 2018 Augustin Geron (University of Mons, University of Stirling)
+# Copyright 2018 Sabine Matallana Surget (University of Stirling)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
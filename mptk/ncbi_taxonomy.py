@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+
+"""
+Array-backed NCBI taxonomy.
+
+This module builds the NCBI taxonomy tree from nodes.dmp as dense numpy arrays indexed by taxID (parent, rank and depth)
+together with a precomputed taxID x rank matrix (superkingdom to species). Lineages of whole arrays of taxIDs are then
+resolved by a single array gather instead of one NCBITaxa (SQLite) query per taxID.
+"""
+
+import logging
+import numpy as np
+from mptk import general_functions
+
+logger = logging.getLogger("mptk.ncbi_taxonomy")
+
+RANKS = ["superkingdom", "phylum", "class", "order", "family", "genus", "species"]
+DESIRED_RANKS = ["superkingdom", "phylum", "class", "order", "family", "genus"]
+# newer taxonomy dumps use "domain" instead of "superkingdom"
+RANK_CODES = dict([(rank, i + 1) for i, rank in enumerate(RANKS)] + [("domain", 1)])
+ROOT = 1
+
+
+class Taxonomy(object):
+    """
+    NCBI taxonomy stored as numpy arrays indexed by taxID.
+
+    Attributes
+    ----------
+      parent: parent taxID of each taxID (unknown taxIDs point to themselves)
+      rank: rank code of each taxID (index of the rank in RANKS + 1, 0 for other ranks)
+      depth: distance of each taxID to the root (-1 for unknown taxIDs)
+      rank_matrix: taxID of each rank in RANKS for each taxID (-1 if the lineage has no such rank)
+    """
+
+    def __init__(self, parent, rank, depth, rank_matrix):
+        self.parent = parent
+        self.rank = rank
+        self.depth = depth
+        self.rank_matrix = rank_matrix
+
+    def _valid_taxids(self, taxids):
+        taxids = np.asarray(taxids, dtype=np.int64)
+        valid = (taxids > 0) & (taxids < len(self.parent))
+        valid[valid] = self.depth[taxids[valid]] >= 0
+
+        return taxids, valid
+
+    def get_rank_matrix(self, taxids, ranks=DESIRED_RANKS):
+        """
+        Get the taxIDs of the desired ranks for an array of taxIDs.
+
+        Parameters
+        ----------
+          taxids: array of taxIDs (-1 represents unclassified)
+          ranks: list of ranks (default: superkingdom, phylum, class, order, family, genus)
+
+        Returns
+        -------
+          matrix: array with one row per taxID and one column per rank (-1 if not available)
+
+        """
+        taxids, valid = self._valid_taxids(taxids)
+        columns = [RANKS.index(rank) for rank in ranks]
+        matrix = np.full((len(taxids), len(columns)), -1, dtype=np.int32)
+        matrix[valid] = self.rank_matrix[taxids[valid]][:, columns]
+
+        return matrix
+
+    def get_desired_ranks(self, taxids):
+        """
+        Get taxonomic lineage on taxIDs for desired ranks.
+
+        Vectorized version of `general_functions.get_desired_ranks`.
+
+        Parameters
+        ----------
+          taxids: array of taxIDs (-1 represents unclassified)
+
+        Returns
+        -------
+          ranks2lineage: dict with ranks as keys and arrays of taxIDs as values
+
+        """
+        matrix = self.get_rank_matrix(taxids, ranks=DESIRED_RANKS)
+
+        return dict((rank, matrix[:, i]) for i, rank in enumerate(DESIRED_RANKS))
+
+
+def parse_nodes_dmp(abspath_nodes_dmp):
+    """
+    Parse parent and rank of all taxIDs from nodes.dmp.
+
+    Parameter
+    ---------
+      abspath_nodes_dmp: absolute path of nodes.dmp
+
+    Returns
+    -------
+      parent: array with the parent taxID of each taxID (unknown taxIDs point to themselves)
+      rank: array with the rank code of each taxID
+
+    """
+    taxids = []
+    parents = []
+    ranks = []
+    with open(abspath_nodes_dmp, "rb", buffering=1048576) as nodes_dmp_open:
+        for line in nodes_dmp_open:
+            taxid, parent, rank, _ = line.split(b"\t|\t", 3)
+            taxids.append(int(taxid))
+            parents.append(int(parent))
+            ranks.append(RANK_CODES.get(rank.decode("ascii"), 0))
+
+    taxids = np.array(taxids, dtype=np.int64)
+    size = int(taxids.max()) + 1 if len(taxids) else ROOT + 1
+    parent = np.arange(size, dtype=np.int32)
+    parent[taxids] = parents
+    parent[ROOT] = ROOT
+    rank = np.zeros(size, dtype=np.uint8)
+    rank[taxids] = ranks
+
+    return parent, rank
+
+
+def build_lineage_arrays(parent, rank):
+    """
+    Compute the depth and the rank matrix of all taxIDs.
+
+    All taxIDs are walked up to the root at once, one level per iteration.
+
+    Parameters
+    ----------
+      parent: array with the parent taxID of each taxID
+      rank: array with the rank code of each taxID
+
+    Returns
+    -------
+      depth: distance of each taxID to the root (-1 for taxIDs that are not connected to the root)
+      rank_matrix: taxID of each rank in RANKS for each taxID (-1 if the lineage has no such rank)
+
+    """
+    size = len(parent)
+    depth = np.zeros(size, dtype=np.int32)
+    rank_matrix = np.full((size, len(RANKS)), -1, dtype=np.int32)
+
+    active = np.arange(size, dtype=np.int64)
+    current = active.copy()
+    while len(active):
+        current_rank = rank[current]
+        ranked = current_rank > 0
+        rank_matrix[active[ranked], current_rank[ranked].astype(np.int64) - 1] = current[ranked]
+
+        at_root = current == ROOT
+        detached = (parent[current] == current) & ~at_root
+        depth[active[detached]] = -1
+        keep = ~at_root & ~detached
+        active = active[keep]
+        current = parent[current[keep]].astype(np.int64)
+        depth[active] += 1
+
+    return depth, rank_matrix
+
+
+def load_taxonomy(abspath_nodes_dmp, cache_file=None):
+    """
+    Load the array-backed taxonomy.
+
+    The arrays are built from nodes.dmp and cached next to nodes.dmp (or in `cache_file`), so later runs load them
+    with mmap. The cache is rebuilt when the size or modification time of nodes.dmp changes.
+
+    Parameter
+    ---------
+      abspath_nodes_dmp: absolute path of nodes.dmp
+      cache_file: path of the cache file (default: None, nodes.dmp with suffix .mptk)
+
+    Returns
+    -------
+      taxonomy: Taxonomy object
+
+    """
+    if cache_file is None:
+        cache_file = abspath_nodes_dmp + ".mptk"
+
+    cache = general_functions.read_array_cache(cache_file=cache_file, source_file=abspath_nodes_dmp)
+    if cache is not None:
+        logger.info("loading taxonomy from %s ...", cache_file)
+        return Taxonomy(**cache)
+
+    logger.info("building taxonomy from %s ...", abspath_nodes_dmp)
+    parent, rank = parse_nodes_dmp(abspath_nodes_dmp=abspath_nodes_dmp)
+    depth, rank_matrix = build_lineage_arrays(parent=parent, rank=rank)
+    arrays = {"parent": parent, "rank": rank, "depth": depth, "rank_matrix": rank_matrix}
+    try:
+        general_functions.write_array_cache(cache_file=cache_file, source_file=abspath_nodes_dmp, arrays=arrays)
+    except OSError as e:
+        logger.warning("could not write cache %s: %s", cache_file, e)
+
+    return Taxonomy(**arrays)
+
+
+# mPies (metaProteomics in environmental sciences) creates annotated databases for metaproteomics analysis.
+# Copyright 2018 Johannes Werner (Leibniz-Institute for Baltic Sea Research)
+# Copyright 2018 Augustin Geron (University of Mons, University of Stirling)
+# Copyright 2018 Sabine Matallana Surget (University of Stirling)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -11,50 +11,266 @@ import logging
 import numpy as np
 import pandas as pd
 import re
+from mptk import general_functions
 
 logger = logging.getLogger("mptk.parse_functions_cog")
 
 
-def join_tables(df, cog_table, cog_names):
+CLASS_LETTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+
+def read_cog_table(cog_table):
+    """
+    Read the domain IDs (gi numbers) and COG IDs of the COG csv table.
+
+    Parameters
+    ----------
+      cog_table: the COG csv table downloaded from COG FTP (ftp://ftp.ncbi.nih.gov/pub/COG/COG2014/data/)
+
+    Returns
+    -------
+      cog_table_df: data frame with the columns domain_id and COG_id
+
+    """
+    column_names_cog_table = ["domain_id", "genome_name", "protein_id", "protein_length", "domain_start", "domain_end",
+                              "COG_id", "membership_class"]
+    cog_table_df = pd.read_csv(cog_table, sep=",", header=None, names=column_names_cog_table, index_col=False,
+                               usecols=["domain_id", "COG_id"], dtype={"domain_id": np.int64, "COG_id": "category"})
+
+    return cog_table_df
+
+
+def read_cog_names(cog_names):
+    """
+    Read the functional classes of the COGs with one row per COG and class letter (e.g. "KL" -> "K", "L").
+
+    Parameters
+    ----------
+      cog_names: the COG names table
+
+    Returns
+    -------
+      cog_names_df: data frame with the columns COG_id and functional_class
+
+    """
+    column_names_cog_names = ["COG_id", "functional_class", "COG_annotation"]
+    # functional classes like "NA" must not be read as missing values
+    cog_names_df = pd.read_csv(cog_names, sep="\t", header=None, names=column_names_cog_names, comment="#",
+                               encoding="latin1", keep_default_na=False, na_values=[""])
+    cog_names_df = cog_names_df[["COG_id", "functional_class"]]
+    cog_names_df["functional_class"] = cog_names_df["functional_class"].map(list, na_action="ignore")
+    cog_names_df = cog_names_df.explode("functional_class")
+
+    return cog_names_df
+
+
+def read_cog_functions(cog_functions):
+    """
+    Read the names of the functional classes.
+
+    Parameters
+    ----------
+      cog_functions: the COG functions table
+
+    Returns
+    -------
+      cog_functions_df: data frame with the columns functional_class and functional_name
+
+    """
+    column_names_cog_functions = ["functional_class", "functional_name"]
+    cog_functions_df = pd.read_csv(cog_functions, sep="\t", header=None, names=column_names_cog_functions, comment="#")
+
+    return cog_functions_df
+
+
+def get_gi_numbers(sseqid):
+    """
+    Extract the gi numbers from the subject IDs (gi|<number>|ref|...).
+
+    The gi numbers are only extracted once per distinct subject ID.
+
+    Parameters
+    ----------
+      sseqid: series of subject IDs
+
+    Returns
+    -------
+      array of gi numbers
+
+    """
+    sseqid = sseqid.astype("category")
+    gi_numbers = sseqid.cat.categories.str.extract("^gi\|(.+)\|ref\|", expand=False).astype(np.int64)
+    codes = sseqid.cat.codes.to_numpy()
+    if (codes < 0).any():
+        raise ValueError("%d diamond hits without subject ID" % int((codes < 0).sum()))
+
+    return gi_numbers.to_numpy()[codes]
+
+
+def build_cog_index(cog_table, cog_names, cog_functions, cog_index):
+    """
+    Build a binary index of the COG tables.
+
+    The index contains the sorted domain IDs (gi numbers) of the COG table with the index of their COG, the COG IDs
+    with a bitmask of their functional class letters (bit 0 = A), and the names of the functional classes. It is
+    written with `general_functions.write_array_cache`, so it is loaded as memory maps.
+
+    Parameters
+    ----------
+      cog_table: the COG csv table
+      cog_names: the COG names table
+      cog_functions: the COG functions table
+      cog_index: output index file
+
+    Returns
+    -------
+      None
+
+    """
+    cog_table_df = read_cog_table(cog_table)
+    cog_names_df = read_cog_names(cog_names).dropna()
+    cog_functions_df = read_cog_functions(cog_functions)
+
+    cog_ids = pd.Index(cog_table_df["COG_id"].cat.categories.union(cog_names_df["COG_id"].unique()))
+    unknown_letters = ~cog_names_df["functional_class"].isin(list(CLASS_LETTERS))
+    if unknown_letters.any():
+        logger.warning("ignoring %d unknown functional classes", int(unknown_letters.sum()))
+        cog_names_df = cog_names_df[~unknown_letters]
+    bits = np.left_shift(1, cog_names_df["functional_class"].map(CLASS_LETTERS.index).to_numpy()).astype(np.uint32)
+    cog_classes = np.zeros(len(cog_ids), dtype=np.uint32)
+    np.bitwise_or.at(cog_classes, cog_ids.get_indexer(cog_names_df["COG_id"]), bits)
+
+    domain_ids = cog_table_df["domain_id"].to_numpy()
+    domain_cogs = cog_ids.get_indexer(cog_table_df["COG_id"].astype(object))
+    order = np.argsort(domain_ids, kind="stable")
+
+    arrays = {"domain_ids": domain_ids[order],
+              "domain_cogs": domain_cogs[order].astype(np.int32),
+              "cog_ids": np.array(cog_ids.tolist(), dtype="S"),
+              "cog_classes": cog_classes,
+              "class_letters": np.array(cog_functions_df["functional_class"].tolist(), dtype="S"),
+              "class_names": np.char.encode(np.array(cog_functions_df["functional_name"].tolist(), dtype="U"),
+                                            "utf-8")}
+    general_functions.write_array_cache(cache_file=cog_index, source_file=cog_table, arrays=arrays)
+    logger.info("wrote %d domains of %d COGs to %s", len(domain_ids), len(cog_ids), cog_index)
+
+    return None
+
+
+def load_cog_index(cog_index, cog_table=None):
+    """
+    Load a COG index written by `build_cog_index`.
+
+    Parameters
+    ----------
+      cog_index: the index file
+      cog_table: the COG csv table the index was built from, an index of an older version of the table raises a
+                 ValueError (default: None, only warn if the table recorded in the index has changed)
+
+    Returns
+    -------
+      dict with the arrays of the index
+
+    """
+    arrays = general_functions.read_array_cache(cache_file=cog_index, source_file=cog_table)
+    if arrays is None:
+        if cog_table and general_functions.is_array_cache(cog_index):
+            raise ValueError("COG index %s is outdated, rebuild it from %s with prepare_cog_files" % (cog_index,
+                                                                                                    cog_table))
+        raise ValueError("%s is not a COG index" % cog_index)
+
+    return arrays
+
+
+def join_tables_indexed(df, cog_index, cog_table=None):
+    """
+    Joins the data frame with the COG index.
+
+    The result is the same as the one of `join_tables` (up to the order of the class letters of a COG, which are
+    sorted alphabetically).
+
+    Parameters
+    ----------
+      df: the data frame
+      cog_index: the COG index written by `build_cog_index`
+      cog_table: the COG csv table, to check if the index is outdated (default: None)
+
+    Returns
+    -------
+      df_cog: the joined table
+
+    """
+    index = load_cog_index(cog_index, cog_table=cog_table)
+    gi_numbers = get_gi_numbers(df["sseqid"])
+
+    # all (hit, domain) pairs, hits without domain are kept once with a missing COG
+    left = np.searchsorted(index["domain_ids"], gi_numbers, side="left")
+    right = np.searchsorted(index["domain_ids"], gi_numbers, side="right")
+    counts = np.maximum(right - left, 1)
+    hits = np.repeat(np.arange(len(gi_numbers)), counts)
+    domains = np.repeat(left, counts) + np.arange(len(hits)) - np.repeat(np.cumsum(counts) - counts, counts)
+    matched = np.repeat(right > left, counts)
+    cogs = np.full(len(hits), -1, dtype=np.int64)
+    cogs[matched] = index["domain_cogs"][domains[matched]]
+
+    # one row per class letter, COGs without class letter are kept once with a missing class
+    classes = np.zeros(len(hits), dtype=np.uint32)
+    classes[cogs >= 0] = index["cog_classes"][cogs[cogs >= 0]]
+    rows = [np.flatnonzero(classes == 0)]
+    letters = [np.full(len(rows[0]), -1)]
+    for bit in range(len(CLASS_LETTERS)):
+        rows.append(np.flatnonzero(classes & (1 << bit)))
+        letters.append(np.full(len(rows[-1]), bit))
+    rows = np.concatenate(rows)
+    letters = np.concatenate(letters)
+    order = np.argsort(rows, kind="stable")
+    rows = rows[order]
+    letters = letters[order]
+
+    cog_ids = np.char.decode(index["cog_ids"], "utf-8").astype(object)
+    class_letters = np.array(list(CLASS_LETTERS) + [np.nan], dtype=object)[letters]
+    row_cogs = cogs[rows]
+    df_cog = pd.DataFrame({"qseqid": df["qseqid"].to_numpy()[hits[rows]],
+                           "sseqid": gi_numbers[hits[rows]],
+                           "COG_id": np.where(row_cogs >= 0, cog_ids[np.maximum(row_cogs, 0)], np.nan),
+                           "functional_class": class_letters})
+
+    return df_cog
+
+
+def join_tables(df, cog_table, cog_names, cog_index=None):
     """
     Joins the data frame with the COG tables.
 
     This function performs left-join-operations of the data frame with the tables downloaded from the COG FTP server.
+    With a COG index (`prepare_cog_files`), the index is used instead of the tables.
 
     Parameters
     ----------
       df: the data frame
       cog_table: the COG csv table downloaded from COG FTP (ftp://ftp.ncbi.nih.gov/pub/COG/COG2014/data/)
       cog_names: the COG names table
+      cog_index: the COG index (default: None), checked against the COG csv table if given
 
     Returns
     -------
       df_cog: the joined table
 
     """
-    column_names_cog_table = ["domain_id", "genome_name", "protein_id", "protein_length", "domain_start", "domain_end",
-                              "COG_id", "membership_class"]
-    cog_table_df = pd.read_csv(cog_table, sep=",", header=None, names=column_names_cog_table, index_col=False)
-    cog_table_df = cog_table_df[["domain_id", "COG_id"]]
+    if cog_index:
+        return join_tables_indexed(df, cog_index=cog_index, cog_table=cog_table)
 
-    column_names_cog_names = ["COG_id", "functional_class", "COG_annotation"]
-    cog_names_df = pd.read_csv(cog_names, sep="\t", header=None, names=column_names_cog_names, comment="#", encoding="latin1")
-    cog_names_df = cog_names_df[["COG_id", "functional_class"]]
+    cog_table_df = read_cog_table(cog_table)
+    cog_names_df = read_cog_names(cog_names)
 
-    df.sseqid = df.sseqid.str.extract("^gi\|(.+)\|ref\|", expand = True)
-    df.sseqid = df.sseqid.astype(np.int64)
-    df = df[["qseqid", "sseqid"]]
-    df = df.merge(cog_table_df, how="left", left_on="sseqid", right_on="domain_id").drop("domain_id", 1)
+    df = pd.DataFrame({"qseqid": df["qseqid"].to_numpy(), "sseqid": get_gi_numbers(df["sseqid"])})
+    df = df.merge(cog_table_df, how="left", left_on="sseqid", right_on="domain_id").drop(columns="domain_id")
     df = df.merge(cog_names_df, how="left", on="COG_id")
 
-    # https://stackoverflow.com/a/53261482/5013084
-    # split dataframe column after each letter into different columns (without delimiter)
-    df = pd.DataFrame([(*x[0:-1], y) for x in df.values.tolist() for y in list(x[-1])], columns=df.columns)
-
     return df
 
 
-def group_table(df, cog_functions, number_of_entries=1):
+def group_table(df, cog_functions, number_of_entries=1, cog_index=None, cog_table=None):
     """
     Performs a group-by operation to count the occurences of the hits in the data frame.
 
@@ -64,14 +280,20 @@ def group_table(df, cog_functions, number_of_entries=1):
     ----------
       df: the data frame
       cog_functions: the COG functions table
+      cog_index: the COG index, used instead of the COG functions table (default: None)
+      cog_table: the COG csv table, to check if the index is outdated (default: None)
 
     Returns
     -------
       df: the joined table
 
     """
-    column_names_cog_functions = ["functional_class", "functional_name"]
-    cog_functions_df = pd.read_csv(cog_functions, sep="\t", header=None, names=column_names_cog_functions, comment="#")
+    if cog_index:
+        index = load_cog_index(cog_index, cog_table=cog_table)
+        cog_functions_df = pd.DataFrame({"functional_class": np.char.decode(index["class_letters"], "utf-8"),
+                                         "functional_name": np.char.decode(index["class_names"], "utf-8")})
+    else:
+        cog_functions_df = read_cog_functions(cog_functions)
 
     df = df[["qseqid", "functional_class"]]
     df = df.groupby(["qseqid", "functional_class"]).size().reset_index(name='counts')
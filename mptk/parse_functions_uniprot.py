@@ -7,24 +7,70 @@ This module parses the output of the diamond output table run against UniProt (e
 Afterwards, the output is joined with the GO categories of the protein (annotated by UniProt).
 """
 
+import io
 import logging
 import pandas as pd
 import re
+from mptk import go_ontology, uniprot_store
 
 logger = logging.getLogger("mptk.parse_functions_uniprot")
 
 
-def join_tables(df, uniprot_table, go_annotation):
+def read_uniprot_rows(uniprot_table, keys, column_names, chunksize=1000000):
+    """
+    Read the rows of the given UniProt IDs from the UniProt table.
+
+    A UniProt store (`prepare_uniprot_files --store`) is searched with its index. A gzipped table is streamed in chunks
+    and only the matching rows of each chunk are kept, so the memory usage depends on the number of IDs and not on the
+    size of the table.
+
+    Parameters
+    ----------
+      uniprot_table: the compressed UniProt table or the UniProt store
+      keys: UniProt IDs
+      column_names: names of the columns of the table
+      chunksize: number of rows per chunk of the gzipped table (default: 1000000)
+
+    Returns
+    -------
+      uniprot_table_df: data frame with the rows of the UniProt IDs
+
+    """
+    if uniprot_store.is_uniprot_store(uniprot_table):
+        rows = uniprot_store.read_store_rows(uniprot_table, keys=keys)
+        if not rows:
+            return pd.DataFrame(columns=column_names)
+        return pd.read_csv(io.BytesIO(rows), sep="\t", header=None, names=column_names, index_col=False)
+
+    keys = pd.Index(keys).unique()
+    chunks = pd.read_csv(uniprot_table, compression="gzip", sep="\t", header=None, names=column_names, index_col=False,
+                         chunksize=chunksize)
+    uniprot_table_dfs = [chunk[chunk[column_names[0]].isin(keys)] for chunk in chunks]
+    if not uniprot_table_dfs:
+        return pd.DataFrame(columns=column_names)
+
+    return pd.concat(uniprot_table_dfs, ignore_index=True)
+
+
+def join_tables(df, uniprot_table, go_annotation, go_closure=None, go_slim=None, go_depth=None):
     """
     Joins the data frame with the UniProt table.
 
-    This function performs left-join-operations of the data frame with the processed UniProt table.
+    This function performs left-join-operations of the data frame with the processed UniProt table. Only the rows of
+    the UniProt IDs in the data frame are read from the table (see `read_uniprot_rows`). With a GO closure
+    (`prepare_go_files`), the GO terms are rolled up to the GO slim, to the GO depth or to all of their ancestors (see
+    `go_ontology.roll_up_go_table`) before the join.
 
     Parameters
     ----------
       df: the data frame
       uniprot_table: the compressed Uniprot table *.dat.gz
                      (ftp://ftp.uniprot.org/pub/databases/uniprot/current_release/knowledgebase/complete/)
+                     or the UniProt store
+      go_annotation: join GO annotations instead of protein names
+      go_closure: the GO closure, requires go_annotation (default: None, GO terms are not rolled up)
+      go_slim: GO slim ontology file or text file with GO IDs (default: None)
+      go_depth: depth of the rolled up GO terms (default: None)
 
     Returns
     -------
@@ -35,13 +81,19 @@ def join_tables(df, uniprot_table, go_annotation):
         column_names_uniprot_table = ["uniprot_id", "GO_id", "GO_category"]
     else:
         column_names_uniprot_table = ["uniprot_id", "protein_name"]
-    uniprot_table_df = pd.read_csv(uniprot_table, compression="gzip", sep="\t", header=None,
-                                   names=column_names_uniprot_table, index_col=False)
 
     df.sseqid = df.sseqid.str.extract("^.{2}\|.+\|(.+)$", expand = True)
     df = df[["qseqid", "sseqid"]]
 
-    df_uniprot = df.merge(uniprot_table_df, how="left", left_on="sseqid", right_on="uniprot_id").drop("uniprot_id", 1)
+    uniprot_table_df = read_uniprot_rows(uniprot_table, keys=df.sseqid.dropna().unique(),
+                                         column_names=column_names_uniprot_table)
+    if go_closure:
+        if not go_annotation:
+            raise ValueError("GO terms can only be rolled up with GO annotations")
+        uniprot_table_df = go_ontology.roll_up_go_table(uniprot_table_df, go_closure=go_closure, go_slim=go_slim,
+                                                        go_depth=go_depth)
+
+    df_uniprot = df.merge(uniprot_table_df, how="left", left_on="sseqid", right_on="uniprot_id").drop(columns="uniprot_id")
 
     return df_uniprot
 
@@ -7,10 +7,66 @@ This module parses the MEGAN taxonomy table and creates a tab-separated table.
 """
 
 import logging
+import numpy as np
 import pandas as pd
 
 logger = logging.getLogger("mptk.parse_taxonomy")
 
+RANKS = ["d", "p", "c", "o", "f", "g", "s", "ed", "ep", "ec", "eo", "ef", "eg", "es"]
+NAME_COLUMNS = ["%s_name" % rank for rank in RANKS]
+SCORE_COLUMNS = ["%s_score" % rank for rank in RANKS]
+
+
+def read_table(input_file):
+    """
+    Read the MEGAN results table.
+
+    Parameters
+    ----------
+      input_file: MEGAN taxonomy table
+
+    Returns
+    -------
+      df: data frame with the columns id and the name and score of each taxonomic rank
+
+    """
+    column_names = ["id", "_blank"] + [column for rank in zip(NAME_COLUMNS, SCORE_COLUMNS) for column in rank] + \
+                   ["__blank"]
+    # nullable integers keep the output format of the IDs and scores (e.g. 100, not 100.0)
+    dtypes = {"id": "Int64"}
+    dtypes.update({column: "category" for column in NAME_COLUMNS})
+    dtypes.update({column: "Int64" for column in SCORE_COLUMNS})
+    # the scores are separated by "; ", skipinitialspace lets the C engine read them as numbers
+    df = pd.read_csv(input_file, sep=";", engine="c", header=None, names=column_names, index_col=False,
+                     usecols=["id"] + column_names[2:-1], dtype=dtypes, skipinitialspace=True)
+
+    return df
+
+
+def apply_score_cutoff(df, score_cutoff):
+    """
+    Replace the names of the taxonomic ranks with a score below the cutoff.
+
+    The names are replaced by `<rank>__belowScoreCutoff` with one mask over the score columns of all ranks.
+
+    Parameters
+    ----------
+      df: data frame created by `read_table`
+      score_cutoff: quality cutoff (percentage of the reads) to report a taxonomic rank
+
+    Returns
+    -------
+      df: the data frame with replaced names
+
+    """
+    below_cutoff = df[SCORE_COLUMNS].to_numpy(dtype=np.float64, na_value=np.nan) < score_cutoff
+    if below_cutoff.any():
+        below_names = np.array(["%s__belowScoreCutoff" % rank for rank in RANKS], dtype=object)
+        names = np.where(below_cutoff, below_names, df[NAME_COLUMNS].to_numpy(dtype=object))
+        df[NAME_COLUMNS] = pd.DataFrame(names, columns=NAME_COLUMNS, index=df.index)
+
+    return df
+
 
 def parse_table(input_file, output_file, score_cutoff=0):
     """
@@ -31,45 +87,13 @@ def parse_table(input_file, output_file, score_cutoff=0):
       None
 
     """
-    column_names = ["id", "_blank",
-                    "d_name", "d_score",
-                    "p_name", "p_score",
-                    "c_name", "c_score",
-                    "o_name", "o_score",
-                    "f_name", "f_score",
-                    "g_name", "g_score",
-                    "s_name", "s_score",
-                    "ed_name", "ed_score",
-                    "ep_name", "ep_score",
-                    "ec_name", "ec_score",
-                    "eo_name", "eo_score",
-                    "ef_name", "ef_score",
-                    "eg_name", "eg_score",
-                    "es_name", "es_score",
-                    "__blank"]
-    df = pd.read_csv(input_file, sep=";", engine="python", header=None, names=column_names, usecols=list(range(31)))
-    df.drop(df.columns[[1, -1]], axis=1, inplace=True)
-
-    if score_cutoff != 0:
-        df.loc[df["d_score"] < score_cutoff, "d_name"] = "d__belowScoreCutoff"
-        df.loc[df["p_score"] < score_cutoff, "p_name"] = "p__belowScoreCutoff"
-        df.loc[df["c_score"] < score_cutoff, "c_name"] = "c__belowScoreCutoff"
-        df.loc[df["o_score"] < score_cutoff, "o_name"] = "o__belowScoreCutoff"
-        df.loc[df["f_score"] < score_cutoff, "f_name"] = "f__belowScoreCutoff"
-        df.loc[df["g_score"] < score_cutoff, "g_name"] = "g__belowScoreCutoff"
-        df.loc[df["s_score"] < score_cutoff, "s_name"] = "s__belowScoreCutoff"
-        df.loc[df["ed_score"] < score_cutoff, "ed_name"] = "ed__belowScoreCutoff"
-        df.loc[df["ep_score"] < score_cutoff, "ep_name"] = "ep__belowScoreCutoff"
-        df.loc[df["ec_score"] < score_cutoff, "ec_name"] = "ec__belowScoreCutoff"
-        df.loc[df["eo_score"] < score_cutoff, "eo_name"] = "eo__belowScoreCutoff"
-        df.loc[df["ef_score"] < score_cutoff, "ef_name"] = "ef__belowScoreCutoff"
-        df.loc[df["eg_score"] < score_cutoff, "eg_name"] = "eg__belowScoreCutoff"
-        df.loc[df["es_score"] < score_cutoff, "es_name"] = "es__belowScoreCutoff"
-
-
+    df = read_table(input_file)
     df.rename(columns={"id": "protein_group"}, inplace=True)
     df = df.groupby("protein_group").head(1)
 
+    if score_cutoff != 0:
+        df = apply_score_cutoff(df, score_cutoff=score_cutoff)
+
     df.to_csv(output_file, sep="\t", encoding="utf-8", index=False)
 
     return None
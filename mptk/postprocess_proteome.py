@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+"""
+Postprocess the proteome files in one pass.
+
+This module combines the proteome files (amplicon, functional subset, assembled, unassembled), removes short
+sequences and exact duplicates and hashes the headers in a single streaming pass, instead of writing a full copy of
+the metaproteome after each of these steps.
+"""
+
+import hashlib
+import logging
+from mptk import hash_headers
+
+logger = logging.getLogger("mptk.postprocess_proteome")
+
+
+def iter_fasta_records(fasta_file):
+    """
+    Read the records of a fasta file.
+
+    Parameters
+    ----------
+      fasta_file: the fasta file
+
+    Returns
+    -------
+      generator of tuples with header (bytes, without ">" and line break) and list of sequence lines (bytes)
+
+    """
+    header = None
+    sequence_lines = []
+
+    with open(fasta_file, "rb") as fasta_file_open:
+        for line in fasta_file_open:
+            if line.startswith(b">"):
+                if header is not None:
+                    yield header, sequence_lines
+                header = line.rstrip()[1:]
+                sequence_lines = []
+            elif header is not None:
+                sequence_lines.append(line)
+
+    if header is not None:
+        yield header, sequence_lines
+
+
+def postprocess_proteomes(input_files, output_file, tsv_file, hash_type, min_length=30, hash_mode="chained",
+                          digest_size=None):
+    """
+    Combine, filter, deduplicate and hash the proteome files.
+
+    The function reads all proteome files once. Sequences shorter than `min_length` are dropped (like
+    `helper_scripts/remove_short_sequences.pl`), and for exact duplicate sequences only the first record is kept
+    (like `cd-hit-dup`), using a set of sequence digests. The headers of the kept records are hashed as in
+    `hash_headers.write_hashed_protein_header_fasta_file` (`chained`) or
+    `hash_headers.write_hashed_protein_header_fasta_file_parallel` (`independent`). The headers of the removed
+    duplicates are kept as additional rows in the tsv file, mapping the hashed header of the kept record to each
+    merged original header.
+
+    Parameters
+    ----------
+      input_files: list of proteome files
+      output_file: output proteome file with hashed headers
+      tsv_file: output tsv file
+      hash_type: hash algorithm to use
+      min_length: minimum sequence length (default: 30)
+      hash_mode: chained or independent digests (default: chained)
+      digest_size: size of the digest in bytes (only for blake2b and blake2s, default: None)
+
+    Returns
+    -------
+      None
+
+    """
+    chained_hash = hash_headers.new_hash(hash_type, digest_size)
+    sequence_digests = {}
+    merged_headers = []
+    n_records = n_short = 0
+
+    with open(output_file, "wb", buffering=16777216) as output_file_open, \
+            open(tsv_file, "wb", buffering=16777216) as tsv_file_open:
+        for input_file in input_files:
+            logger.info("reading %s ...", input_file)
+            for header, sequence_lines in iter_fasta_records(input_file):
+                n_records += 1
+                sequence = b"".join(line.rstrip(b"\r\n") for line in sequence_lines)
+                if len(sequence) < min_length:
+                    n_short += 1
+                    continue
+
+                sequence_digest = hashlib.blake2b(sequence, digest_size=16).digest()
+                if sequence_digest in sequence_digests:
+                    merged_headers.append((sequence_digests[sequence_digest], header))
+                    continue
+
+                if hash_mode == "independent":
+                    h = hash_headers.new_hash(hash_type, digest_size)
+                else:
+                    h = chained_hash
+                h.update(header)
+                hashed_header = h.hexdigest().encode("ascii")
+                sequence_digests[sequence_digest] = hashed_header
+
+                if sequence_lines and not sequence_lines[-1].endswith(b"\n"):
+                    sequence_lines[-1] += b"\n"
+                output_file_open.write(b">" + hashed_header + b"\n")
+                output_file_open.writelines(sequence_lines)
+                tsv_file_open.write(b'"' + hashed_header + b'"\t' + header + b"\n")
+
+        for hashed_header, header in merged_headers:
+            tsv_file_open.write(b'"' + hashed_header + b'"\t' + header + b"\n")
+
+    logger.info("read %d records, removed %d short sequences and %d duplicates, kept %d records", n_records, n_short,
+                len(merged_headers), len(sequence_digests))
+
+    return None
+
+
+# mPies (metaProteomics in environmental sciences) creates annotated databases for metaproteomics analysis.
+# Copyright 2018 Johannes Werner (Leibniz-Institute for Baltic Sea Research)
+# Copyright 2018 Augustin Geron (University of Mons, University of Stirling)
+# Copyright 2018 Sabine Matallana Surget (University of Stirling)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+
+"""
+Local cache of the UniProt proteomes of single taxa.
+
+The proteome of each taxon is stored in its own fasta file, keyed by the taxID, the reviewed flag and the UniProt
+release (e.g. `2022_05.reviewed.1234.fasta`). A run only downloads the taxa that are missing in the cache (see
+`uniprot_download.download_shard`) and concatenates the cached files into the proteome file. Each use of a cache entry
+updates its modification time, so the least recently used entries are evicted first when the cache exceeds its size
+limit.
+"""
+
+import logging
+import os
+import re
+import shutil
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from mptk import uniprot_download
+
+logger = logging.getLogger("mptk.proteome_cache")
+
+CACHE_FILE_REGEX = re.compile(r"^(?P<release>[\w.-]+)\.(?P<reviewed>reviewed|all)\.(?P<taxid>\d+)\.fasta$")
+UNKNOWN_RELEASE = "unknown"
+
+
+def get_uniprot_release(url=uniprot_download.UNIPROT_URL, timeout=60):
+    """
+    Get the current UniProt release from the header X-UniProt-Release of the UniProt service.
+
+    Parameters
+    ----------
+      url: URL of the UniProt service (default: uniprot_download.UNIPROT_URL)
+      timeout: socket timeout in seconds (default: 60)
+
+    Returns
+    -------
+      release: the UniProt release (e.g. 2022_05) or None if the service does not report it
+
+    """
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, method="HEAD"), timeout=timeout) as response:
+            release = response.headers.get("X-UniProt-Release")
+    except (urllib.error.URLError, OSError) as e:
+        logger.warning("could not get the UniProt release: %s", e)
+        return None
+
+    return release.strip() if release else None
+
+
+def get_cache_file(cache_dir, taxid, reviewed, release):
+    """
+    Return the path of the cache entry of a taxon.
+
+    Parameters
+    ----------
+      cache_dir: cache directory
+      taxid: taxID
+      reviewed: proteome of the reviewed (SwissProt) entries only
+      release: UniProt release
+
+    Returns
+    -------
+      path of the cache entry
+
+    """
+    release = re.sub(r"[^\w.-]", "_", release)
+
+    return os.path.join(cache_dir, "%s.%s.%d.fasta" % (release, "reviewed" if reviewed else "all", int(taxid)))
+
+
+def list_cache(cache_dir):
+    """
+    List the entries of the cache.
+
+    Parameters
+    ----------
+      cache_dir: cache directory
+
+    Returns
+    -------
+      entries: list of dicts (path, release, reviewed, taxid, size, mtime), least recently used first
+
+    """
+    entries = []
+    if not os.path.isdir(cache_dir):
+        return entries
+    for entry in os.scandir(cache_dir):
+        rx_match = CACHE_FILE_REGEX.match(entry.name)
+        if not rx_match or not entry.is_file():
+            continue
+        stat = entry.stat()
+        entries.append({"path": entry.path, "release": rx_match.group("release"),
+                        "reviewed": rx_match.group("reviewed") == "reviewed", "taxid": int(rx_match.group("taxid")),
+                        "size": stat.st_size, "mtime": stat.st_mtime})
+    entries.sort(key=lambda e: (e["mtime"], e["path"]))
+
+    return entries
+
+
+def remove_entry(cache_file):
+    """
+    Remove a cache entry and its lock file (unless a download holds it).
+
+    A run that still reads a removed entry keeps its open file, a run that has not opened it yet downloads it again
+    (see `get_proteomes`).
+
+    Parameters
+    ----------
+      cache_file: path of the cache entry
+
+    Returns
+    -------
+      1 if the entry was removed, 0 if it was already removed (e.g. by a concurrent run)
+
+    """
+    try:
+        os.remove(cache_file)
+    except FileNotFoundError:
+        return 0
+    finally:
+        uniprot_download.remove_lock(cache_file)
+
+    return 1
+
+
+def prune_cache(cache_dir, max_size=None, release=None):
+    """
+    Remove cache entries.
+
+    Entries of other releases than `release` are removed, then the least recently used entries are removed until the
+    cache is not larger than `max_size` bytes.
+
+    Parameters
+    ----------
+      cache_dir: cache directory
+      max_size: maximum size of the cache in bytes (default: None, no limit)
+      release: keep only entries of this release (default: None, keep all releases)
+
+    Returns
+    -------
+      removed: number of removed entries
+
+    """
+    entries = list_cache(cache_dir)
+    removed = 0
+    if release is not None:
+        release = re.sub(r"[^\w.-]", "_", release)
+        for entry in [e for e in entries if e["release"] != release]:
+            removed += remove_entry(entry["path"])
+        entries = [e for e in entries if e["release"] == release]
+
+    if max_size is not None:
+        total_size = sum(e["size"] for e in entries)
+        for entry in entries:
+            if total_size <= max_size:
+                break
+            removed += remove_entry(entry["path"])
+            total_size -= entry["size"]
+    if removed:
+        logger.info("removed %d cache entries", removed)
+
+    return removed
+
+
+def clear_cache(cache_dir):
+    """
+    Remove all cache entries (and partial downloads and lock files).
+
+    Parameters
+    ----------
+      cache_dir: cache directory
+
+    Returns
+    -------
+      None
+
+    """
+    for entry in list_cache(cache_dir):
+        remove_entry(entry["path"])
+    if os.path.isdir(cache_dir):
+        for file_name in os.listdir(cache_dir):
+            if file_name.endswith(".fasta.part"):
+                remove_entry(os.path.join(cache_dir, file_name))
+            elif file_name.endswith(".fasta.lock"):
+                uniprot_download.remove_lock(os.path.join(cache_dir, file_name[:-len(".lock")]))
+
+    return None
+
+
+def show_cache(cache_dir):
+    """
+    Log the number of taxa and the size of the cache per release.
+
+    Parameters
+    ----------
+      cache_dir: cache directory
+
+    Returns
+    -------
+      None
+
+    """
+    entries = list_cache(cache_dir)
+    summary = {}
+    for entry in entries:
+        key = (entry["release"], "reviewed" if entry["reviewed"] else "all")
+        taxa, size = summary.get(key, (0, 0))
+        summary[key] = (taxa + 1, size + entry["size"])
+    for (release, reviewed), (taxa, size) in sorted(summary.items()):
+        logger.info("release %s (%s): %d taxa, %.1f MiB", release, reviewed, taxa, size / 1048576)
+    logger.info("total: %d taxa, %.1f MiB in %s", len(entries), sum(e["size"] for e in entries) / 1048576, cache_dir)
+
+    return None
+
+
+def touch_entry(cache_file):
+    """
+    Mark a cache entry as used (its modification time is the time of the last use).
+
+    Parameters
+    ----------
+      cache_file: path of the cache entry
+
+    Returns
+    -------
+      None
+
+    """
+    try:
+        os.utime(cache_file)
+    except FileNotFoundError:
+        pass
+
+    return None
+
+
+def get_proteomes(tax_list, output_file, cache_dir, reviewed=False, release=None, max_size=None,
+                  url=uniprot_download.UNIPROT_URL, connections=4):
+    """
+    Write the proteomes of the taxa into one fasta file, downloading only the taxa missing in the cache.
+
+    The cached proteomes are concatenated without removing duplicated entries (the postprocessing removes them).
+
+    Parameters
+    ----------
+      tax_list: list of taxIDs
+      output_file: output fasta file
+      cache_dir: cache directory
+      reviewed: use TrEMBL (False) or SwissProt (True)
+      release: UniProt release (default: None, ask the UniProt service)
+      max_size: maximum size of the cache in bytes, enforced after the run (default: None, no limit)
+      url: URL of the UniProt service (default: uniprot_download.UNIPROT_URL)
+      connections: maximum number of concurrent downloads (default: 4)
+
+    Returns
+    -------
+      None
+
+    """
+    if release is None:
+        release = get_uniprot_release(url=url)
+    if release is None:
+        logger.warning("UniProt release unknown, cache entries are not invalidated by new releases")
+        release = UNKNOWN_RELEASE
+
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_files = [get_cache_file(cache_dir, taxid, reviewed=reviewed, release=release) for taxid in tax_list]
+    rev = " reviewed:%s" % reviewed if reviewed else ''
+    missing = [(taxid, cache_file) for taxid, cache_file in zip(tax_list, cache_files)
+               if not os.path.exists(cache_file)]
+    logger.info("%d of %d taxa cached (release %s), downloading %d taxa ...", len(tax_list) - len(missing),
+                len(tax_list), release, len(missing))
+
+    with ThreadPoolExecutor(max_workers=max(connections, 1)) as executor:
+        futures = [executor.submit(uniprot_download.download_shard, url, 'taxonomy:"%s"%s' % (taxid, rev), cache_file)
+                   for taxid, cache_file in missing]
+        for future in futures:
+            future.result()
+
+    tmp_file = "%s.%d.tmp" % (output_file, os.getpid())
+    with open(tmp_file, "wb") as output_file_open:
+        for taxid, cache_file in zip(tax_list, cache_files):
+            try:
+                cache_file_open = open(cache_file, "rb")
+            except FileNotFoundError:
+                # removed by the pruning of a concurrent run in the meantime
+                logger.info("cache entry of taxon %s was removed, downloading it again ...", taxid)
+                uniprot_download.download_shard(url, 'taxonomy:"%s"%s' % (taxid, rev), cache_file)
+                cache_file_open = open(cache_file, "rb")
+            with cache_file_open:
+                touch_entry(cache_file)
+                shutil.copyfileobj(cache_file_open, output_file_open)
+    os.replace(tmp_file, output_file)
+
+    if max_size is not None:
+        prune_cache(cache_dir, max_size=max_size)
+
+    return None
+
+
+# mPies (metaProteomics in environmental sciences) creates annotated databases for metaproteomics analysis.
+# Copyright 2018 Johannes Werner (Leibniz-Institute for Baltic Sea Research)
+# Copyright 2018 Augustin Geron (University of Mons, University of Stirling)
+# Copyright 2018 Sabine Matallana Surget (University of Stirling)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
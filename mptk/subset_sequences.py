@@ -8,7 +8,7 @@ a subset protein fasta file with only identified protein sequences.
 """
 
 import logging
-import pandas as pd
+from mptk import general_functions, index_files
 
 logger = logging.getLogger("pies.subset_sequences")
 
@@ -18,7 +18,7 @@ def parse_proteinpilot_file(excel_file):
     Parses the ProteinPilot result Excel file.
 
     The function parse_proteinpilot_file extracts the columns N, Accession, and Peptides(95%) from the UniProt results
-    file.
+    file (through the cache of `general_functions.read_proteinpilot_file`).
 
     Parameters
     ----------
@@ -29,9 +29,7 @@ def parse_proteinpilot_file(excel_file):
       df: a data frame with the kept columns
 
     """
-    df = pd.read_excel(excel_file)
-    df = df[["N", "Accession", "Peptides(95%)"]]
-    df["Accession"] = df["Accession"].str.split("|", expand=False).str[0]
+    df = general_functions.read_proteinpilot_file(excel_file)
 
     return df
 
@@ -40,36 +38,150 @@ def subset_sequence_file(df, sequence_file, sequence_file_subset):
     """
     Creates a subset of the sequence file.
 
-    Based on the identified protein accessions, a subset of the protein fasta file is generated.
+    Based on the identified protein accessions, a subset of the protein fasta file is generated. The sequence file is
+    streamed record by record (multi-line records included) and only the set of wanted accessions is kept in memory.
+    Matching records are written as soon as they are read and the scan stops as soon as all accessions were found.
 
     Parameters
     ----------
       df: a data frame with the kept columns
       sequence_file: the sequence file generated by mPies part I
+      sequence_file_subset: the subsetted sequence file
 
     Returns
     -------
-      None
+      missing: set of accessions that were not found in the sequence file
 
     """
-    sequence_dict = {}
+    wanted = set(df["Accession"].dropna().astype(str).str.encode("utf-8"))
+    remaining = set(wanted)
+    write_record = False
 
-    fasta_headers = df["Accession"].tolist()
-    with open(sequence_file) as sequence_file_open, open(sequence_file_subset, "w") as sequence_file_subset_open:
+    with open(sequence_file, "rb") as sequence_file_open, open(sequence_file_subset, "wb") as sequence_file_subset_open:
         for line in sequence_file_open:
-            if line.startswith(">"):
-                header = line.rstrip()
-            else:
-                seq = line.rstrip()
-                sequence_dict[header] = seq
-
-        for key in sequence_dict:
-            id = key[1:].split()[0]
-            if id in fasta_headers:
-                sequence_file_subset_open.write(key + "\n")
-                sequence_file_subset_open.write(sequence_dict[key] + "\n")
-
-    return
+            if line.startswith(b">"):
+                if not remaining:
+                    break
+                header_fields = line[1:].split(maxsplit=1)
+                id = header_fields[0] if header_fields else b""
+                write_record = id in wanted
+                remaining.discard(id)
+            if write_record:
+                sequence_file_subset_open.write(line)
+
+    missing = {id.decode("utf-8") for id in remaining}
+    if missing:
+        logger.warning("%d of %d accessions not found in %s (e.g. %s)", len(missing), len(wanted), sequence_file,
+                       ", ".join(sorted(missing)[:5]))
+    else:
+        logger.info("found all %d accessions in %s", len(wanted), sequence_file)
+
+    return missing
+
+
+def subset_sequence_file_indexed(df, sequence_file, index_file, sequence_file_subset):
+    """
+    Creates a subset of the sequence file using the byte-offset index.
+
+    Instead of scanning the sequence file, the identified accessions are looked up in the index created by
+    `index_files.write_fasta_index` and the records are copied from a memory map of the sequence file. The runtime
+    depends on the number of identified proteins and not on the size of the database.
+
+    Parameters
+    ----------
+      df: a data frame with the kept columns
+      sequence_file: the sequence file generated by mPies part I
+      index_file: the index of the sequence file
+      sequence_file_subset: the subsetted sequence file
+
+    Returns
+    -------
+      missing: set of accessions that were not found in the sequence file
+
+    """
+    wanted = set(df["Accession"].dropna().astype(str).str.encode("utf-8"))
+    index = index_files.read_offset_index(index_file)
+    found, missing = index_files.lookup_offsets(index=index, keys=wanted)
+
+    with open(sequence_file_subset, "wb") as sequence_file_subset_open:
+        index_files.copy_indexed_entries(found=found, input_file=sequence_file, output_file=sequence_file_subset_open)
+
+    missing = {id.decode("utf-8") for id in missing}
+    if missing:
+        logger.warning("%d of %d accessions not found in %s (e.g. %s)", len(missing), len(wanted), index_file,
+                       ", ".join(sorted(missing)[:5]))
+    else:
+        logger.info("found all %d accessions in %s", len(wanted), index_file)
+
+    return missing
+
+
+def subset_sequence_files(dfs, sequence_file, sequence_file_subsets, index_file=None):
+    """
+    Creates the subsets of the sequence file for several ProteinPilot result files at once.
+
+    A single map from accession to all output files is built, so the sequence file is only read once (or, if an index
+    is given, only the identified records are read once) and each record is written into all subsets that contain it.
+
+    Parameters
+    ----------
+      dfs: list of data frames with the kept columns (one per ProteinPilot result file)
+      sequence_file: the sequence file generated by mPies part I
+      sequence_file_subsets: list of subsetted sequence files (same order as dfs)
+      index_file: the index of the sequence file (default: None, stream the sequence file)
+
+    Returns
+    -------
+      missing: list of sets of accessions that were not found in the sequence file (same order as dfs)
+
+    """
+    if len(dfs) != len(sequence_file_subsets):
+        raise ValueError("got %d ProteinPilot results but %d output files" % (len(dfs), len(sequence_file_subsets)))
+
+    accession_outputs = {}
+    wanted_per_output = []
+    for i, df in enumerate(dfs):
+        wanted = set(df["Accession"].dropna().astype(str).str.encode("utf-8"))
+        wanted_per_output.append(wanted)
+        for id in wanted:
+            accession_outputs.setdefault(id, []).append(i)
+
+    outputs = [open(sequence_file_subset, "wb") for sequence_file_subset in sequence_file_subsets]
+    try:
+        if index_file:
+            index = index_files.read_offset_index(index_file)
+            found, remaining = index_files.lookup_offsets(index=index, keys=accession_outputs)
+            for id, record in index_files.iter_indexed_entries(found=found, input_file=sequence_file):
+                for i in accession_outputs[id]:
+                    outputs[i].write(record)
+        else:
+            remaining = set(accession_outputs)
+            targets = []
+            with open(sequence_file, "rb") as sequence_file_open:
+                for line in sequence_file_open:
+                    if line.startswith(b">"):
+                        if not remaining:
+                            break
+                        header_fields = line[1:].split(maxsplit=1)
+                        id = header_fields[0] if header_fields else b""
+                        targets = [outputs[i] for i in accession_outputs.get(id, [])]
+                        remaining.discard(id)
+                    for output in targets:
+                        output.write(line)
+    finally:
+        for output in outputs:
+            output.close()
+
+    missing = []
+    for wanted, sequence_file_subset in zip(wanted_per_output, sequence_file_subsets):
+        missing_output = {id.decode("utf-8") for id in wanted & remaining}
+        if missing_output:
+            logger.warning("%d of %d accessions for %s not found (e.g. %s)", len(missing_output), len(wanted),
+                           sequence_file_subset, ", ".join(sorted(missing_output)[:5]))
+        missing.append(missing_output)
+    logger.info("wrote %d subsets in one pass over %s", len(sequence_file_subsets), sequence_file)
+
+    return missing
 
 
 # mPies (metaProteomics in environmental sciences) creates annotated databases for metaproteomics analysis.
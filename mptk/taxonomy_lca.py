@@ -0,0 +1,357 @@
+#!/usr/bin/env python
+
+"""
+Assign the taxonomy of protein groups by the lowest common ancestor of their diamond hits.
+
+This module is an in-process alternative to `blast2lca` (MEGAN) and `parse_taxonomy`. The accessions of the diamond
+hits are mapped onto taxIDs, the hits of each protein group are filtered by bitscore (top percent, like MEGAN) and the
+lowest common ancestor (LCA) of the remaining taxIDs is computed on the array-backed taxonomy of `ncbi_taxonomy`. The
+result is written in the format of the table created by `parse_taxonomy`.
+"""
+
+import logging
+import multiprocessing
+import numpy as np
+import pandas as pd
+from functools import partial
+from mptk import general_functions, ncbi_taxonomy, parse_taxonomy
+
+logger = logging.getLogger("mptk.taxonomy_lca")
+
+# the taxonomy of a worker process, loaded by init_worker
+_WORKER_TAXONOMY = None
+
+
+def get_accessions(sseqid):
+    """
+    Extract the accessions (without version) of the diamond subject IDs.
+
+    The subject IDs of the NCBI nr database are accessions with version (e.g. WP_003131952.1), for IDs separated by
+    "|" the last field is used.
+
+    Parameters
+    ----------
+      sseqid: series with the subject IDs
+
+    Returns
+    -------
+      series with the accessions
+
+    """
+    # the extraction runs once per distinct subject ID on the categories
+    sseqid = sseqid.astype("category")
+    categories = pd.Series(sseqid.cat.categories.astype(str))
+    accessions = categories.str.rstrip("|").str.rsplit("|", n=1).str[-1].str.replace(r"\.\d+$", "", regex=True)
+
+    return pd.Series(accessions.to_numpy()[sseqid.cat.codes.to_numpy()], index=sseqid.index).where(sseqid.notna())
+
+
+def read_acc2taxid_table(acc2taxid_file, accessions, chunksize=10000000):
+    """
+    Read the taxIDs of the given accessions from an accession2taxid table.
+
+    The table (e.g. prot.accession2taxid.gz from ftp://ftp.ncbi.nih.gov/pub/taxonomy/accession2taxid/) is streamed in
+    chunks and only the rows of the accessions are kept.
+
+    Parameters
+    ----------
+      acc2taxid_file: the accession2taxid table (with the columns accession and taxid, optionally compressed)
+      accessions: accessions without version
+      chunksize: number of rows per chunk (default: 10000000)
+
+    Returns
+    -------
+      series with accessions as index and taxIDs as values
+
+    """
+    accessions = pd.Index(accessions).unique()
+    chunks = pd.read_csv(acc2taxid_file, sep="\t", header=0, usecols=["accession", "taxid"],
+                         dtype={"accession": str, "taxid": np.int64}, chunksize=chunksize)
+    acc2taxid_dfs = [chunk[chunk["accession"].isin(accessions)] for chunk in chunks]
+    acc2taxid_df = pd.concat(acc2taxid_dfs, ignore_index=True) if acc2taxid_dfs else \
+        pd.DataFrame({"accession": pd.Series(dtype=str), "taxid": pd.Series(dtype=np.int64)})
+
+    return acc2taxid_df.drop_duplicates("accession").set_index("accession")["taxid"]
+
+
+def map_accessions(acc2taxid_file, accessions):
+    """
+    Map accessions onto taxIDs with an accession2taxid index (`prepare_acc2taxid`) or table.
+
+    Parameters
+    ----------
+      acc2taxid_file: the accession2taxid index or table
+      accessions: series with accessions without version
+
+    Returns
+    -------
+      array with the taxID of each accession (-1 if not found)
+
+    """
+    if general_functions.is_acc2taxid_index(acc2taxid_file):
+        taxids = np.full(len(accessions), -1, dtype=np.int64)
+        known = accessions.notna().to_numpy()
+        taxids[known] = general_functions.lookup_acc2taxid(acc2taxid_file, accessions.to_numpy()[known])
+        return taxids
+
+    acc2taxid = read_acc2taxid_table(acc2taxid_file, accessions=accessions.dropna().unique())
+
+    return accessions.map(acc2taxid).fillna(-1).to_numpy(dtype=np.int64)
+
+
+def filter_top_percent(diamond_df, top_percent=10.0):
+    """
+    Keep the hits of each protein group with a bitscore within top percent of the best bitscore of the group.
+
+    Parameters
+    ----------
+      diamond_df: data frame with the columns qseqid and bitscore
+      top_percent: maximum distance to the best bitscore in percent (default: 10)
+
+    Returns
+    -------
+      the filtered data frame
+
+    """
+    best_bitscore = diamond_df.groupby("qseqid", sort=False)["bitscore"].transform("max")
+
+    return diamond_df[diamond_df["bitscore"] >= best_bitscore * (1 - top_percent / 100.0)]
+
+
+def lowest_common_ancestors(taxonomy, taxids_a, taxids_b):
+    """
+    Compute the lowest common ancestors of pairs of taxIDs.
+
+    The deeper taxID of each pair is lifted to the depth of the other one, then both are lifted until they meet.
+
+    Parameters
+    ----------
+      taxonomy: the Taxonomy object
+      taxids_a: array of taxIDs (connected to the root)
+      taxids_b: array of taxIDs (connected to the root)
+
+    Returns
+    -------
+      array with the lowest common ancestor of each pair
+
+    """
+    taxids_a = np.array(taxids_a, dtype=np.int64)
+    taxids_b = np.array(taxids_b, dtype=np.int64)
+    depth_a = taxonomy.depth[taxids_a].astype(np.int64)
+    depth_b = taxonomy.depth[taxids_b].astype(np.int64)
+
+    deeper = depth_a > depth_b
+    while deeper.any():
+        taxids_a[deeper] = taxonomy.parent[taxids_a[deeper]]
+        depth_a[deeper] -= 1
+        deeper = depth_a > depth_b
+    deeper = depth_b > depth_a
+    while deeper.any():
+        taxids_b[deeper] = taxonomy.parent[taxids_b[deeper]]
+        depth_b[deeper] -= 1
+        deeper = depth_b > depth_a
+
+    different = taxids_a != taxids_b
+    while different.any():
+        taxids_a[different] = taxonomy.parent[taxids_a[different]]
+        taxids_b[different] = taxonomy.parent[taxids_b[different]]
+        different = taxids_a != taxids_b
+
+    return taxids_a
+
+
+def init_worker(abspath_nodes_dmp):
+    """
+    Load the taxonomy once per worker process (see `lca_chunk`).
+
+    Parameters
+    ----------
+      abspath_nodes_dmp: absolute path of nodes.dmp (the taxonomy is loaded from its cache)
+
+    Returns
+    -------
+      None
+
+    """
+    global _WORKER_TAXONOMY
+    _WORKER_TAXONOMY = ncbi_taxonomy.load_taxonomy(abspath_nodes_dmp=abspath_nodes_dmp)
+
+    return None
+
+
+def lca_chunk(chunk, taxonomy=None):
+    """
+    Compute the lowest common ancestor of each protein group of a chunk.
+
+    Parameters
+    ----------
+      chunk: tuple of two arrays, the protein groups (sorted) and the taxIDs of their hits
+      taxonomy: the Taxonomy object (default: None, the taxonomy loaded by `init_worker`)
+
+    Returns
+    -------
+      groups: array with the protein groups
+      lca: array with the lowest common ancestor of each protein group
+
+    """
+    groups, taxids = chunk
+    if taxonomy is None:
+        taxonomy = _WORKER_TAXONOMY
+
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    counts = np.diff(np.r_[starts, len(groups)])
+    lca = taxids[starts].astype(np.int64)
+    # one round per hit rank, each round combines the next hit of all groups with enough hits
+    for rank in range(1, int(counts.max()) if len(counts) else 0):
+        selected = counts > rank
+        lca[selected] = lowest_common_ancestors(taxonomy, lca[selected], taxids[starts[selected] + rank])
+
+    return groups[starts], lca
+
+
+def iter_group_chunks(groups, taxids, chunk_size):
+    """
+    Split the hits into chunks of whole protein groups.
+
+    Parameters
+    ----------
+      groups: array with the protein groups (sorted)
+      taxids: array with the taxIDs of the hits
+      chunk_size: approximate number of hits per chunk
+
+    Returns
+    -------
+      generator of tuples with the protein groups and taxIDs of a chunk
+
+    """
+    start = 0
+    while start < len(groups):
+        end = min(start + chunk_size, len(groups))
+        # do not split the hits of a protein group
+        end = int(np.searchsorted(groups, groups[end - 1], side="right"))
+        yield groups[start:end], taxids[start:end]
+        start = end
+
+
+def create_rank_table(groups, lca, taxonomy, tax_names):
+    """
+    Create the table with the names and scores of the taxonomic ranks of the lowest common ancestors.
+
+    The columns are the same as the ones of the table created by `parse_taxonomy` (the columns ed_name to es_score of
+    `blast2lca` are left empty). The score of the ranks of the lowest common ancestor is 100, as the taxon is in the
+    lineage of all hits.
+
+    Parameters
+    ----------
+      groups: array with the protein groups
+      lca: array with the lowest common ancestor of each protein group
+      taxonomy: the Taxonomy object
+      tax_names: the TaxNames object
+
+    Returns
+    -------
+      df: data frame with the column protein_group and the name and score of each taxonomic rank
+
+    """
+    rank_matrix = taxonomy.get_rank_matrix(lca, ranks=ncbi_taxonomy.RANKS)
+    rank_taxids = np.unique(rank_matrix[rank_matrix > 0])
+    rank_names = np.array([tax_names.get(taxid, "unknown") for taxid in rank_taxids.tolist()], dtype=object)
+
+    # integer protein groups and scores, like the table of `parse_taxonomy` (e.g. 100, not 100.0)
+    df = pd.DataFrame({"protein_group": groups.astype(np.int64)})
+    scores = np.full(len(groups), 100, dtype=np.int64)
+    for rank, name_column, score_column in zip(parse_taxonomy.RANKS, parse_taxonomy.NAME_COLUMNS,
+                                               parse_taxonomy.SCORE_COLUMNS):
+        if rank.startswith("e"):
+            df[name_column] = np.nan
+            df[score_column] = pd.arrays.IntegerArray(scores, np.ones(len(groups), dtype=bool))
+            continue
+        column = rank_matrix[:, parse_taxonomy.RANKS.index(rank)]
+        assigned = column > 0
+        names = np.full(len(column), np.nan, dtype=object)
+        names[assigned] = rank + "__" + rank_names[np.searchsorted(rank_taxids, column[assigned])]
+        df[name_column] = names
+        df[score_column] = pd.arrays.IntegerArray(scores, ~assigned)
+
+    return df
+
+
+def assign_taxonomy(diamond_file, acc2taxid_file, output_table, names_dmp=None, nodes_dmp=None, top_percent=10.0,
+                    threads=1, chunk_size=100000):
+    """
+    Assign the taxonomy of the protein groups and write the parsed taxonomy table.
+
+    Parameters
+    ----------
+      diamond_file: diamond output file with protein groups (protein_groups)
+      acc2taxid_file: the accession2taxid index (`prepare_acc2taxid`) or table
+      output_table: output table with parsed taxonomy
+      names_dmp: location of names.dmp (default: None, downloaded if not existing)
+      nodes_dmp: location of nodes.dmp (default: None, downloaded if not existing)
+      top_percent: maximum distance to the best bitscore of a protein group in percent (default: 10)
+      threads: number of worker processes (default: 1)
+      chunk_size: approximate number of hits per worker chunk (default: 100000)
+
+    Returns
+    -------
+      None
+
+    """
+    abspath_nodes_dmp = general_functions.get_nodes_dmp(nodes_dmp=nodes_dmp)
+    taxonomy = ncbi_taxonomy.load_taxonomy(abspath_nodes_dmp=abspath_nodes_dmp)
+    tax_names = general_functions.create_tax_dict(abspath_names_dmp=general_functions.get_names_dmp(names_dmp))
+
+    diamond_df = general_functions.read_diamond_table(diamond_file=diamond_file,
+                                                      columns=["qseqid", "sseqid", "bitscore"],
+                                                      dtypes={"qseqid": np.float64})
+    diamond_df = filter_top_percent(diamond_df.dropna(subset=["qseqid"]), top_percent=top_percent)
+    accessions = get_accessions(diamond_df["sseqid"])
+    taxids = map_accessions(acc2taxid_file, accessions=accessions)
+
+    valid = (taxids > 0) & (taxids < len(taxonomy.parent))
+    valid[valid] = taxonomy.depth[taxids[valid]] >= 0
+    logger.info("%d of %d hits have a taxID in the taxonomy", int(valid.sum()), len(taxids))
+    hits_df = pd.DataFrame({"group": diamond_df["qseqid"].to_numpy()[valid], "taxid": taxids[valid]})
+    hits_df = hits_df.drop_duplicates().sort_values(["group", "taxid"])
+    groups = hits_df["group"].to_numpy()
+    taxids = hits_df["taxid"].to_numpy()
+
+    # the workers load the taxonomy once, the single process uses the loaded one
+    pool = None
+    if threads > 1:
+        pool = multiprocessing.Pool(threads, initializer=init_worker, initargs=(abspath_nodes_dmp,))
+    try:
+        chunks = iter_group_chunks(groups, taxids, chunk_size=chunk_size)
+        results = list(pool.imap(lca_chunk, chunks) if pool else map(partial(lca_chunk, taxonomy=taxonomy), chunks))
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    result_groups = np.concatenate([result[0] for result in results]) if results else np.empty(0)
+    result_lca = np.concatenate([result[1] for result in results]) if results else np.empty(0, dtype=np.int64)
+    logger.info("assigned the taxonomy of %d protein groups", len(result_groups))
+
+    df = create_rank_table(result_groups, result_lca, taxonomy=taxonomy, tax_names=tax_names)
+    df.to_csv(output_table, sep="\t", encoding="utf-8", index=False)
+
+    return None
+
+
+# mPies (metaProteomics in environmental sciences) creates annotated databases for metaproteomics analysis.
+# Copyright 2018 Johannes Werner (Leibniz-Institute for Baltic Sea Research)
+# Copyright 2018 Augustin Geron (University of Mons, University of Stirling)
+# Copyright 2018 Sabine Matallana Surget (University of Stirling)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,312 @@
+#!/usr/bin/env python
+
+"""
+Parse UniProt dat files in parallel.
+
+This module is a pipeline version of `general_functions.parse_uniprot_file`. One reader thread decompresses the dat
+file (with pigz or python-isal if available) and cuts it into chunks of complete entries, worker processes parse the
+entries with prefix tests, and the GO table and the protein name table are compressed by writer threads (or pigz
+processes). Both tables can be written in one pass.
+"""
+
+import gzip
+import logging
+import multiprocessing
+import queue
+import shutil
+import subprocess
+import threading
+from functools import partial
+from mptk import uniprot_store
+
+logger = logging.getLogger("mptk.uniprot_dat")
+
+ENTRY_END = b"\n//\n"
+
+
+class PigzReader(object):
+    """
+    Read the output of a pigz decompression process.
+
+    Closing the reader waits for pigz and raises an OSError if pigz failed (e.g. for a truncated or corrupt file). If
+    the reader is closed before the end of the output, pigz is killed instead.
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.process = subprocess.Popen(["pigz", "-dc", file_name], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                        bufsize=1048576)
+        self.eof = False
+
+    def read(self, size=-1):
+        block = self.process.stdout.read(size)
+        if not block and size != 0:
+            self.eof = True
+        return block
+
+    def close(self):
+        if self.process.returncode is not None:
+            return
+        if not self.eof:
+            self.process.kill()
+        self.process.stdout.close()
+        stderr = self.process.stderr.read()
+        self.process.stderr.close()
+        returncode = self.process.wait()
+        if self.eof and returncode != 0:
+            raise OSError("pigz failed to decompress %s (exit code %d): %s" % (self.file_name, returncode,
+                                                                                stderr.decode("utf-8", "replace").strip()))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.eof = False
+        self.close()
+
+
+def open_decompressed(file_name):
+    """
+    Open a gzipped file for reading.
+
+    pigz is used for the decompression if it is installed, otherwise python-isal and gzip as fallback. All of them
+    raise an error at the latest when the file object is closed if the file is truncated or corrupt.
+
+    Parameters
+    ----------
+      file_name: the gzipped file
+
+    Returns
+    -------
+      a binary file object with the decompressed content
+
+    """
+    if shutil.which("pigz"):
+        logger.debug("decompressing %s with pigz", file_name)
+        return PigzReader(file_name)
+    try:
+        from isal import igzip
+        logger.debug("decompressing %s with isal", file_name)
+        return igzip.open(file_name, "rb")
+    except ImportError:
+        return gzip.open(file_name, "rb")
+
+
+class CompressedWriter(object):
+    """
+    Write a gzipped file in a background thread.
+
+    The data is compressed by a pigz process with several threads if pigz is installed, otherwise by gzip in a writer
+    thread, so the compression runs in parallel to the parsing.
+    """
+
+    def __init__(self, file_name, threads=1):
+        self.file_open = open(file_name, "wb")
+        self.process = None
+        if shutil.which("pigz"):
+            self.process = subprocess.Popen(["pigz", "-p", str(max(threads, 1)), "-c"], stdin=subprocess.PIPE,
+                                            stdout=self.file_open)
+            self.output = self.process.stdin
+        else:
+            self.output = gzip.GzipFile(fileobj=self.file_open, mode="wb", compresslevel=6)
+        self.queue = queue.Queue(maxsize=16)
+        self.error = None
+        self.thread = threading.Thread(target=self._write)
+        self.thread.start()
+
+    def _write(self):
+        while True:
+            block = self.queue.get()
+            if block is None:
+                return
+            if self.error is None:
+                try:
+                    self.output.write(block)
+                except Exception as e:
+                    self.error = e
+
+    def write(self, block):
+        if self.error is not None:
+            raise self.error
+        if block:
+            self.queue.put(block)
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        try:
+            self.output.close()
+        finally:
+            returncode = self.process.wait() if self.process else 0
+            self.file_open.close()
+        if self.error is not None:
+            raise self.error
+        if returncode != 0:
+            raise OSError("pigz failed to compress %s (exit code %d)" % (self.file_open.name, returncode))
+
+
+def iter_entry_chunks(uniprot_file, chunk_size=8388608):
+    """
+    Read the decompressed dat file in chunks of complete entries.
+
+    A reader thread decompresses the file and cuts it at entry boundaries (`//` lines).
+
+    Parameters
+    ----------
+      uniprot_file: the zipped UniProt dat file
+      chunk_size: approximate number of bytes per chunk (default: 8 MiB)
+
+    Returns
+    -------
+      generator of chunks (bytes)
+
+    """
+    chunks = queue.Queue(maxsize=32)
+    errors = []
+
+    def read():
+        rest = b""
+        try:
+            with open_decompressed(uniprot_file) as uniprot_file_open:
+                while True:
+                    block = uniprot_file_open.read(chunk_size)
+                    if not block:
+                        break
+                    block = rest + block
+                    cut = block.rfind(ENTRY_END)
+                    if cut == -1:
+                        rest = block
+                    else:
+                        chunks.put(block[:cut + len(ENTRY_END)])
+                        rest = block[cut + len(ENTRY_END):]
+            if rest:
+                chunks.put(rest)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            chunks.put(None)
+
+    reader = threading.Thread(target=read, daemon=True)
+    reader.start()
+    while True:
+        chunk = chunks.get()
+        if chunk is None:
+            break
+        yield chunk
+    reader.join()
+    if errors:
+        raise errors[0]
+
+
+def parse_uniprot_chunk(chunk, go_annotation=True, protein_names=True):
+    """
+    Parse GO annotations and protein names from a chunk of UniProt entries.
+
+    The lines are selected by prefix tests and produce the same rows as `general_functions.parse_uniprot_file`.
+
+    Parameters
+    ----------
+      chunk: complete UniProt entries (bytes)
+      go_annotation: create the rows of the GO table (default: True)
+      protein_names: create the rows of the protein name table (default: True)
+
+    Returns
+    -------
+      go_block: rows of the GO table (bytes)
+      name_block: rows of the protein name table (bytes)
+
+    """
+    go_rows = []
+    name_rows = []
+    id_field = b""
+
+    for line in chunk.split(b"\n"):
+        if line.startswith(b"ID"):
+            id_field = line.split()[1]
+        elif go_annotation and line.startswith(b"DR   GO;"):
+            go_field = line.split(maxsplit=1)[1].split(b"; ")[1:3]
+            go_rows.append(id_field + b"\t" + go_field[0] + b"\t" + go_field[1] + b"\n")
+        elif protein_names and line.startswith(b"DE ") and line[2:].lstrip().startswith(b"RecName:"):
+            proteinname_field = line.split(maxsplit=1)[1].split(b"=")[1].rstrip()
+            name_rows.append(id_field + b"\t" + proteinname_field + b"\n")
+
+    return b"".join(go_rows), b"".join(name_rows)
+
+
+def parse_uniprot_file_parallel(uniprot_file, go_table=None, protein_name_table=None, threads=1, store=False):
+    """
+    Parse GO annotations and protein names from UniProt dat files in parallel.
+
+    The function creates the GO table (accession, GO ID and GO category) and/or the protein name table (accession and
+    protein name) from the dat file in one pass.
+
+    Parameters
+    ----------
+      uniprot_file: the zipped UniProt dat file
+      go_table: zipped output table with GO annotations (default: None, not created)
+      protein_name_table: zipped output table with protein names (default: None, not created)
+      threads: number of worker processes (default: 1)
+      store: write the tables as UniProt stores (see `uniprot_store`) instead of gzipped tables (default: False)
+
+    Returns
+    -------
+      None
+
+    """
+    if not go_table and not protein_name_table:
+        raise ValueError("neither a GO table nor a protein name table was given")
+
+    parse_chunk = partial(parse_uniprot_chunk, go_annotation=bool(go_table), protein_names=bool(protein_name_table))
+    writer_class = uniprot_store.StoreWriter if store else CompressedWriter
+    go_writer = writer_class(go_table, threads=threads) if go_table else None
+    name_writer = writer_class(protein_name_table, threads=threads) if protein_name_table else None
+
+    writers = [writer for writer in [go_writer, name_writer] if writer]
+    pool = multiprocessing.Pool(threads) if threads > 1 else None
+    try:
+        chunks = iter_entry_chunks(uniprot_file)
+        parsed_chunks = pool.imap(parse_chunk, chunks) if pool else map(parse_chunk, chunks)
+        for go_block, name_block in parsed_chunks:
+            if go_writer:
+                go_writer.write(go_block)
+            if name_writer:
+                name_writer.write(name_block)
+    except BaseException:
+        # terminate the workers instead of letting the pool parse the rest of the dat file
+        if pool:
+            pool.terminate()
+            pool.join()
+        for writer in writers:
+            try:
+                writer.close()
+            except Exception as e:
+                logger.warning("could not close an output table after an error: %s", e)
+        raise
+
+    if pool:
+        pool.close()
+        pool.join()
+    for writer in writers:
+        writer.close()
+
+    return None
+
+
+# mPies (metaProteomics in environmental sciences) creates annotated databases for metaproteomics analysis.
+# Copyright 2018 Johannes Werner (Leibniz-Institute for Baltic Sea Research)
+# Copyright 2018 Augustin Geron (University of Mons, University of Stirling)
+# Copyright 2018 Sabine Matallana Surget (University of Stirling)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
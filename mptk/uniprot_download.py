@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+
+"""
+Download protein sequences from UniProt in parallel.
+
+A query (or a list of taxa) is split into shards, which are downloaded concurrently by a bounded thread pool. Each
+shard is streamed to a part file in chunks (gzip-compressed during the transfer if the server supports it) and
+retried after errors, continuing a partial download with a range request if the server supports it. Finished shards
+are kept until all shards are downloaded, so an interrupted download can be resumed. The shards are merged into one
+fasta file without duplicated entries.
+"""
+
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPException, IncompleteRead
+
+logger = logging.getLogger("mptk.uniprot_download")
+
+UNIPROT_URL = "https://legacy.uniprot.org/uniprot/"
+
+
+def split_taxon_queries(tax_list, shard_size=50, query=None):
+    """
+    Split a list of taxa into queries of at most `shard_size` taxa.
+
+    Parameters
+    ----------
+      tax_list: list of tax IDs or tax names
+      shard_size: maximum number of taxa per query (default: 50)
+      query: query the taxa are combined with (default: None)
+
+    Returns
+    -------
+      list of queries
+
+    """
+    queries = []
+    for start in range(0, len(tax_list), shard_size):
+        taxon_query = " OR ".join('taxonomy:"%s"' % taxon for taxon in tax_list[start:start + shard_size])
+        queries.append("( %s ) AND ( %s )" % (taxon_query, query) if query else taxon_query)
+
+    return queries
+
+
+def get_shard_file(shard_dir, url, query):
+    """
+    Return the path of the shard of a query, named after the SHA-1 digest of the URL and the query.
+
+    Parameters
+    ----------
+      shard_dir: shard directory
+      url: URL of the UniProt service
+      query: the UniProt query
+
+    Returns
+    -------
+      path of the shard
+
+    """
+    digest = hashlib.sha1(("%s\n%s" % (url, query)).encode("utf-8")).hexdigest()
+
+    return os.path.join(shard_dir, "shard-%s.fasta" % digest[:16])
+
+
+def download_shard(url, query, shard_file, retries=5, retry_wait=10, timeout=600, chunk_size=1048576):
+    """
+    Download the sequences of one query into a file unless the file already exists.
+
+    The download holds an exclusive lock on `shard_file` + ".lock", so concurrent runs sharing a directory (e.g. the
+    proteome cache) download each file once and never write the same part file (see `fetch_shard`).
+
+    Parameters
+    ----------
+      url: URL of the UniProt service
+      query: the UniProt query
+      shard_file: output file
+      retries: number of retries after errors (default: 5)
+      retry_wait: seconds to wait before the first retry, doubled for each further retry (default: 10)
+      timeout: socket timeout in seconds (default: 600)
+      chunk_size: number of bytes read per chunk (default: 1 MiB)
+
+    Returns
+    -------
+      None
+
+    """
+    if os.path.exists(shard_file):
+        return None
+
+    lock_file = shard_file + ".lock"
+    while True:
+        with open(lock_file, "a") as lock_file_open:
+            fcntl.flock(lock_file_open, fcntl.LOCK_EX)
+            # the lock file may have been removed (see `remove_lock`) while this run waited for the lock
+            try:
+                if not os.path.samestat(os.fstat(lock_file_open.fileno()), os.stat(lock_file)):
+                    continue
+            except FileNotFoundError:
+                continue
+            # another run may have finished the file while this one waited for the lock
+            if not os.path.exists(shard_file):
+                fetch_shard(url, query, shard_file, retries=retries, retry_wait=retry_wait, timeout=timeout,
+                            chunk_size=chunk_size)
+            return None
+
+
+def remove_lock(shard_file):
+    """
+    Remove the lock file of a shard file unless a download holds it.
+
+    Parameters
+    ----------
+      shard_file: the shard file
+
+    Returns
+    -------
+      1 if the lock file was removed, 0 if it does not exist or is held
+
+    """
+    try:
+        lock_file_open = open(shard_file + ".lock", "r")
+    except FileNotFoundError:
+        return 0
+    with lock_file_open:
+        try:
+            fcntl.flock(lock_file_open, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return 0
+        # removed while holding the lock, so a waiting download notices it and locks a new file
+        try:
+            os.remove(shard_file + ".lock")
+        except FileNotFoundError:
+            return 0
+
+    return 1
+
+
+def fetch_shard(url, query, shard_file, retries=5, retry_wait=10, timeout=600, chunk_size=1048576):
+    """
+    Download the sequences of one query into a file.
+
+    The response is written to `shard_file` + ".part" in chunks and renamed to `shard_file` when it is complete. If
+    the part file already exists (e.g. after an error or an interrupted run), the download is continued with a range
+    request. Servers that ignore the range request send the whole response, which then replaces the part file.
+
+    Parameters
+    ----------
+      url: URL of the UniProt service
+      query: the UniProt query
+      shard_file: output file
+      retries: number of retries after errors (default: 5)
+      retry_wait: seconds to wait before the first retry, doubled for each further retry (default: 10)
+      timeout: socket timeout in seconds (default: 600)
+      chunk_size: number of bytes read per chunk (default: 1 MiB)
+
+    Returns
+    -------
+      None
+
+    """
+    part_file = shard_file + ".part"
+    data = urllib.parse.urlencode({"query": query, "force": "yes", "format": "fasta"}).encode("utf-8")
+    for attempt in range(retries + 1):
+        offset = os.path.getsize(part_file) if os.path.exists(part_file) else 0
+        # ranges refer to the uncompressed response, so partial downloads are continued without compression
+        headers = {"Range": "bytes=%d-" % offset, "Accept-Encoding": "identity"} if offset else \
+            {"Accept-Encoding": "gzip"}
+        try:
+            request = urllib.request.Request(url, data, headers=headers)
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                resumed = offset and response.status == 206
+                gzipped = response.headers.get("Content-Encoding", "").lower() == "gzip"
+                expected = response.headers.get("Content-Length")
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if gzipped else None
+                received = 0
+                with open(part_file, "ab" if resumed else "wb") as part_file_open:
+                    while True:
+                        chunk = response.read(chunk_size)
+                        if not chunk:
+                            break
+                        received += len(chunk)
+                        part_file_open.write(decompressor.decompress(chunk) if decompressor else chunk)
+                    if decompressor:
+                        part_file_open.write(decompressor.flush())
+                if expected is not None and received < int(expected):
+                    raise IncompleteRead(b"", int(expected) - received)
+                if decompressor and not decompressor.eof:
+                    raise IncompleteRead(b"")
+            os.replace(part_file, shard_file)
+            return None
+        except urllib.error.HTTPError as e:
+            if e.code == 416 and offset:
+                # the part file already holds the whole response
+                os.replace(part_file, shard_file)
+                return None
+            if (e.code < 500 and e.code != 429) or attempt == retries:
+                raise
+            error = e
+        except (urllib.error.URLError, HTTPException, OSError, zlib.error) as e:
+            if isinstance(e, zlib.error) and os.path.exists(part_file):
+                os.remove(part_file)
+            if attempt == retries:
+                raise
+            error = e
+        wait = retry_wait * 2 ** attempt
+        logger.warning("download of %s failed (%s), retrying in %d s", os.path.basename(shard_file), error, wait)
+        time.sleep(wait)
+
+    return None
+
+
+def merge_fasta_files(fasta_files, output_file):
+    """
+    Merge fasta files and skip entries with an already written ID (the first word of the header).
+
+    Parameters
+    ----------
+      fasta_files: list of fasta files
+      output_file: merged fasta file
+
+    Returns
+    -------
+      number of written entries
+
+    """
+    seen = set()
+    written = 0
+    skipped = 0
+    tmp_file = "%s.%d.tmp" % (output_file, os.getpid())
+    with open(tmp_file, "wb") as output_file_open:
+        for fasta_file in fasta_files:
+            with open(fasta_file, "rb") as fasta_file_open:
+                keep = False
+                for line in fasta_file_open:
+                    if line.startswith(b">"):
+                        entry_id = line[1:].split(None, 1)[0] if line[1:].strip() else b""
+                        keep = entry_id not in seen
+                        seen.add(entry_id)
+                        written += keep
+                        skipped += not keep
+                    if keep:
+                        output_file_open.write(line)
+    os.replace(tmp_file, output_file)
+    if skipped:
+        logger.info("skipped %d duplicated entries", skipped)
+
+    return written
+
+
+def download_sequences(queries, output_file, url=UNIPROT_URL, connections=4, retries=5, retry_wait=10):
+    """
+    Download the sequences of several queries concurrently into one fasta file.
+
+    The shards are written into the directory `output_file` + ".shards", which is removed after the merge. If the
+    download is interrupted, rerunning it only downloads the missing shards. The shards are named after their URL and
+    query (see `get_shard_file`), so shards left by a run with other queries are not merged.
+
+    Parameters
+    ----------
+      queries: list of UniProt queries
+      output_file: output fasta file
+      url: URL of the UniProt service (default: UNIPROT_URL)
+      connections: maximum number of concurrent downloads (default: 4)
+      retries: number of retries of each shard (default: 5)
+      retry_wait: seconds to wait before the first retry of a shard (default: 10)
+
+    Returns
+    -------
+      None
+
+    """
+    shard_dir = output_file + ".shards"
+    os.makedirs(shard_dir, exist_ok=True)
+    queries = list(dict.fromkeys(queries))
+    shard_files = [get_shard_file(shard_dir, url, query) for query in queries]
+    logger.info("downloading %d shards with %d connections ...", len(queries), connections)
+
+    with ThreadPoolExecutor(max_workers=max(connections, 1)) as executor:
+        futures = [executor.submit(download_shard, url, query, shard_file, retries=retries, retry_wait=retry_wait)
+                   for query, shard_file in zip(queries, shard_files)]
+        for future in futures:
+            future.result()
+
+    written = merge_fasta_files(shard_files, output_file)
+    shutil.rmtree(shard_dir)
+    if not written:
+        logger.warning("no sequences were downloaded")
+    logger.info("downloaded %d sequences", written)
+
+    return None
+
+
+# mPies (metaProteomics in environmental sciences) creates annotated databases for metaproteomics analysis.
+# Copyright 2018 Johannes Werner (Leibniz-Institute for Baltic Sea Research)
+# Copyright 2018 Augustin Geron (University of Mons, University of Stirling)
+# Copyright 2018 Sabine Matallana Surget (University of Stirling)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+
+"""
+Create and query sorted block-compressed UniProt tables.
+
+A UniProt store contains the rows of a UniProt table (GO table or protein name table) sorted by UniProt ID and cut into
+zlib-compressed blocks that never split the rows of one ID. A sparse index with the first ID of each block is stored
+at the end of the file, so the rows of a set of IDs can be read by decompressing only the blocks that contain them
+instead of loading the whole table.
+"""
+
+import gzip
+import heapq
+import logging
+import numpy as np
+import os
+import struct
+import tempfile
+import zlib
+from mptk import index_files
+
+logger = logging.getLogger("mptk.uniprot_store")
+
+STORE_MAGIC = b"MPTKUPS1"
+STORE_HEADER = struct.Struct("<8sIIQQQ")
+
+
+def row_key(row):
+    """
+    Return the UniProt ID (first column) of a table row.
+
+    Parameters
+    ----------
+      row: the tab-separated row (bytes)
+
+    Returns
+    -------
+      the UniProt ID (bytes)
+
+    """
+    return row[:row.find(b"\t")]
+
+
+class StoreWriter(object):
+    """
+    Write a UniProt store from unsorted table rows.
+
+    The rows are collected in sorted runs of about `run_size` bytes in temporary files (external merge sort). When
+    the writer is closed, the runs are merged into the blocks of the store. The rows of one ID keep their input order.
+    The writer has the same interface as `uniprot_dat.CompressedWriter`.
+    """
+
+    def __init__(self, file_name, threads=1, run_size=268435456, block_size=65536):
+        self.file_name = file_name
+        self.run_size = run_size
+        self.block_size = block_size
+        self.tmp_dir = tempfile.mkdtemp(prefix=".mptk_store_", dir=os.path.dirname(os.path.abspath(file_name)))
+        self.runs = []
+        self.rows = []
+        self.rows_size = 0
+
+    def write(self, block):
+        if not block:
+            return
+        self.rows.extend(block.splitlines(keepends=True))
+        self.rows_size += len(block)
+        if self.rows_size >= self.run_size:
+            self._write_run()
+
+    def _write_run(self):
+        if not self.rows:
+            return
+        # list.sort is stable, so rows of one ID keep their order
+        self.rows.sort(key=row_key)
+        run_file = os.path.join(self.tmp_dir, "run%d.gz" % len(self.runs))
+        with gzip.open(run_file, "wb", compresslevel=1) as run_file_open:
+            run_file_open.writelines(self.rows)
+        self.runs.append(run_file)
+        self.rows = []
+        self.rows_size = 0
+
+    def close(self):
+        self._write_run()
+        logger.info("merging %d sorted runs into %s ...", len(self.runs), self.file_name)
+        run_files_open = [gzip.open(run_file, "rb") for run_file in self.runs]
+        try:
+            write_store(rows=heapq.merge(*run_files_open, key=row_key), store_file=self.file_name,
+                        block_size=self.block_size)
+        finally:
+            for run_file_open in run_files_open:
+                run_file_open.close()
+            for run_file in self.runs:
+                os.remove(run_file)
+            os.rmdir(self.tmp_dir)
+
+
+def write_store(rows, store_file, block_size=65536):
+    """
+    Write sorted table rows into a UniProt store.
+
+    Parameters
+    ----------
+      rows: iterable of tab-separated rows (bytes, with line break) sorted by UniProt ID
+      store_file: output store file
+      block_size: minimum number of uncompressed bytes per block (default: 64 KiB)
+
+    Returns
+    -------
+      None
+
+    """
+    first_keys = []
+    offsets = []
+    lengths = []
+    n_rows = 0
+    n_columns = 0
+
+    tmp_file = "%s.%d.tmp" % (store_file, os.getpid())
+    with open(tmp_file, "wb") as store_file_open:
+        store_file_open.write(STORE_HEADER.pack(STORE_MAGIC, 0, 0, 0, 0, 0))
+
+        def flush(block_rows):
+            data = zlib.compress(b"".join(block_rows), 6)
+            first_keys.append(row_key(block_rows[0]))
+            offsets.append(store_file_open.tell())
+            lengths.append(len(data))
+            store_file_open.write(data)
+
+        block_rows = []
+        block_bytes = 0
+        previous_key = None
+        for row in rows:
+            key = row_key(row)
+            # blocks are only cut between IDs, so all rows of an ID are in one block
+            if block_bytes >= block_size and key != previous_key:
+                flush(block_rows)
+                block_rows = []
+                block_bytes = 0
+            if not n_columns:
+                n_columns = row.count(b"\t") + 1
+            block_rows.append(row if row.endswith(b"\n") else row + b"\n")
+            block_bytes += len(row)
+            previous_key = key
+            n_rows += 1
+        if block_rows:
+            flush(block_rows)
+
+        key_width = max((len(key) for key in first_keys), default=1)
+        index = np.empty(len(first_keys), dtype=index_files.index_dtype(key_width))
+        index["key"] = first_keys
+        index["offset"] = offsets
+        index["length"] = lengths
+        index_offset = store_file_open.tell()
+        index.tofile(store_file_open)
+        store_file_open.seek(0)
+        store_file_open.write(STORE_HEADER.pack(STORE_MAGIC, key_width, n_columns, n_rows, len(index), index_offset))
+    os.replace(tmp_file, store_file)
+    logger.info("wrote %d rows in %d blocks to %s", n_rows, len(index), store_file)
+
+    return None
+
+
+def is_uniprot_store(file_name):
+    """
+    Check if a file is a UniProt store.
+
+    Parameters
+    ----------
+      file_name: the file to check
+
+    Returns
+    -------
+      True if the file starts with the store magic bytes
+
+    """
+    with open(file_name, "rb") as file_open:
+        return file_open.read(len(STORE_MAGIC)) == STORE_MAGIC
+
+
+def read_store_rows(store_file, keys):
+    """
+    Read the rows of the given UniProt IDs from a UniProt store.
+
+    Only the blocks that can contain the IDs are read and decompressed.
+
+    Parameters
+    ----------
+      store_file: the store file written by `write_store`
+      keys: iterable of UniProt IDs (str or bytes)
+
+    Returns
+    -------
+      the matching tab-separated rows (bytes, sorted by UniProt ID)
+
+    """
+    keys = set(key.encode("utf-8") if isinstance(key, str) else key for key in keys)
+    keys.discard(b"")
+
+    with open(store_file, "rb") as store_file_open:
+        magic, key_width, _, n_rows, n_blocks, index_offset = STORE_HEADER.unpack(
+            store_file_open.read(STORE_HEADER.size))
+        if magic != STORE_MAGIC:
+            raise ValueError("%s is not a UniProt store" % store_file)
+        store_file_open.seek(index_offset)
+        index = np.fromfile(store_file_open, dtype=index_files.index_dtype(key_width), count=n_blocks)
+        if not keys or not n_blocks:
+            return b""
+
+        query = sorted(keys)
+        # truncating longer keys to the index width does not change the block they fall into
+        positions = np.searchsorted(index["key"], np.array(query, dtype="S%d" % key_width), side="right") - 1
+        blocks = {}
+        for key, block in zip(query, positions.tolist()):
+            if block >= 0:
+                blocks.setdefault(block, set()).add(key)
+
+        result = []
+        for block in sorted(blocks):
+            store_file_open.seek(int(index["offset"][block]))
+            data = zlib.decompress(store_file_open.read(int(index["length"][block])))
+            result.extend(row for row in data.splitlines(keepends=True) if row_key(row) in blocks[block])
+
+    logger.info("read %d rows of %d IDs from %d of %d blocks", len(result), len(keys), len(blocks), n_blocks)
+
+    return b"".join(result)
+
+
+# mPies (metaProteomics in environmental sciences) creates annotated databases for metaproteomics analysis.
+# Copyright 2018 Johannes Werner (Leibniz-Institute for Baltic Sea Research)
+# Copyright 2018 Augustin Geron (University of Mons, University of Stirling)
+# Copyright 2018 Sabine Matallana Surget (University of Stirling)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -10,14 +10,12 @@ the respective genera. The taxonomic lineage will be added to the protein header
 import logging
 import os
 import re
-import requests
-import urllib.parse
-import urllib.request
-from ete3 import NCBITaxa
 from mptk import general_functions
 
 logger = logging.getLogger("pies.use_amplicon")
-NCBI = NCBITaxa()
+
+LINEAGE_RANKS = ["superkingdom", "phylum", "class", "order", "family", "genus"]
+OX_REGEX = re.compile(rb"\sOX=(\d+)")
 
 
 def get_taxid(input_file):
@@ -43,7 +41,7 @@ def get_taxid(input_file):
         for line in input_file_open:
             names_list.append(line.rstrip())
 
-    tax_dict = NCBI.get_name_translator(names_list)
+    tax_dict = general_functions.get_ncbi().get_name_translator(names_list)
     for key in tax_dict:
         tax_list.append(tax_dict[key][0])
 
@@ -52,39 +50,104 @@ def get_taxid(input_file):
     return tax_list
 
 
-def add_taxonomy_to_fasta(fasta_file, ncbi_tax_dict):
+def read_fasta_taxids(fasta_file):
+    """
+    Collect the distinct tax IDs (OX=) of the UniProt fasta headers.
+
+    Parameter
+    ---------
+      fasta_file: input fasta file
+
+    Returns
+    -------
+      taxids: set of tax IDs
+
+    """
+    taxids = set()
+    with open(fasta_file, "rb") as fasta_file_open:
+        for line in fasta_file_open:
+            if line.startswith(b">"):
+                rx_match = OX_REGEX.search(line)
+                if rx_match:
+                    taxids.add(int(rx_match.group(1)))
+
+    return taxids
+
+
+def get_lineage_strings(taxids, ncbi_tax_dict, taxonomy=None):
+    """
+    Resolve the lineage string (superkingdom, phylum, class, order, family, genus) of each tax ID.
+
+    With the array-backed taxonomy (`ncbi_taxonomy.load_taxonomy`), all tax IDs are resolved at once. Otherwise,
+    `general_functions.get_desired_ranks` is called once per tax ID.
+
+    Parameters
+    ----------
+      taxids: iterable of tax IDs
+      ncbi_tax_dict: taxonomy dictionary generated by general_functions.create_tax_dict()
+      taxonomy: Taxonomy object (default: None, use NCBITaxa)
+
+    Returns
+    -------
+      lineages: dict with tax IDs as keys and lineage strings as values
+
+    """
+    taxids = sorted(taxids)
+    if taxonomy is not None:
+        rank_lineages = taxonomy.get_rank_matrix(taxids).tolist()
+    else:
+        rank_lineages = []
+        for taxid in taxids:
+            try:
+                ranks2lineage = general_functions.get_desired_ranks(taxid)
+            except ValueError:
+                logger.warning("tax ID %d not found in the taxonomy", taxid)
+                ranks2lineage = general_functions.get_desired_ranks(-1)
+            rank_lineages.append([ranks2lineage[rank] for rank in LINEAGE_RANKS])
+
+    lineages = {}
+    for taxid, rank_lineage in zip(taxids, rank_lineages):
+        lineages[taxid] = ", ".join(str(ncbi_tax_dict[rank_taxid]) for rank_taxid in rank_lineage)
+
+    return lineages
+
+
+def add_taxonomy_to_fasta(fasta_file, ncbi_tax_dict, taxonomy=None, buffer_size=1048576):
     """
     Add taxonomy to headers.
 
     The function adds the complete taxonomic lineage to the fasta header (superkingdom, phylum,
-    class, order, family, genus).
+    class, order, family, genus). The distinct tax IDs (OX=) are collected in a first pass and their lineages are
+    resolved once, the headers are rewritten in a second pass.
 
     Parameter
     ---------
       fasta_file: input fasta file
       ncbi_tax_dict: taxonomy dictionary generated by general_functions.create_tax_dict()
+      taxonomy: Taxonomy object (default: None, use NCBITaxa)
+      buffer_size: size of the write buffer in bytes (default: 1 MiB)
 
     Returns
     -------
       None
 
     """
+    taxids = read_fasta_taxids(fasta_file)
+    logger.info("resolving lineages of %d tax IDs ...", len(taxids))
+    lineages = get_lineage_strings(taxids, ncbi_tax_dict=ncbi_tax_dict, taxonomy=taxonomy)
+    header_extensions = dict((taxid, (" TAX=%s\n" % lineage).encode("utf-8")) for taxid, lineage in lineages.items())
+
     output_filename = os.path.splitext(fasta_file)[0] + "_tax.fasta"
-    with open(fasta_file) as fasta_file_open, open(output_filename, "w") as output_file_open:
+    with open(fasta_file, "rb") as fasta_file_open, \
+            open(output_filename, "wb", buffering=buffer_size) as output_file_open:
         for line in fasta_file_open:
-            if line.startswith(">"):
-                rx_match = re.search(r"OS=(\w+)\s", line)
+            if line.startswith(b">"):
+                rx_match = OX_REGEX.search(line)
                 if rx_match:
-                    taxid = rx_match.group(1)
-
-                    res = []
-                    for rank in ["superkingdom", "phylum", "class", "order", "family", "genus"]:
-                        res.append(str(ncbi_tax_dict[get_desired_ranks(taxid)[rank]]))
-
-                    header_extension = ", ".join(res)
+                    header_extension = header_extensions[int(rx_match.group(1))]
                 else:
-                    header_extension = "not_found"
-                output_file_open.write(line.rstrip() + " TAX=" + header_extension + "\n")
+                    header_extension = b" TAX=not_found\n"
+                output_file_open.write(line.rstrip() + header_extension)
             else:
                 output_file_open.write(line)
 
@@ -92,54 +155,66 @@ def add_taxonomy_to_fasta(fasta_file, ncbi_tax_dict):
 
 
 def get_protein_sequences(tax_list, output_file, ncbi_tax_dict, query=None, reviewed=False,
-                          add_taxonomy=True):
+                          add_taxonomy=True, url=None, connections=4, shard_size=50, taxonomy=None,
+                          cache_dir=None, release=None, max_cache_size=None):
     """
     Fetch the proteomes for all tax IDs.
 
     The function takes a list of tax IDs and downloads the protein sequences for the descending
-    organisms.
+    organisms. The tax IDs are split into queries of `shard_size` tax IDs, which are downloaded concurrently
+    (see `uniprot_download.download_sequences`). With a cache directory, the proteome of each tax ID is cached and only
+    the missing tax IDs are downloaded (see `proteome_cache.get_proteomes`).
 
     Parameters
     ----------
       tax_list: unique list with tax IDs
       output_file: output file for the downloaded protein sequences
-      query: query can be passed from the use_functional_subset module (if None, download entire proteome of taxa of interest)
+      ncbi_tax_dict: taxonomy dictionary generated by general_functions.create_tax_dict() (only for add_taxonomy)
+      query: query or list of queries passed from the use_functional_subset module (if None, download entire
+             proteome of taxa of interest)
       reviewed: use TrEMBL (False) or SwissProt (True)
+      add_taxonomy: add the taxonomic lineage to the fasta headers (default: True)
+      url: URL of the UniProt service (default: None, uniprot_download.UNIPROT_URL)
+      connections: maximum number of concurrent downloads (default: 4)
+      shard_size: maximum number of tax IDs per query (default: 50)
+      taxonomy: Taxonomy object used for the lineages (default: None, use NCBITaxa)
+      cache_dir: proteome cache directory, only used without query (default: None, no cache)
+      release: UniProt release of the cache entries (default: None, ask the UniProt service)
+      max_cache_size: maximum size of the cache in bytes (default: None, no limit)
 
     Returns
     -------
       None
 
     """
+    from mptk import uniprot_download
+
+    if not tax_list and not query:
+        raise ValueError("neither tax IDs nor a query given to download protein sequences")
+
     logger.info("fetching protein sequences ...")
-    filename = output_file
-
-    rev = " reviewed:%s" % reviewed if reviewed else ''
-    if not query:
-        taxon_queries = ['taxonomy:"%s"' % tid for tid in tax_list]
-        taxon_query = ' OR '.join(taxon_queries)
-        query = "%s%s" % (taxon_query, rev)
-
-    url = 'https://legacy.uniprot.org/uniprot/'
-
-    params = {'query': query, 'force': 'yes', 'format': 'fasta'}
-    data = urllib.parse.urlencode(params).encode("utf-8")
-    if not tax_list:
-        logger.info("Taxid: " + str(tax_list))
-    request = urllib.request.Request(url, data)
-    with urllib.request.urlopen(request) as response:
-        msg = response.read()
-    msg = urllib.request.urlretrieve(url=url, filename=filename, data=data)[1]
-    headers = {j[0]: j[1].strip() for j in [i.split(':', 1)
-                                                for i in str(msg).strip().splitlines()]}
-
-    if 'Content-Length' in headers and headers['Content-Length'] == 0:
-        os.remove(filename)
+
+    if not query and cache_dir:
+        from mptk import proteome_cache
+        proteome_cache.get_proteomes(tax_list, output_file=output_file, cache_dir=cache_dir, reviewed=reviewed,
+                                     release=release, max_size=max_cache_size,
+                                     url=url or uniprot_download.UNIPROT_URL, connections=connections)
+    else:
+        rev = " reviewed:%s" % reviewed if reviewed else ''
+        if not query:
+            queries = uniprot_download.split_taxon_queries(tax_list, shard_size=shard_size)
+        elif isinstance(query, str):
+            queries = [query]
+        else:
+            queries = query
+        queries = ["%s%s" % (shard_query, rev) for shard_query in queries]
+        uniprot_download.download_sequences(queries, output_file=output_file,
+                                            url=url or uniprot_download.UNIPROT_URL, connections=connections)
 
     if add_taxonomy:
-        add_taxonomy_to_fasta(filename, ncbi_tax_dict)
+        add_taxonomy_to_fasta(output_file, ncbi_tax_dict, taxonomy=taxonomy)
 
-    return
+    return None
 
 
 # mPies (metaProteomics in environmental sciences) creates annotated databases for metaproteomics analysis.
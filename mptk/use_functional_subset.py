@@ -12,7 +12,47 @@ import toml
 logger = logging.getLogger("pies.use_functional_subset")
 
 
-def search_lists_to_query_url(toml_file, search_prots, search_genes, tax_limits):
+def read_search_lists(toml_file):
+    """
+    Read the taxonomy, protein name and gene name lists of the TOML file.
+
+    Parameters
+    ----------
+      toml_file: the TOML file passed by the user
+
+    Returns
+    -------
+      tax_limits: taxonomy subset
+      search_prots: protein name subset
+      search_genes: exact gene name subset
+
+    """
+    toml_parsed = toml.load(toml_file)
+
+    return toml_parsed["Taxonomy"], toml_parsed["Protein_names"], toml_parsed["Gene_names"]
+
+
+def name_query(search_prots, search_genes):
+    """
+    Return the query part with the protein and gene names.
+
+    Parameters
+    ----------
+      search_prots: protein name subset
+      search_genes: exact gene name subset
+
+    Returns
+    -------
+      the protein and gene name query
+
+    """
+    return ' OR '.join(
+        ['name:"%s"' % n for n in search_prots]
+        + ['gene_exact:"%s"' % g for g in search_genes]
+    )
+
+
+def search_lists_to_query_url(toml_file):
     """
     Return the query to download the sequences of interest from UniProt.
 
@@ -21,9 +61,6 @@ def search_lists_to_query_url(toml_file, search_prots, search_genes, tax_limits)
 
     Parameters
     ----------
-      search_prots: protein name subset
-      search_genes: exact gene name subset
-      tax_limits: taxonomy subset
       toml_file: the TOML file passed by the user
 
     Returns
@@ -31,20 +68,39 @@ def search_lists_to_query_url(toml_file, search_prots, search_genes, tax_limits)
       the query to pass to UniProt
 
     """
-    toml_parsed = toml.load(toml_file)
-    tax_limits = toml_parsed["Taxonomy"]
-    search_prots = toml_parsed["Protein_names"]
-    search_genes = toml_parsed["Gene_names"]
+    tax_limits, search_prots, search_genes = read_search_lists(toml_file)
 
     return '( {taxlimit} ) AND ( {protquery} )'.format(
-        taxlimit=' OR '.join([ 'taxonomy:"%s"' % t for t in tax_limits ]),
-        protquery=' OR '.join(
-           [ 'name:"%s"' % n for n in search_prots ]
-           + [ 'gene_exact:"%s"' % g for g in search_genes ]
-        ),
+        taxlimit=' OR '.join(['taxonomy:"%s"' % t for t in tax_limits]),
+        protquery=name_query(search_prots, search_genes),
       )
 
 
+def search_lists_to_queries(toml_file, shard_size=50):
+    """
+    Return the queries to download the sequences of interest from UniProt, with at most `shard_size` taxa each.
+
+    The queries can be downloaded concurrently and together return the same sequences as the query of
+    `search_lists_to_query_url`.
+
+    Parameters
+    ----------
+      toml_file: the TOML file passed by the user
+      shard_size: maximum number of taxa per query (default: 50)
+
+    Returns
+    -------
+      list of queries to pass to UniProt
+
+    """
+    from mptk import uniprot_download
+
+    tax_limits, search_prots, search_genes = read_search_lists(toml_file)
+
+    return uniprot_download.split_taxon_queries(tax_limits, shard_size=shard_size,
+                                                query=name_query(search_prots, search_genes))
+
+
 # mPies (metaProteomics in environmental sciences) creates annotated databases for metaproteomics analysis.
 # Copyright 2018 Johannes Werner (Leibniz-Institute for Baltic Sea Research)
 # Copyright 2018 Augustin Geron (University of Mons, University of Stirling)
@@ -0,0 +1,52 @@
+annotated_tables = []
+annotation_labels = []
+if config["taxonomy"]["run_taxonomy"]:
+    annotated_tables.append("{sample}/annotated/{identified_id}/taxonomy/metaproteome.parsed_table.tsv")
+    annotation_labels.append("taxonomy")
+if config["functions"]["run_functions_cog"]:
+    annotated_tables.append("{sample}/annotated/{identified_id}/functions/metaproteome.functions.cog.parsed_table.tsv")
+    annotation_labels.append("cog")
+if config["functions"]["run_functions_uniprot"]:
+    annotated_tables.append("{sample}/annotated/{identified_id}/functions/metaproteome.functions.uniprot.parsed_table.tsv")
+    annotation_labels.append("uniprot")
+
+rule export_table_combined:
+    input:
+        excel_file="{sample}/identified/{identified_id}.xlsx",
+        annotated_tables=annotated_tables,
+        **header_files
+    output:
+        "{sample}/annotated/{identified_id}/metaproteome.annotated.tsv"
+    params:
+        mode=config["export_tables"]["mode"],
+        labels=" ".join(annotation_labels),
+        headers=header_options
+    log:
+        "{sample}/log/mptk_exporttables_combined_{identified_id}.log"
+    shell:
+        "./main.py -v -z {log} {params.mode} -e {input.excel_file} -t {input.annotated_tables} -l {params.labels} {params.headers} -o {output}"
+
+rule get_export_tables_done:
+    input:
+        expand("{sample}/annotated/{identified_id}/metaproteome.annotated.tsv", sample=config["sample"], identified_id=identified_ids)
+    output:
+        touch("checkpoints/export_tables.done")
+
+
+# mPies (metaProteomics in environmental sciences) creates annotated databases for metaproteomics analysis.
+# Copyright 2018 Johannes Werner (Leibniz-Institute for Baltic Sea Research)
+# Copyright 2018 Augustin Geron (University of Mons, University of Stirling)
+# Copyright 2018 Sabine Matallana Surget (University of Stirling)
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
@@ -4,11 +4,13 @@ rule obtain_functional_subset:
     output:
         expand("{sample}/proteome/functional_subset.faa", sample=config["sample"])
     params:
-        mode=config["functional_subset"]["mode"]
+        mode=config["functional_subset"]["mode"],
+        connections=config["functional_subset"]["connections"],
+        shard_size=config["functional_subset"]["shard_size"]
     log:
         expand("{sample}/log/mptk_functionalsubset.log", sample=config["sample"])
     shell:
-        "./main.py -v -z {log} {params.mode} -t {input} -p {output}"
+        "./main.py -v -z {log} {params.mode} -t {input} -p {output} -c {params.connections} -s {params.shard_size}"
 
 rule get_functional_subset_done:
     input:
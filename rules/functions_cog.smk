@@ -22,49 +22,78 @@ rule run_diamond_cog:
           -q {input} -o {output} > {log} 2>&1
         """
 
-rule create_protein_groups_cog:
-    input:
-        "{sample}/annotated/{identified_id}/functions/metaproteome.cog.diamond.tsv",
-        "{sample}/identified/{identified_id}.xlsx"
-    output:
-        temp("{sample}/annotated/{identified_id}/functions/metaproteome.cog.protein_groups.tsv")
-    params:
-        mode=config["functions"]["protein_groups"]["mode"]
-    log:
-        "{sample}/log/mptk_proteingroups_cog_{identified_id}.log"
-    shell:
-        "./main.py -v -z {log} {params.mode} -d {input[0]} -e {input[1]} -p {output}"
+if config["functions"]["annotate"]["in_process"]:
+    rule annotate_cog:
+        input:
+            diamond_file="{sample}/annotated/{identified_id}/functions/metaproteome.cog.diamond.tsv",
+            excel_file="{sample}/identified/{identified_id}.xlsx",
+            **header_files
+        output:
+            export_table="{sample}/annotated/{identified_id}/functions/metaproteome.functions.cog.tsv",
+            annotated_table=temp("{sample}/annotated/{identified_id}/functions/metaproteome.functions.cog.parsed_table.tsv")
+        params:
+            mode=config["functions"]["annotate"]["mode"],
+            headers=header_options,
+            cog_tables=config["functions"]["run_cog"]["cog_table"],
+            cog_names=config["functions"]["run_cog"]["cog_names"],
+            cog_functions=config["functions"]["run_cog"]["cog_functions"],
+            cog_index="-i " + config["functions"]["run_cog"]["cog_index"] if config["functions"]["run_cog"]["cog_index"] else ""
+        log:
+            "{sample}/log/mptk_annotate_cog_{identified_id}.log"
+        shell:
+            """
+            ./main.py -v -z {log} {params.mode} -d {input.diamond_file} -e {input.excel_file} -b cog \
+              -t {params.cog_tables} -n {params.cog_names} -f {params.cog_functions} {params.cog_index} \
+              {params.headers} -a {output.annotated_table} -o {output.export_table}
+            """
 
-rule parse_functions_cog:
-    input:
-        "{sample}/annotated/{identified_id}/functions/metaproteome.cog.protein_groups.tsv"
-    output:
-        temp("{sample}/annotated/{identified_id}/functions/metaproteome.functions.cog.parsed_table.tsv")
-    params:
-        mode=config["functions"]["run_cog"]["parse_functions_cog"]["mode"],
-        cog_tables=config["functions"]["run_cog"]["cog_table"],
-        cog_names=config["functions"]["run_cog"]["cog_names"],
-        cog_functions=config["functions"]["run_cog"]["cog_functions"]
-    log:
-        "{sample}/log/mptk_functions_cog_{identified_id}.log"
-    shell:
-        """
-        ./main.py -v -z {log} {params.mode} -d {input} -t {params.cog_tables} -n {params.cog_names} -f {params.cog_functions} \
-          -e {output}
-        """
+else:
+    rule create_protein_groups_cog:
+        input:
+            "{sample}/annotated/{identified_id}/functions/metaproteome.cog.diamond.tsv",
+            "{sample}/identified/{identified_id}.xlsx"
+        output:
+            temp("{sample}/annotated/{identified_id}/functions/metaproteome.cog.protein_groups.tsv")
+        params:
+            mode=config["functions"]["protein_groups"]["mode"]
+        log:
+            "{sample}/log/mptk_proteingroups_cog_{identified_id}.log"
+        shell:
+            "./main.py -v -z {log} {params.mode} -d {input[0]} -e {input[1]} -p {output}"
 
-rule export_table_functions_cog:
-    input:
-        "{sample}/identified/{identified_id}.xlsx",
-        "{sample}/annotated/{identified_id}/functions/metaproteome.functions.cog.parsed_table.tsv"
-    output:
-        "{sample}/annotated/{identified_id}/functions/metaproteome.functions.cog.tsv"
-    params:
-        mode=config["export_tables"]["mode"]
-    log:
-        "{sample}/log/mptk_exporttables_cog_{identified_id}.log"
-    shell:
-        "./main.py -v -z {log} {params.mode} -e {input[0]} -t {input[1]} -o {output}"
+    rule parse_functions_cog:
+        input:
+            "{sample}/annotated/{identified_id}/functions/metaproteome.cog.protein_groups.tsv"
+        output:
+            temp("{sample}/annotated/{identified_id}/functions/metaproteome.functions.cog.parsed_table.tsv")
+        params:
+            mode=config["functions"]["run_cog"]["parse_functions_cog"]["mode"],
+            cog_tables=config["functions"]["run_cog"]["cog_table"],
+            cog_names=config["functions"]["run_cog"]["cog_names"],
+            cog_functions=config["functions"]["run_cog"]["cog_functions"],
+            cog_index="-i " + config["functions"]["run_cog"]["cog_index"] if config["functions"]["run_cog"]["cog_index"] else ""
+        log:
+            "{sample}/log/mptk_functions_cog_{identified_id}.log"
+        shell:
+            """
+            ./main.py -v -z {log} {params.mode} -d {input} -t {params.cog_tables} -n {params.cog_names} -f {params.cog_functions} \
+              {params.cog_index} -e {output}
+            """
+
+    rule export_table_functions_cog:
+        input:
+            "{sample}/identified/{identified_id}.xlsx",
+            "{sample}/annotated/{identified_id}/functions/metaproteome.functions.cog.parsed_table.tsv",
+            **header_files
+        output:
+            "{sample}/annotated/{identified_id}/functions/metaproteome.functions.cog.tsv"
+        params:
+            mode=config["export_tables"]["mode"],
+            headers=header_options
+        log:
+            "{sample}/log/mptk_exporttables_cog_{identified_id}.log"
+        shell:
+            "./main.py -v -z {log} {params.mode} -e {input[0]} -t {input[1]} {params.headers} -o {output}"
 
 rule get_functions_cog_done:
     input:
@@ -22,45 +22,80 @@ rule run_diamond_uniprot:
           -q {input} -o {output} > {log} 2>&1
         """
 
-rule create_protein_groups_uniprot:
-    input:
-        "{sample}/annotated/{identified_id}/functions/metaproteome.uniprot.diamond.tsv",
-        "{sample}/identified/{identified_id}.xlsx"
-    output:
-        "{sample}/annotated/{identified_id}/functions/metaproteome.uniprot.protein_groups.tsv"
-    params:
-        mode=config["functions"]["protein_groups"]["mode"]
-    log:
-        "{sample}/log/mptk_proteingroups_uniprot_{identified_id}.log"
-    shell:
-        "./main.py -v -z {log} {params.mode} -d {input[0]} -e {input[1]} -p {output}"
+if config["functions"]["annotate"]["in_process"]:
+    rule annotate_uniprot:
+        input:
+            diamond_file="{sample}/annotated/{identified_id}/functions/metaproteome.uniprot.diamond.tsv",
+            excel_file="{sample}/identified/{identified_id}.xlsx",
+            **header_files
+        output:
+            export_table="{sample}/annotated/{identified_id}/functions/metaproteome.functions.uniprot.tsv",
+            annotated_table="{sample}/annotated/{identified_id}/functions/metaproteome.functions.uniprot.parsed_table.tsv"
+        params:
+            mode=config["functions"]["annotate"]["mode"],
+            headers=header_options,
+            uniprot_table=config["functions"]["run_uniprot"]["uniprot_table"],
+            go_annotation=config["functions"]["run_uniprot"]["parse_functions_uniprot"]["go_annotation"],
+            go_closure="-c " + config["functions"]["run_uniprot"]["go_closure"] if config["functions"]["run_uniprot"]["go_closure"] else "",
+            go_slim="-m " + config["functions"]["run_uniprot"]["go_slim"] if config["functions"]["run_uniprot"]["go_slim"] else "",
+            go_depth="-p " + str(config["functions"]["run_uniprot"]["go_depth"]) if config["functions"]["run_uniprot"]["go_depth"] not in ("", None) else ""
+        log:
+            "{sample}/log/mptk_annotate_uniprot_{identified_id}.log"
+        shell:
+            """
+            ./main.py -v -z {log} {params.mode} -d {input.diamond_file} -e {input.excel_file} -b uniprot \
+              -u {params.uniprot_table} {params.go_annotation} {params.go_closure} {params.go_slim} {params.go_depth} \
+              {params.headers} -a {output.annotated_table} -o {output.export_table}
+            """
 
-rule parse_functions_uniprot:
-    input:
-        "{sample}/annotated/{identified_id}/functions/metaproteome.uniprot.protein_groups.tsv"
-    output:
-        "{sample}/annotated/{identified_id}/functions/metaproteome.functions.uniprot.parsed_table.tsv"
-    params:
-        mode=config["functions"]["run_uniprot"]["parse_functions_uniprot"]["mode"],
-        uniprot_table=config["functions"]["run_uniprot"]["uniprot_table"],
-        go_annotation=config["functions"]["run_uniprot"]["parse_functions_uniprot"]["go_annotation"]
-    log:
-        "{sample}/log/mptk_parsefunctions_uniprot_{identified_id}.log"
-    shell:
-        "./main.py -v -z {log} {params.mode} -d {input} -t {params.uniprot_table} -e {output} {params.go_annotation}"
+else:
+    rule create_protein_groups_uniprot:
+        input:
+            "{sample}/annotated/{identified_id}/functions/metaproteome.uniprot.diamond.tsv",
+            "{sample}/identified/{identified_id}.xlsx"
+        output:
+            "{sample}/annotated/{identified_id}/functions/metaproteome.uniprot.protein_groups.tsv"
+        params:
+            mode=config["functions"]["protein_groups"]["mode"]
+        log:
+            "{sample}/log/mptk_proteingroups_uniprot_{identified_id}.log"
+        shell:
+            "./main.py -v -z {log} {params.mode} -d {input[0]} -e {input[1]} -p {output}"
 
-rule export_table_functions_uniprot:
-    input:
-        "{sample}/identified/{identified_id}.xlsx",
-        "{sample}/annotated/{identified_id}/functions/metaproteome.functions.uniprot.parsed_table.tsv"
-    output:
-        "{sample}/annotated/{identified_id}/functions/metaproteome.functions.uniprot.tsv"
-    params:
-        mode=config["export_tables"]["mode"]
-    log:
-        "{sample}/log/mptk_exporttables_uniprot_{identified_id}.log"
-    shell:
-        "./main.py -v -z {log} {params.mode} -e {input[0]} -t {input[1]} -o {output}"
+    rule parse_functions_uniprot:
+        input:
+            "{sample}/annotated/{identified_id}/functions/metaproteome.uniprot.protein_groups.tsv"
+        output:
+            "{sample}/annotated/{identified_id}/functions/metaproteome.functions.uniprot.parsed_table.tsv"
+        params:
+            mode=config["functions"]["run_uniprot"]["parse_functions_uniprot"]["mode"],
+            uniprot_table=config["functions"]["run_uniprot"]["uniprot_table"],
+            go_annotation=config["functions"]["run_uniprot"]["parse_functions_uniprot"]["go_annotation"],
+            go_closure="-c " + config["functions"]["run_uniprot"]["go_closure"] if config["functions"]["run_uniprot"]["go_closure"] else "",
+            go_slim="-m " + config["functions"]["run_uniprot"]["go_slim"] if config["functions"]["run_uniprot"]["go_slim"] else "",
+            go_depth="-p " + str(config["functions"]["run_uniprot"]["go_depth"]) if config["functions"]["run_uniprot"]["go_depth"] not in ("", None) else ""
+        log:
+            "{sample}/log/mptk_parsefunctions_uniprot_{identified_id}.log"
+        shell:
+            """
+            ./main.py -v -z {log} {params.mode} -d {input} -t {params.uniprot_table} -e {output} {params.go_annotation} \
+              {params.go_closure} {params.go_slim} {params.go_depth}
+            """
+
+    rule export_table_functions_uniprot:
+        input:
+            "{sample}/identified/{identified_id}.xlsx",
+            "{sample}/annotated/{identified_id}/functions/metaproteome.functions.uniprot.parsed_table.tsv",
+            **header_files
+        output:
+            "{sample}/annotated/{identified_id}/functions/metaproteome.functions.uniprot.tsv"
+        params:
+            mode=config["export_tables"]["mode"],
+            headers=header_options
+        log:
+            "{sample}/log/mptk_exporttables_uniprot_{identified_id}.log"
+        shell:
+            "./main.py -v -z {log} {params.mode} -e {input[0]} -t {input[1]} {params.headers} -o {output}"
 
 rule get_functions_uniprot:
     input:
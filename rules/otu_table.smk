@@ -1,3 +1,9 @@
+proteome_cache_options = []
+if config["otu_table"]["obtain_proteome"]["cache_dir"] not in (None, ""):
+    proteome_cache_options.append("-d " + config["otu_table"]["obtain_proteome"]["cache_dir"])
+if config["otu_table"]["obtain_proteome"]["cache_limit"] not in (None, ""):
+    proteome_cache_options.append("-l " + str(config["otu_table"]["obtain_proteome"]["cache_limit"]))
+
 # if config["otu_table"]["run_singlem"]:
 #     rule generate_otu_table:
 #         input:
@@ -51,11 +57,15 @@ if True:
         output:
             expand("{sample}/proteome/amplicon.faa", sample=config["sample"])
         params:
-            mode=config["otu_table"]["obtain_proteome"]["mode"]
+            mode=config["otu_table"]["obtain_proteome"]["mode"],
+            connections=config["otu_table"]["obtain_proteome"]["connections"],
+            shard_size=config["otu_table"]["obtain_proteome"]["shard_size"],
+            cache=" ".join(proteome_cache_options)
         log:
             expand("{sample}/log/mptk_otu_getproteome.log", sample=config["sample"])
         shell:
-            "./main.py -v -z {log} {params.mode} -g {input} -p {output}"
+            "./main.py -v -z {log} {params.mode} -g {input} -p {output} -c {params.connections} "
+            "-s {params.shard_size} {params.cache}"
 
 rule get_amplicon_proteome_done:
     input:
@@ -1,54 +1,90 @@
-rule combine_proteomes:
-    input:
-        # expand("{sample}/proteome/functional_subset.faa", sample=config["sample"]),
-        expand("{sample}/proteome/amplicon.faa", sample=config["sample"]),
-        # expand("{sample}/proteome/assembled.faa", sample=config["sample"]),
-        # expand("{sample}/proteome/unassembled.faa", sample=config["sample"])
-    output:
-        expand("{sample}/proteome/metaproteome.faa", sample=config["sample"])
-    shell:
-        "cat {input} > {output}"
+if config["postprocessing"]["fused"]:
+    rule postprocess_proteome:
+        input:
+            # expand("{sample}/proteome/functional_subset.faa", sample=config["sample"]),
+            expand("{sample}/proteome/amplicon.faa", sample=config["sample"]),
+            # expand("{sample}/proteome/assembled.faa", sample=config["sample"]),
+            # expand("{sample}/proteome/unassembled.faa", sample=config["sample"])
+        output:
+            expand("{sample}/proteome/metaproteome.hashed.faa", sample=config["sample"]),
+            expand("{sample}/proteome/metaproteome.hashed.tsv", sample=config["sample"]),
+            expand("{sample}/proteome/metaproteome.hashed.faa.idx", sample=config["sample"]),
+            expand("{sample}/proteome/metaproteome.hashed.tsv.idx", sample=config["sample"])
+        params:
+            mode=config["postprocessing"]["fused_mode"],
+            min_length=config["postprocessing"]["remove_short_sequences"]["min_length"],
+            hash_type=config["postprocessing"]["hash_headers"]["hash_type"],
+            hash_mode=config["postprocessing"]["hash_headers"]["hash_mode"]
+        log:
+            expand("{sample}/log/mptk_postprocessing.log", sample=config["sample"])
+        shell:
+            """
+            ./main.py -v -z {log} {params.mode} -p {input} -l {params.min_length} -s {output[0]} -t {output[1]} \
+              -x {params.hash_type} -m {params.hash_mode} -i {output[2]} -r {output[3]}
+            """
 
-rule remove_short_sequences:
-    input:
-        expand("{sample}/proteome/metaproteome.faa", sample=config["sample"])
-    output:
-        temp(expand("{sample}/proteome/metaproteome.mincutoff.faa", sample=config["sample"]))
-    params:
-        min_length=config["postprocessing"]["remove_short_sequences"]["min_length"]
-    shell:
-        "perl helper_scripts/remove_short_sequences.pl {params.min_length} {input} > {output}"
+else:
+    rule combine_proteomes:
+        input:
+            # expand("{sample}/proteome/functional_subset.faa", sample=config["sample"]),
+            expand("{sample}/proteome/amplicon.faa", sample=config["sample"]),
+            # expand("{sample}/proteome/assembled.faa", sample=config["sample"]),
+            # expand("{sample}/proteome/unassembled.faa", sample=config["sample"])
+        output:
+            expand("{sample}/proteome/metaproteome.faa", sample=config["sample"])
+        shell:
+            "cat {input} > {output}"
 
-rule remove_duplicates:
-    input:
-        expand("{sample}/proteome/metaproteome.mincutoff.faa", sample=config["sample"])
-    output:
-        expand("{sample}/proteome/metaproteome.mincutoff.nodup.faa", sample=config["sample"]),
-        temp(expand("{sample}/proteome/metaproteome.mincutoff.nodup.faa.clstr", sample=config["sample"])),
-        temp(expand("{sample}/proteome/metaproteome.mincutoff.nodup.faa2.clstr", sample=config["sample"]))
-    log:
-        expand("{sample}/log/{sample}_cdhit.log", sample=config["sample"])
-    shell:
-        "cd-hit-dup -i {input} -o {output[0]} > {log} 2>&1"
+    rule remove_short_sequences:
+        input:
+            expand("{sample}/proteome/metaproteome.faa", sample=config["sample"])
+        output:
+            temp(expand("{sample}/proteome/metaproteome.mincutoff.faa", sample=config["sample"]))
+        params:
+            min_length=config["postprocessing"]["remove_short_sequences"]["min_length"]
+        shell:
+            "perl helper_scripts/remove_short_sequences.pl {params.min_length} {input} > {output}"
 
-rule hash_headers:
-    input:
-        expand("{sample}/proteome/metaproteome.mincutoff.nodup.faa", sample=config["sample"])
-    output:
-        expand("{sample}/proteome/metaproteome.hashed.faa", sample=config["sample"]),
-        expand("{sample}/proteome/metaproteome.hashed.tsv", sample=config["sample"])
-    params:
-        mode=config["postprocessing"]["hash_headers"]["mode"],
-        hash_type=config["postprocessing"]["hash_headers"]["hash_type"]
-    log:
-        expand("{sample}/log/mptk_hashheaders.log", sample=config["sample"])
-    shell:
-        "./main.py -v -z {log} {params.mode} -p {input} -s {output[0]} -t {output[1]} -x {params.hash_type}"
+    rule remove_duplicates:
+        input:
+            expand("{sample}/proteome/metaproteome.mincutoff.faa", sample=config["sample"])
+        output:
+            expand("{sample}/proteome/metaproteome.mincutoff.nodup.faa", sample=config["sample"]),
+            temp(expand("{sample}/proteome/metaproteome.mincutoff.nodup.faa.clstr", sample=config["sample"])),
+            temp(expand("{sample}/proteome/metaproteome.mincutoff.nodup.faa2.clstr", sample=config["sample"]))
+        log:
+            expand("{sample}/log/{sample}_cdhit.log", sample=config["sample"])
+        shell:
+            "cd-hit-dup -i {input} -o {output[0]} > {log} 2>&1"
+
+    rule hash_headers:
+        input:
+            expand("{sample}/proteome/metaproteome.mincutoff.nodup.faa", sample=config["sample"])
+        output:
+            expand("{sample}/proteome/metaproteome.hashed.faa", sample=config["sample"]),
+            expand("{sample}/proteome/metaproteome.hashed.tsv", sample=config["sample"]),
+            expand("{sample}/proteome/metaproteome.hashed.faa.idx", sample=config["sample"]),
+            expand("{sample}/proteome/metaproteome.hashed.tsv.idx", sample=config["sample"])
+        params:
+            mode=config["postprocessing"]["hash_headers"]["mode"],
+            hash_type=config["postprocessing"]["hash_headers"]["hash_type"],
+            hash_mode=config["postprocessing"]["hash_headers"]["hash_mode"]
+        log:
+            expand("{sample}/log/mptk_hashheaders.log", sample=config["sample"])
+        threads:
+            config["ressources"]["threads"]
+        shell:
+            """
+            ./main.py -v -z {log} {params.mode} -p {input} -s {output[0]} -t {output[1]} -x {params.hash_type} \
+              -m {params.hash_mode} -n {threads} -i {output[2]} -r {output[3]}
+            """
 
 rule postprocessing_done:
     input:
         expand("{sample}/proteome/metaproteome.hashed.faa", sample=config["sample"]),
-        expand("{sample}/proteome/metaproteome.hashed.tsv", sample=config["sample"])
+        expand("{sample}/proteome/metaproteome.hashed.tsv", sample=config["sample"]),
+        expand("{sample}/proteome/metaproteome.hashed.faa.idx", sample=config["sample"]),
+        expand("{sample}/proteome/metaproteome.hashed.tsv.idx", sample=config["sample"])
     output:
         touch("checkpoints/postprocessing.done")
 
@@ -1,18 +1,38 @@
-rule subset_sequences:
-    input:
-        #config["excel_file"],
-        "{sample}/identified/{identified_id}.xlsx",
-        "{sample}/proteome/metaproteome.hashed.faa"
-    output:
-        "{sample}/annotated/{identified_id}/proteome/metaproteome.subset.faa"
-    params:
-        mode=config["subset_sequences"]["mode"]
-    log:
-        "{sample}/log/mptk_subsetsequences_{identified_id}.log"
-    shell:
-        """
-        ./main.py -v -z {log} {params.mode} -e {input[0]} -d {input[1]} -s {output}
-        """
+if config["subset_sequences"]["batch"]:
+    rule subset_sequences_batch:
+        input:
+            excel_files=expand("{{sample}}/identified/{identified_id}.xlsx", identified_id=identified_ids),
+            database="{sample}/proteome/metaproteome.hashed.faa",
+            index="{sample}/proteome/metaproteome.hashed.faa.idx"
+        output:
+            expand("{{sample}}/annotated/{identified_id}/proteome/metaproteome.subset.faa", identified_id=identified_ids)
+        params:
+            mode=config["subset_sequences"]["batch_mode"]
+        log:
+            "{sample}/log/mptk_subsetsequences_batch.log"
+        shell:
+            """
+            ./main.py -v -z {log} {params.mode} -e {input.excel_files} -d {input.database} -i {input.index} \
+              -s {output}
+            """
+
+else:
+    rule subset_sequences:
+        input:
+            #config["excel_file"],
+            "{sample}/identified/{identified_id}.xlsx",
+            "{sample}/proteome/metaproteome.hashed.faa",
+            "{sample}/proteome/metaproteome.hashed.faa.idx"
+        output:
+            "{sample}/annotated/{identified_id}/proteome/metaproteome.subset.faa"
+        params:
+            mode=config["subset_sequences"]["mode"]
+        log:
+            "{sample}/log/mptk_subsetsequences_{identified_id}.log"
+        shell:
+            """
+            ./main.py -v -z {log} {params.mode} -e {input[0]} -d {input[1]} -i {input[2]} -s {output}
+            """
 
 rule subset_sequences_done:
     input:
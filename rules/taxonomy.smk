@@ -35,48 +35,84 @@ rule create_protein_groups_taxonomy:
     shell:
         "./main.py -v -z {log} {params.mode} -d {input[0]} -e {input[1]} -p {output}"
 
-rule run_blast2lca:
-    input:
-        "{sample}/annotated/{identified_id}/taxonomy/metaproteome.tax.protein_groups.tsv"
-    output:
-        "{sample}/annotated/{identified_id}/taxonomy/metaproteome.megan.tsv"
-    params:
-        blast2lca_bin=config["taxonomy"]["run_blast2lca"]["binary"],
-        input_format=config["taxonomy"]["run_blast2lca"]["input_format"],
-        blast_mode=config["taxonomy"]["run_blast2lca"]["blast_mode"],
-        acc2tax_file=config["taxonomy"]["run_blast2lca"]["acc2tax_file"]
-    log:
-        "{sample}/log/blast2lca_{sample}_{identified_id}.log"
-    shell:
-        """
-        {params.blast2lca_bin} -i {input} -f {params.input_format} -m {params.blast_mode} -o {output} \
-          -a2t {params.acc2tax_file} > {log} 2>&1
-        """
+if config["taxonomy"]["lca"]["in_process"]:
+    rule prepare_acc2taxid:
+        input:
+            config["taxonomy"]["lca"]["acc2taxid_file"]
+        output:
+            config["taxonomy"]["lca"]["acc2taxid_index"]
+        params:
+            mode=config["taxonomy"]["lca"]["prepare_mode"]
+        log:
+            "log/mptk_prepare_acc2taxid.log"
+        shell:
+            "./main.py -v -z {log} {params.mode} -a {input} -i {output}"
 
-rule parse_taxonomy:
-    input:
-        "{sample}/annotated/{identified_id}/taxonomy/metaproteome.megan.tsv"
-    output:
-        "{sample}/annotated/{identified_id}/taxonomy/metaproteome.parsed_table.tsv"
-    params:
-        mode=config["taxonomy"]["parse_taxonomy"]["mode"]
-    log:
-        "{sample}/log/mptk_parse_taxonomy_{identified_id}.log"
-    shell:
-        "./main.py -v -z {log} {params.mode} -m {input} -t {output}"
+    rule taxonomy_lca:
+        input:
+            protein_groups="{sample}/annotated/{identified_id}/taxonomy/metaproteome.tax.protein_groups.tsv",
+            acc2taxid_index=config["taxonomy"]["lca"]["acc2taxid_index"]
+        output:
+            "{sample}/annotated/{identified_id}/taxonomy/metaproteome.parsed_table.tsv"
+        params:
+            mode=config["taxonomy"]["lca"]["mode"],
+            top_percent=config["taxonomy"]["lca"]["top_percent"]
+        log:
+            "{sample}/log/mptk_taxonomy_lca_{identified_id}.log"
+        threads:
+            config["ressources"]["threads"]
+        shell:
+            """
+            ./main.py -v -z {log} {params.mode} -d {input.protein_groups} -a {input.acc2taxid_index} \
+              -p {params.top_percent} -n {threads} -t {output}
+            """
+
+else:
+    rule run_blast2lca:
+        input:
+            "{sample}/annotated/{identified_id}/taxonomy/metaproteome.tax.protein_groups.tsv"
+        output:
+            "{sample}/annotated/{identified_id}/taxonomy/metaproteome.megan.tsv"
+        params:
+            blast2lca_bin=config["taxonomy"]["run_blast2lca"]["binary"],
+            input_format=config["taxonomy"]["run_blast2lca"]["input_format"],
+            blast_mode=config["taxonomy"]["run_blast2lca"]["blast_mode"],
+            acc2tax_file=config["taxonomy"]["run_blast2lca"]["acc2tax_file"]
+        log:
+            "{sample}/log/blast2lca_{sample}_{identified_id}.log"
+        shell:
+            """
+            {params.blast2lca_bin} -i {input} -f {params.input_format} -m {params.blast_mode} -o {output} \
+              -a2t {params.acc2tax_file} > {log} 2>&1
+            """
+
+    rule parse_taxonomy:
+        input:
+            "{sample}/annotated/{identified_id}/taxonomy/metaproteome.megan.tsv"
+        output:
+            "{sample}/annotated/{identified_id}/taxonomy/metaproteome.parsed_table.tsv"
+        params:
+            mode=config["taxonomy"]["parse_taxonomy"]["mode"],
+            score_cutoff=config["taxonomy"]["parse_taxonomy"]["score_cutoff"]
+        log:
+            "{sample}/log/mptk_parse_taxonomy_{identified_id}.log"
+        shell:
+            "./main.py -v -z {log} {params.mode} -m {input} -t {output} -c {params.score_cutoff}"
 
 rule export_table_taxonomy:
     input:
         "{sample}/identified/{identified_id}.xlsx",
-        "{sample}/annotated/{identified_id}/taxonomy/metaproteome.parsed_table.tsv"
+        "{sample}/annotated/{identified_id}/taxonomy/metaproteome.parsed_table.tsv",
+        **header_files
     output:
         "{sample}/annotated/{identified_id}/taxonomy/metaproteome.tax.tsv"
     params:
-        mode=config["export_tables"]["mode"]
+        mode=config["export_tables"]["mode"],
+        headers=header_options
     log:
         "{sample}/log/mptk_exporttable_taxonomy_{identified_id}.log"
     shell:
-        "./main.py -v -z {log} {params.mode} -e {input[0]} -t {input[1]} -o {output}"
+        "./main.py -v -z {log} {params.mode} -e {input[0]} -t {input[1]} {params.headers} -o {output}"
 
 rule get_taxonomy_done:
     input: